@@ -1,11 +1,17 @@
 #!/usr/bin/env bash
 # avg_tables.sh — 15m-<pct>pct-r{1,2,3}-2-results.json から4指標の平均を出力
 # 使い方: リポジトリ直下で `bash avg_tables.sh`
+# 結果ストア（eval/store, features/results_store.py）があればそちらを引く。
+# ストアに無い (label, レプリケート, モデル) は eval/*-results.json から先に取り込む（ストアの行は上書きしない）
 
 set -euo pipefail
 
 EVAL_DIR="eval"
 
+if [[ -d "${EVAL_DIR}/store" && "${AVG_FROM_JSON:-0}" != "1" ]]; then
+  exec python3 "$(dirname "$0")/results_store.py" --store-dir "${EVAL_DIR}/store" table --json-dir "${EVAL_DIR}"
+fi
+
 # 出力順（表示名 → 内部モデル名）
 declare -A CODE=(
   ["Decision Tree"]="dt_35"
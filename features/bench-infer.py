@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# features/bench-infer.py
+# models/ の各モデルの推論コストを測るベンチマーク（精度は eval/ の結果 JSON と突き合わせる前提）。
+#   - (モデル, スレッド数) ごとに spawn した新しいワーカプロセスで測る
+#       ロード時間 / ロード前後の RSS（VmRSS）/ ワーカのピーク RSS
+#       バッチサイズごとのバッチ単位レイテンシ（p50 / p99 / mean / max）とフレーム/秒
+#   - 入力は merged の test split（--label, X.npy を mmap）か、合成した窓（--synthetic 行数）
+#   - keras モデルは <model>.npz（NumPy LSTM）があればそれを、--keras-backend tf なら TensorFlow を測る
+# 例:
+#   python features/bench-infer.py --label 15m-30pct-r1-2 --batch-sizes 1,64,1024 --threads 1,4
+#   python features/bench-infer.py --synthetic 20000 --models dt_35,mlp_10
+# 出力: eval/bench-infer-<label|synthetic>.json
+from pathlib import Path
+import argparse, json, os, platform, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from proc_mem import rss_mb, peak_rss_mb
+from eval_common import MODELS, DATA_ROOT, now_jst_str, build_data_path, load_predictor, synthetic_windows, SYNTHETIC_VOCAB
+
+DEFAULT_BATCH_SIZES = "1,16,256,4096"
+
+def parse_ints(spec: str):
+    return [int(t) for t in spec.split(",") if t.strip()]
+
+# ---------------------------
+# ワーカ
+# ---------------------------
+
+def time_batches(predict, X, batch_size: int, warmup: int, min_batches: int, max_batches: int, seconds: float):
+    """X を先頭から batch_size ごとに巡回して推論し、1 バッチごとの所要時間を測る"""
+    N = X.shape[0]
+    starts = np.arange(0, N, batch_size)
+    starts = starts[starts + batch_size <= N] if N >= batch_size else np.zeros(1, dtype=np.int64)
+    for s in starts[:warmup].tolist():
+        predict(X[s:s + batch_size])
+    lat, frames = [], 0
+    t_end = time.perf_counter() + seconds
+    i = 0
+    while len(lat) < max_batches and (len(lat) < min_batches or time.perf_counter() < t_end):
+        s = int(starts[i % starts.size]); i += 1
+        xb = X[s:s + batch_size]
+        t0 = time.perf_counter_ns()
+        predict(xb)
+        lat.append(time.perf_counter_ns() - t0)
+        frames += xb.shape[0]
+    lat = np.asarray(lat, dtype=np.float64) / 1e6  # ms
+    return {
+        "batch_size": int(min(batch_size, N)), "n_batches": int(lat.size), "frames": int(frames),
+        "frames_per_sec": round(frames / (lat.sum() / 1e3), 1) if lat.sum() > 0 else None,
+        "latency_ms": {"p50": round(float(np.percentile(lat, 50)), 4), "p99": round(float(np.percentile(lat, 99)), 4),
+                       "mean": round(float(lat.mean()), 4), "max": round(float(lat.max()), 4)},
+    }
+
+def bench_worker(kind: str, model_path: str, n: int, data: str, synthetic: int, threads: int, backend: str,
+                 batch_sizes, warmup: int, min_batches: int, max_batches: int, seconds: float, seed: int):
+    from threadpoolctl import threadpool_limits
+    model_path = Path(model_path)
+    with threadpool_limits(limits=threads):
+        rss0 = rss_mb()
+        t0 = time.perf_counter()
+        predict, used, vocab = load_predictor(kind, model_path, backend, threads)
+        load_sec = time.perf_counter() - t0
+        rss1 = rss_mb()
+
+        if synthetic:
+            X = synthetic_windows(synthetic, n, min(SYNTHETIC_VOCAB, vocab or SYNTHETIC_VOCAB), seed)
+        else:
+            X = np.load(Path(data) / "test" / "X.npy", mmap_mode="r", allow_pickle=False)
+            assert X.shape[1] == n, f"X width {X.shape[1]} != n={n} ({data})"
+        runs = []
+        for b in batch_sizes:
+            r = time_batches(predict, X, b, warmup, min_batches, max_batches, seconds)
+            runs.append(r)
+            print(f"[BENCH] {model_path.name:<20} {used:<10} threads={threads:<2} batch={r['batch_size']:<6}"
+                  f" {r['frames_per_sec'] or 0:>12.0f} frames/s  p50={r['latency_ms']['p50']:.3f}ms"
+                  f"  p99={r['latency_ms']['p99']:.3f}ms", flush=True)
+    return {"backend": used, "load_sec": round(load_sec, 4), "rss_before_load_mb": round(rss0, 1),
+            "rss_after_load_mb": round(rss1, 1), "model_rss_mb": round(rss1 - rss0, 1),
+            "peak_rss_mb": round(peak_rss_mb(), 1), "input_rows": int(X.shape[0]), "batches": runs}
+
+# ---------------------------
+# エントリポイント
+# ---------------------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Inference throughput / latency / memory benchmark for models/")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--label", help="merged の test split を使う（<data-root>/<label>-<n>gram）")
+    src.add_argument("--synthetic", type=int, default=0, help="この行数の合成窓（一様乱数の syscall 番号）を使う")
+    ap.add_argument("--models", default="", help="対象モデル名（カンマ区切り、既定: 全部）")
+    ap.add_argument("--model-dir", default="", help="モデルの置き場所を差し替える（既定: MODELS のパス）")
+    ap.add_argument("--batch-sizes", default=DEFAULT_BATCH_SIZES, help="カンマ区切り")
+    ap.add_argument("--threads", default="1", help="カンマ区切りのスレッド数（BLAS/OpenMP, TF intra-op）")
+    ap.add_argument("--keras-backend", choices=["auto", "numpy", "tf"], default="auto",
+                    help="auto: .keras から書き出した <model>.npz があれば NumPy LSTM、無い・古ければ TensorFlow")
+    ap.add_argument("--seconds", type=float, default=2.0, help="バッチサイズごとの測定時間の目安")
+    ap.add_argument("--min-batches", type=int, default=5)
+    ap.add_argument("--max-batches", type=int, default=2000)
+    ap.add_argument("--warmup", type=int, default=3)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--report", default="", help="結果 JSON（未指定なら eval/bench-infer-<label|synthetic>.json）")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    wanted = {s.strip() for s in args.models.split(",") if s.strip()}
+    models = [m for m in MODELS if not wanted or m["name"] in wanted]
+    batch_sizes = parse_ints(args.batch_sizes)
+    thread_list = parse_ints(args.threads)
+    start_all = now_jst_str()
+    src = args.label or f"synthetic:{args.synthetic}"
+    print(f"[START] {start_all}  bench {len(models)} models x threads={thread_list} x batch={batch_sizes}  input={src}")
+
+    # spawn + 1 タスク 1 プロセス: ロード時間・RSS が前のモデルの import / キャッシュに汚されない
+    # 測定どうしが CPU を取り合わないようワーカは常に 1 つ
+    ctx = mp.get_context("spawn")
+    results = []
+    with ProcessPoolExecutor(max_workers=1, mp_context=ctx, max_tasks_per_child=1) as pool:
+        for m in models:
+            model_path = Path(args.model_dir) / Path(m["model_path"]).name if args.model_dir else Path(m["model_path"])
+            data = "" if args.synthetic else str(build_data_path(args.label, int(m["n"])))
+            for threads in thread_list:
+                row = {"name": m["name"], "kind": m["kind"], "n": m["n"], "model_path": str(model_path),
+                       "data_path": data or None, "threads": threads}
+                try:
+                    if not model_path.exists():
+                        raise FileNotFoundError(f"{model_path} がありません")
+                    res = pool.submit(bench_worker, m["kind"], str(model_path), int(m["n"]), data, args.synthetic,
+                                      threads, args.keras_backend, batch_sizes, args.warmup, args.min_batches,
+                                      args.max_batches, args.seconds, args.seed).result()
+                    row.update(res)
+                    print(f"[DONE ] {now_jst_str()}  {m['name']} threads={threads}  load={res['load_sec']:.3f}s"
+                          f"  model_rss={res['model_rss_mb']:.0f}MB  peak_rss={res['peak_rss_mb']:.0f}MB")
+                except Exception as e:
+                    row["error"] = f"{type(e).__name__}: {e}"
+                    print(f"[ERROR] {m['name']} threads={threads}: {row['error']}")
+                results.append(row)
+
+    out = Path(args.report or f"eval/bench-infer-{args.label or 'synthetic'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"started_at": start_all, "finished_at": now_jst_str(), "label": args.label,
+                   "synthetic_rows": args.synthetic or None, "data_root": DATA_ROOT,
+                   "host": {"cpu_count": os.cpu_count(), "machine": platform.machine(),
+                            "python": platform.python_version(), "numpy": np.__version__},
+                   "batch_sizes": batch_sizes, "threads": thread_list, "results": results}, f, indent=2)
+    print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# features/bench-server.py
+# 複数ワーカでの推論の 2 構成を比べるベンチマーク。
+#   per-process: ワーカがそれぞれ全モデルをロードして自分で推論する
+#   server     : features/model_server.py のサーバ 1 プロセスだけがモデルを持ち、ワーカは共有メモリのリングで窓を渡す
+# どちらも同じ窓列（merged の test split か合成窓）を、ワーカごとに --batches 回 × 全モデル流し、
+# 全体のフレーム/秒・ワーカのピーク RSS の合計（server はサーバ分を含む）・ロード時間を出す。
+# 例:
+#   python features/bench-server.py --label 15m-30pct-r1-2 --workers 4 --batch 256 --batches 200
+#   python features/bench-server.py --synthetic 20000 --models dt_35,rnn_40 --workers 2
+# 出力: eval/bench-server-<label|synthetic>.json
+from pathlib import Path
+import argparse, json, os, platform, time
+import multiprocessing as mp
+import numpy as np
+from proc_mem import peak_rss_mb, proc_hwm_mb
+from model_server import ModelServer, RingClient
+# eval_common（sklearn / joblib を import する）は per-process ワーカと親でだけ読む。
+# spawn の子はこのスクリプトを import し直すので、トップレベルで読むと server 構成のワーカの RSS まで膨らむ
+
+MODES = ("per-process", "server")
+
+def open_inputs(models, data_paths, synthetic: int, vocab: int, seed: int):
+    """モデル名 → 窓（test X.npy の mmap か合成窓）"""
+    if synthetic:  # eval_common.synthetic_windows と同じ
+        rng = np.random.default_rng(seed)
+        return {m["name"]: rng.integers(0, vocab, size=(synthetic, int(m["n"])), dtype=np.int16) for m in models}
+    return {m["name"]: np.load(Path(p) / "test" / "X.npy", mmap_mode="r", allow_pickle=False)
+            for m, p in zip(models, data_paths)}
+
+def batch_at(X, i: int, batch: int):
+    a = (i * batch) % max(1, X.shape[0] - batch + 1)
+    return X[a:a + batch]
+
+# ---------------------------
+# ワーカ
+# ---------------------------
+
+def per_process_worker(w, models, data_paths, synthetic, vocab, seed, batch, batches, threads, backend, barrier, out):
+    from threadpoolctl import threadpool_limits
+    from eval_common import load_predictor
+    with threadpool_limits(limits=threads):
+        t0 = time.perf_counter()
+        preds = {m["name"]: load_predictor(m["kind"], Path(m["model_path"]), backend, threads)[0] for m in models}
+        load_sec = time.perf_counter() - t0
+        Xs = open_inputs(models, data_paths, synthetic, vocab, seed + w)
+        barrier.wait()
+        t_start = time.perf_counter(); frames = 0
+        for i in range(batches):
+            for m in models:
+                xb = batch_at(Xs[m["name"]], i + w, batch)
+                preds[m["name"]](xb)
+                frames += xb.shape[0]
+        t_end = time.perf_counter()
+    out.put({"worker": w, "frames": frames, "t_start": t_start, "t_end": t_end, "load_sec": load_sec,
+             "peak_rss_mb": peak_rss_mb()})
+
+def server_worker(w, client_args, models, data_paths, synthetic, vocab, seed, batch, batches, barrier, out):
+    cli = RingClient(*client_args)
+    Xs = open_inputs(models, data_paths, synthetic, vocab, seed + w)
+    barrier.wait()
+    t_start = time.perf_counter(); frames = 0
+    for i in range(batches):
+        # 全モデル分を投げてから回収（サーバ側で他ワーカの同じモデルのバッチとまとめて推論される）
+        for m in models:
+            xb = batch_at(Xs[m["name"]], i + w, batch)
+            cli.submit(m["name"], xb)
+            frames += xb.shape[0]
+        for _m in models:
+            cli.collect()
+    t_end = time.perf_counter()
+    cli.close()
+    out.put({"worker": w, "frames": frames, "t_start": t_start, "t_end": t_end, "load_sec": 0.0,
+             "peak_rss_mb": peak_rss_mb()})
+
+# ---------------------------
+# 親
+# ---------------------------
+
+def run_mode(mode, models, data_paths, args):
+    ctx = mp.get_context("spawn")
+    barrier = ctx.Barrier(args.workers)
+    out = ctx.Queue()
+    srv = None
+    server_load_sec = 0.0
+    common = (models, data_paths, args.synthetic, args.vocab, args.seed, args.batch, args.batches)
+    if mode == "server":
+        t0 = time.perf_counter()
+        srv = ModelServer(models, n_workers=args.workers, slots_per_worker=max(2, len(models)),
+                          max_rows=args.batch, threads=args.threads, backend=args.keras_backend, ctx=ctx).start()
+        server_load_sec = time.perf_counter() - t0
+        procs = [ctx.Process(target=server_worker, args=(w, srv.client_args(w), *common, barrier, out))
+                 for w in range(args.workers)]
+    else:
+        procs = [ctx.Process(target=per_process_worker,
+                             args=(w, *common, args.threads, args.keras_backend, barrier, out))
+                 for w in range(args.workers)]
+    try:
+        for p in procs:
+            p.start()
+        rows = [out.get(timeout=args.timeout) for _ in procs]
+        for p in procs:
+            p.join()
+        server_rss = proc_hwm_mb(srv.proc.pid) if srv is not None else None
+    finally:
+        if srv is not None:
+            srv.close()
+    frames = sum(r["frames"] for r in rows)
+    wall = max(r["t_end"] for r in rows) - min(r["t_start"] for r in rows)
+    worker_rss = sum(r["peak_rss_mb"] for r in rows)
+    return {"mode": mode, "workers": args.workers, "frames": frames, "wall_sec": round(wall, 4),
+            "frames_per_sec": round(frames / wall, 1) if wall > 0 else None,
+            "load_sec": round(server_load_sec if srv is not None else max(r["load_sec"] for r in rows), 4),
+            "worker_peak_rss_mb": round(worker_rss, 1),
+            "server_peak_rss_mb": round(server_rss, 1) if server_rss is not None else None,
+            "total_peak_rss_mb": round(worker_rss + (server_rss or 0.0), 1)}
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Throughput / memory: per-process models vs shared-memory model server")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--label", help="merged の test split を使う（<data-root>/<label>-<n>gram）")
+    src.add_argument("--synthetic", type=int, default=0, help="この行数の合成窓を使う")
+    ap.add_argument("--models", default="", help="対象モデル名（カンマ区切り、既定: 全部）")
+    ap.add_argument("--modes", default=",".join(MODES), help="per-process,server")
+    ap.add_argument("--workers", type=int, default=max(1, min(4, os.cpu_count() or 1)), help="取り込みワーカ数")
+    ap.add_argument("--batch", type=int, default=256, help="1 回に渡す窓数（= サーバのスロット行数）")
+    ap.add_argument("--batches", type=int, default=100, help="ワーカごと・モデルごとのバッチ数")
+    ap.add_argument("--threads", type=int, default=1, help="推論プロセスあたりのスレッド数")
+    ap.add_argument("--keras-backend", choices=["auto", "numpy", "tf"], default="auto")
+    ap.add_argument("--vocab", type=int, default=256, help="[--synthetic] syscall 番号の上限（LSTM の Embedding 行数以下）")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--timeout", type=float, default=3600.0)
+    ap.add_argument("--report", default="", help="結果 JSON（未指定なら eval/bench-server-<label|synthetic>.json）")
+    return ap.parse_args()
+
+def main():
+    from eval_common import MODELS, DATA_ROOT, now_jst_str, build_data_path
+    args = parse_args()
+    wanted = {s.strip() for s in args.models.split(",") if s.strip()}
+    models = [m for m in MODELS if (not wanted or m["name"] in wanted) and Path(m["model_path"]).exists()]
+    skipped = [m["name"] for m in MODELS if (not wanted or m["name"] in wanted) and m not in models]
+    for name in skipped:
+        print(f"[WARN ] {name}: モデルファイルが無いので除外")
+    if not models:
+        raise SystemExit("[ERROR] 対象モデルがありません")
+    data_paths = [None] * len(models) if args.synthetic else [str(build_data_path(args.label, int(m["n"]))) for m in models]
+    modes = [s.strip() for s in args.modes.split(",") if s.strip() in MODES]
+    start_all = now_jst_str()
+    print(f"[START] {start_all}  bench-server {[m['name'] for m in models]}  workers={args.workers}"
+          f"  batch={args.batch} x {args.batches}  modes={modes}")
+    results = []
+    for mode in modes:
+        try:
+            r = run_mode(mode, models, data_paths, args)
+            print(f"[BENCH] {mode:<12} {r['frames_per_sec'] or 0:>12.0f} frames/s  wall={r['wall_sec']:.2f}s"
+                  f"  load={r['load_sec']:.2f}s  rss total={r['total_peak_rss_mb']:.0f}MB"
+                  f" (workers={r['worker_peak_rss_mb']:.0f}MB server={r['server_peak_rss_mb'] or 0:.0f}MB)", flush=True)
+        except Exception as e:
+            r = {"mode": mode, "error": f"{type(e).__name__}: {e}"}
+            print(f"[ERROR] {mode}: {r['error']}")
+        results.append(r)
+
+    out = Path(args.report or f"eval/bench-server-{args.label or 'synthetic'}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"started_at": start_all, "finished_at": now_jst_str(), "label": args.label,
+                   "synthetic_rows": args.synthetic or None, "data_root": DATA_ROOT,
+                   "models": [m["name"] for m in models], "skipped": skipped, "workers": args.workers,
+                   "batch": args.batch, "batches": args.batches, "threads": args.threads,
+                   "host": {"cpu_count": os.cpu_count(), "machine": platform.machine(),
+                            "python": platform.python_version(), "numpy": np.__version__},
+                   "results": results}, f, indent=2)
+    print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+# features/cascade.py
+# 安いモデル → 高いモデルの確信度ゲート付きカスケード。
+#   - 安いモデル（dt_35 / mlp_10 など）で全窓をスコアし、確信度（上位 2 クラスのスコア差）が
+#     しきい値未満の窓だけを高いモデル（rnn_40、または複数モデルのアンサンブル）に回す
+#   - モデルごとに n が違うので、窓は「同じ pod の同じ末尾イベント」で対応づける
+#     （make_dataset のフレーム索引 pod / idx0 から末尾イベント位置 idx0 + n - 1 を作り、ソート済み配列の積集合）
+#   - しきい値は val split で決める: 高いモデルを全窓に使った場合の正解率からの低下が max_drop 以内で、
+#     エスカレーション率が最小になる値（確信度の降順ソート 1 回 + cumsum で全候補を評価）
+from pathlib import Path
+import time
+import numpy as np
+
+POD_SHIFT = 40  # 末尾イベント位置は 2^40 未満を想定（pod id を上位ビットに詰める）
+
+
+def frame_keys(idx0, pod, n: int):
+    """フレーム → int64 キー（pod, 末尾イベント位置）。n の違うデータセット間で同じ時点の窓が同じキーになる"""
+    end = np.asarray(idx0, dtype=np.int64) + (n - 1)
+    return (np.asarray(pod, dtype=np.int64) << POD_SHIFT) | end
+
+
+def align(keys_list):
+    """
+    各データセットのキー配列から、全てに共通するフレームの行 index を返す。
+    戻り値: (共通キー[昇順], [各データセットの行 index 配列])
+    """
+    common = keys_list[0]
+    for k in keys_list[1:]:
+        common = np.intersect1d(common, k, assume_unique=True)
+    rows = []
+    for k in keys_list:
+        order = np.argsort(k, kind="stable")
+        rows.append(order[np.searchsorted(k, common, sorter=order)])
+    return common, rows
+
+
+def margin(scores):
+    """上位 2 クラスのスコア差（学習時に無かったクラスの -inf 列は自然に最下位）。1 クラスしか無ければ +inf"""
+    s = np.asarray(scores, dtype=np.float64)
+    if s.shape[1] < 2:
+        return np.full(s.shape[0], np.inf)
+    top2 = -np.sort(-s, axis=1)[:, :2]
+    with np.errstate(invalid="ignore"):
+        d = top2[:, 0] - top2[:, 1]
+    return np.where(np.isnan(d), np.inf, d)
+
+
+def vote(score_list, sources):
+    """
+    アンサンブルの結合: 確率的なスコア（predict_proba / softmax）は平均、decision_function は argmax の 1 票。
+    戻り値: (N, n_classes) のスコア
+    """
+    acc = None
+    for s, src in zip(score_list, sources):
+        s = np.asarray(s, dtype=np.float64)
+        if src == "decision_function":
+            onehot = np.zeros_like(s)
+            onehot[np.arange(s.shape[0]), s.argmax(axis=1)] = 1.0
+            s = onehot
+        else:
+            s = np.where(np.isfinite(s), s, 0.0)
+        acc = s if acc is None else acc + s
+    return acc / len(score_list)
+
+
+def calibrate(conf, cheap_correct, exp_correct, max_drop: float):
+    """
+    確信度 conf >= thr の窓は安いモデル、それ以外は高いモデルが判定するとして、
+    正解率が「高いモデルを全窓に使った場合 − max_drop」以上になる範囲でエスカレーション率最小の thr を返す。
+    戻り値: dict（threshold, val_escalated_frac, val_acc_cascade, val_acc_expensive）
+    """
+    conf = np.asarray(conf, dtype=np.float64)
+    N = conf.size
+    order = np.argsort(-conf, kind="stable")
+    c = conf[order]
+    cc = np.r_[0, np.cumsum(np.asarray(cheap_correct, dtype=np.int64)[order])]
+    ec = np.r_[0, np.cumsum(np.asarray(exp_correct, dtype=np.int64)[order])]
+    # 同点の確信度は同じ側に倒れるので、候補は「値が変わる位置」だけ（k = 安いモデルが判定する件数）
+    ks = np.r_[0, np.flatnonzero(np.diff(c)) + 1, N] if N else np.zeros(1, dtype=np.int64)
+    correct = cc[ks] + (ec[N] - ec[ks])
+    acc_exp = ec[N] / N if N else 0.0
+    ok = np.flatnonzero(correct >= (acc_exp - max_drop) * N - 1e-9)
+    k = int(ks[ok[-1]]) if ok.size else 0
+    thr = float("inf") if k == 0 else float(c[k - 1])
+    return {"threshold": thr, "val_N": int(N), "val_escalated_frac": (N - k) / N if N else 0.0,
+            "val_acc_cascade": float(correct[ok[-1]] / N) if ok.size and N else float(acc_exp),
+            "val_acc_expensive": float(acc_exp), "max_drop": max_drop}
+
+
+class Cascade:
+    """
+    cheap: X -> (scores, source)、expensive: [X -> (scores, source)]（複数ならアンサンブル）
+    predict() には同じフレームに対応する n ごとの窓を {n: X_n} で渡す（行がそろっていること）
+    """
+
+    def __init__(self, cheap, expensive, threshold: float):
+        self.cheap = cheap
+        self.expensive = expensive
+        self.threshold = threshold
+
+    def predict(self, windows: dict):
+        """戻り値: (y_pred, escalated mask, 所要時間 {cheap_sec, expensive_sec})"""
+        n_c, f_c = self.cheap
+        t0 = time.perf_counter()
+        s, _ = f_c(windows[n_c])
+        y_pred = s.argmax(axis=1)
+        esc = margin(s) < self.threshold
+        t1 = time.perf_counter()
+        if esc.any():
+            rows = np.flatnonzero(esc)
+            outs = [f(windows[n][rows]) for n, f in self.expensive]
+            y_pred[rows] = vote([o[0] for o in outs], [o[1] for o in outs]).argmax(axis=1)
+        t2 = time.perf_counter()
+        return y_pred, esc, {"cheap_sec": t1 - t0, "expensive_sec": t2 - t1}
+
+
+def load_scorer(m: dict, n_classes: int):
+    """
+    eval_common.MODELS の 1 要素をロードし、X -> (scores[N, n_classes], source) の関数を返す。
+    ロードは eval_common と共通（バンドル / KNN 索引 / keras は NumPy LSTM があればそちら）。
+    スコアを出せない sklearn モデルは ValueError
+    """
+    from eval_common import load_sklearn, load_keras
+    kind = m["kind"]; model_path = Path(m["model_path"])
+    if kind == "sklearn":
+        from score_curves import sklearn_scores
+        clf = load_sklearn(model_path)
+
+        def score(X):
+            s, source = sklearn_scores(clf, X, n_classes)
+            if s is None:
+                raise ValueError(f"{m['name']}: predict_proba / decision_function がありません")
+            return s, source
+        return score
+    if kind == "keras":
+        model, _ = load_keras(model_path)
+        return lambda X: (_pad(model.predict_proba(X), n_classes), "softmax")
+    raise ValueError(f"unknown kind: {kind}")
+
+
+def _pad(prob, n_classes: int):
+    prob = np.asarray(prob, dtype=np.float32)
+    if prob.shape[1] >= n_classes:
+        return prob
+    return np.pad(prob, ((0, 0), (0, n_classes - prob.shape[1])), constant_values=-np.inf)
@@ -0,0 +1,58 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# features/check-overlap.py
+# merged データセットの train / val / test 間で同じ窓がどれだけ重なっているか（リーク）と、
+# 同じ窓が別ワークロードにも出る割合を数え、meta.json の "overlap" に書く（features/ngram_overlap.py）。
+# make_dataset.py はマージ時に同じ集計を書くので、これは既存データセットへの後付けと確認用。
+# 例:
+#   python features/check-overlap.py --label 15m-30pct-r1-2 --n 10,35,40
+#   python features/check-overlap.py --merged dataset/npy/merged/five-40gram --no-write
+from pathlib import Path
+import argparse, json
+import numpy as np
+from ngram_overlap import analyze
+
+DATA_ROOT = "dataset/npy/merged"
+SPLITS = ("train", "val", "test")
+
+def check_one(base: Path, write: bool):
+    meta = json.load(open(base / "meta.json"))
+    X = {s: np.load(base / s / "X.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+    y = {s: np.load(base / s / "y.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+    ov = analyze(X, y, meta["label_map"])
+    for pair, r in ov["pairs"].items():
+        per = "  ".join(f"{k}={v['in_ref']:.4f}(other={v['other_class']:.4f})" for k, v in r["per_class"].items())
+        print(f"[OVERLAP] {base.name}  {pair:<15} rows={r['rows']:<9} in_ref={r['in_ref']:.4f}"
+              f"  same={r['in_ref_same_class']:.4f} other={r['in_ref_other_class']:.4f}  {per}")
+    for s, r in ov["within"].items():
+        print(f"[OVERLAP] {base.name}  {s:<15} rows={r['rows']:<9} dup={r['duplicate_rows']:.4f}"
+              f"  multi-class windows={r['multi_class_windows']} ambiguous={r['ambiguous_rows']:.4f}")
+    if write:
+        meta["overlap"] = ov
+        with open(base / "meta.json", "w", encoding="utf-8") as f:
+            json.dump(meta, f, ensure_ascii=False, indent=2)
+        print(f"[SAVED] {base / 'meta.json'}  ({ov['key']}, {ov['sec']:.2f}s)")
+    return ov
+
+def main():
+    ap = argparse.ArgumentParser(description="Exact train/val/test window overlap and cross-workload sharing for merged datasets")
+    src = ap.add_mutually_exclusive_group(required=True)
+    src.add_argument("--label", help="dataset label（<data-root>/<label>-<n>gram を --n ごとに見る）")
+    src.add_argument("--merged", nargs="+", help="merged ディレクトリを直接指定")
+    ap.add_argument("--n", default="10,35,40,50,5", help="[--label] カンマ区切りの n（無いディレクトリは飛ばす）")
+    ap.add_argument("--data-root", default=DATA_ROOT)
+    ap.add_argument("--no-write", action="store_true", help="meta.json を書き換えない")
+    args = ap.parse_args()
+    bases = [Path(p) for p in args.merged] if args.merged else \
+        [Path(args.data_root) / f"{args.label}-{int(n)}gram" for n in args.n.split(",") if n.strip()]
+    for base in bases:
+        if not (base / "meta.json").exists():
+            print(f"[WARN ] {base}: meta.json が無いので飛ばします")
+            continue
+        try:
+            check_one(base, not args.no_write)
+        except Exception as e:
+            print(f"[ERROR] {base}: {type(e).__name__}: {e}")
+
+if __name__ == "__main__":
+    main()
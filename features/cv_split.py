@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+# features/cv_split.py
+# merged データセットを作り直さずに時系列の交差検証（rolling / blocked k-fold）をするための分割索引。
+#   - ワークロードごとに train → val → test の行を繋いだものを 1 本の時刻順フレーム列とみなす
+#     （make_dataset.py の 70/30 → 80/20 はこの列を連続区間で切ったもの。境界ガードで捨てた行は元から無い）
+#   - fold はこの列の上の半開区間で作り、train / val / test の境界ごとにガード（既定 n フレーム）を捨てる
+#       blocked: 列を k 等分し、i 番目のブロックを test、残りを train（test の前後 guard は捨てる）
+#       rolling: 列を k+1 等分し、i+1 番目のブロックを test、それより前を train（window > 0 なら直前 window フレームだけ）
+#     val は train のうち test 直前の区間（無ければ最後の区間）の末尾 val_frac（train に対する割合）を切り出す
+#   - グループ化データセット（meta.frame_index.group_by, make_dataset.py --framing.group_by）は列上の n フレームのガードだけでは
+#     同じグループのフレームどうしがイベントを共有し得るので、pod.npy / idx0.npy で test（と val）とイベントを共有する
+#     train（val）のフレームを fold ごとに落とす（make_dataset.drop_group_overlap と同じ考え方）
+#   - 区間は (split, a, b)（その split の X.npy / y.npy の行 [a, b)）に写して返す。mmap の X[a:b] はコピー無しの view で、
+#     学習に 1 本の配列が要るときだけ gather() がメモリ上で結合する（ディスクへの書き出し・データセットの再生成は無し）
+# 例:
+#   folds, info = make_folds(Path("dataset/npy/merged/15m-1000hz-35gram"), "blocked", k=5)
+#   arrays = open_arrays(base)
+#   Xtr = gather(arrays["X"], folds[0]["train"]); ytr = gather(arrays["y"], folds[0]["train"])
+from pathlib import Path
+import json
+import numpy as np
+
+SPLITS = ("train", "val", "test")
+SCHEMES = ("blocked", "rolling")
+
+
+def parse_cv_spec(spec: str):
+    """'blocked:5' / 'rolling:4' → (scheme, k)"""
+    scheme, _, k = spec.partition(":")
+    if scheme not in SCHEMES or not k.isdigit() or int(k) < 2:
+        raise ValueError(f"bad cv spec: {spec!r} (expected <{'|'.join(SCHEMES)}>:<k>=2..)")
+    return scheme, int(k)
+
+
+def workload_blocks(ys):
+    """
+    split → y（ワークロードの記載順に縦結合済み）から、ラベルごとの [(split, a, b)]（train → val → test 順）。
+    1 つの split の中で同じラベルが 2 か所に分かれていたら ValueError
+    """
+    blocks = {}
+    for split in SPLITS:
+        y = np.asarray(ys[split])
+        if y.shape[0] == 0:
+            continue
+        cut = np.flatnonzero(y[1:] != y[:-1]) + 1
+        for a, b in zip(np.r_[0, cut].tolist(), np.r_[cut, y.shape[0]].tolist()):
+            lab = int(y[a])
+            if any(s == split for s, _a, _b in blocks.get(lab, [])):
+                raise ValueError(f"label {lab} is not contiguous in {split}/y.npy")
+            blocks.setdefault(lab, []).append((split, a, b))
+    return blocks
+
+
+def blocked_folds(L: int, k: int, guard: int):
+    """[(train 区間のリスト, test 区間)]（区間は列上の (lo, hi)）"""
+    edges = (np.arange(k + 1) * L // k).tolist()
+    out = []
+    for i in range(k):
+        lo, hi = edges[i], edges[i + 1]
+        train = [(0, lo - guard), (hi + guard, L)]
+        out.append(([r for r in train if r[1] > r[0]], (lo, hi)))
+    return out
+
+
+def rolling_folds(L: int, k: int, guard: int, window: int = 0):
+    """k+1 等分の先頭ブロックは学習専用。i 番目の fold は i+1 番目のブロックを test にする（expanding / window 指定で sliding）"""
+    edges = (np.arange(k + 2) * L // (k + 1)).tolist()
+    out = []
+    for i in range(1, k + 1):
+        lo, hi = edges[i], edges[i + 1]
+        t_hi = lo - guard
+        t_lo = max(0, t_hi - window) if window > 0 else 0
+        out.append(([(t_lo, t_hi)] if t_hi > t_lo else [], (lo, hi)))
+    return out
+
+
+def carve_val(train, test_lo: int, val_frac: float, guard: int):
+    """train 区間から val を切り出す → (train, val)。区間が短くて取れなければ val は空"""
+    v = int(sum(hi - lo for lo, hi in train) * val_frac)
+    if v <= 0 or not train:
+        return train, []
+    before = [i for i, (_lo, hi) in enumerate(train) if hi <= test_lo]
+    i = before[-1] if before else len(train) - 1
+    lo, hi = train[i]
+    if hi - lo < v + guard + 1:
+        return train, []
+    train = list(train)
+    train[i] = (lo, hi - v - guard)
+    return train, [(hi - v, hi)]
+
+
+def to_physical(blocks, ranges):
+    """列上の (lo, hi) → (split, a, b)（split ファイルの境界で分ける）"""
+    out = []
+    off = 0
+    for split, a, b in blocks:
+        for lo, hi in ranges:
+            s, e = max(lo, off), min(hi, off + (b - a))
+            if s < e:
+                out.append((split, a + s - off, a + e - off))
+        off += b - a
+    return out
+
+
+def _rows(ranges):
+    """[(split, a, b)] → (split 番号[N], 行[N])"""
+    sid = [np.full(b - a, SPLITS.index(s), dtype=np.int64) for s, a, b in ranges]
+    row = [np.arange(a, b, dtype=np.int64) for _s, a, b in ranges]
+    return (np.concatenate(sid), np.concatenate(row)) if ranges else (np.empty(0, np.int64), np.empty(0, np.int64))
+
+
+def _ranges(sid, row):
+    """_rows の逆。split 内で連続する行を (split, a, b) にまとめる"""
+    if not row.size:
+        return []
+    cut = np.flatnonzero((sid[1:] != sid[:-1]) | (row[1:] != row[:-1] + 1)) + 1
+    lo = np.r_[0, cut]; hi = np.r_[cut, row.size]
+    return [(SPLITS[int(sid[a])], int(row[a]), int(row[b - 1]) + 1) for a, b in zip(lo.tolist(), hi.tolist())]
+
+
+class GroupGuard:
+    """
+    グループ化データセットのフレーム → 「同じ pod（グループ）で idx0 の差が n 未満」ならイベントを共有する。
+    キー pod * M + idx0（M は idx0 の最大 + 2n + 1 なので別 pod のキーとは ±n 以内に入らない）を searchsorted で照合する
+    """
+
+    def __init__(self, base: Path, n: int):
+        self.n = n
+        self.pod = {s: np.load(base / s / "pod.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+        self.idx0 = {s: np.load(base / s / "idx0.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+        max_pod = max((int(self.pod[s].max()) for s in SPLITS if self.pod[s].shape[0]), default=0)
+        max_idx = max((int(self.idx0[s].max()) for s in SPLITS if self.idx0[s].shape[0]), default=0)
+        self.M = max_idx + 2 * n + 1
+        if (max_pod + 1) * self.M >= 2**63:
+            raise ValueError("pod / idx0 が大きすぎて 64bit キーに収まりません")
+
+    def keys(self, sid, row):
+        out = np.empty(row.shape[0], dtype=np.int64)
+        for i, s in enumerate(SPLITS):
+            m = sid == i
+            if m.any():
+                out[m] = np.asarray(self.pod[s][row[m]], dtype=np.int64) * self.M + self.idx0[s][row[m]]
+        return out
+
+    def sharing(self, keys, ref_sorted):
+        """keys の各フレームが ref（ソート済みキー）のどれかとイベントを共有するか"""
+        if not ref_sorted.size:
+            return np.zeros(keys.shape[0], dtype=bool)
+        pos = np.searchsorted(ref_sorted, keys - (self.n - 1))
+        nxt = ref_sorted[np.minimum(pos, ref_sorted.size - 1)]
+        return (pos < ref_sorted.size) & (nxt <= keys + (self.n - 1))
+
+    def apply(self, fold):
+        """test とイベントを共有する val / train、val と共有する train を落とす → (fold, {split: 破棄数})"""
+        t = np.sort(self.keys(*_rows(fold["test"])))
+        v_sid, v_row = _rows(fold["val"])
+        keep = ~self.sharing(self.keys(v_sid, v_row), t)
+        dropped = {"val": int((~keep).sum())}
+        v_sid, v_row = v_sid[keep], v_row[keep]
+        tr_sid, tr_row = _rows(fold["train"])
+        ref = np.sort(np.r_[t, self.keys(v_sid, v_row)])
+        keep = ~self.sharing(self.keys(tr_sid, tr_row), ref)
+        dropped["train"] = int((~keep).sum())
+        return {"train": _ranges(tr_sid[keep], tr_row[keep]), "val": _ranges(v_sid, v_row), "test": fold["test"]}, dropped
+
+
+def make_folds(base: Path, scheme: str = "blocked", k: int = 5, guard=None, val_frac: float = 0.2, window: int = 0):
+    """
+    merged ディレクトリ base の fold を作る。guard=None なら meta.json の n。
+    グループ化データセットなら fold ごとに GroupGuard で test / val とイベントを共有するフレームも落とす。
+    戻り値: (folds, info)
+      folds: [{"train": [(split, a, b)], "val": [...], "test": [...]}]（区間は split の記載順・行順）
+      info:  {"scheme", "k", "guard", "val_frac", "window", "frames": {label: 列の長さ}[, "group_guard"]}
+    """
+    base = Path(base)
+    meta = json.load(open(base / "meta.json"))
+    guard = int(meta["n"]) if guard is None else int(guard)
+    ys = {s: np.load(base / s / "y.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+    blocks = workload_blocks(ys)
+    folds = [{s: [] for s in SPLITS} for _ in range(k)]
+    frames = {}
+    for lab, blk in blocks.items():
+        L = sum(b - a for _s, a, b in blk)
+        frames[lab] = L
+        gen = blocked_folds(L, k, guard) if scheme == "blocked" else rolling_folds(L, k, guard, window)
+        for fold, (train, test) in zip(folds, gen):
+            train, val = carve_val(train, test[0], val_frac, guard)
+            for s, ranges in (("train", train), ("val", val), ("test", [test])):
+                fold[s].extend(to_physical(blk, ranges))
+    order = {s: i for i, s in enumerate(SPLITS)}
+    for fold in folds:
+        for s in SPLITS:
+            fold[s].sort(key=lambda r: (order[r[0]], r[1]))
+    info = {"scheme": scheme, "k": k, "guard": guard, "val_frac": val_frac, "window": window,
+            "frames": {str(lab): L for lab, L in frames.items()}}
+    group_by = (meta.get("frame_index") or {}).get("group_by")
+    if group_by:
+        gg = GroupGuard(base, int(meta["n"]))
+        folds, dropped = map(list, zip(*[gg.apply(f) for f in folds])) if folds else ([], [])
+        info["group_guard"] = {"group_by": list(group_by), "dropped": dropped}
+    return folds, info
+
+
+def open_arrays(base: Path):
+    """{"X": {split: mmap}, "y": {split: mmap}}"""
+    base = Path(base)
+    return {name: {s: np.load(base / s / f"{name}.npy", mmap_mode="r", allow_pickle=False) for s in SPLITS}
+            for name in ("X", "y")}
+
+
+def gather(arrays, ranges):
+    """(split, a, b) の列 → 配列。区間が 1 つなら mmap の view をそのまま返す（コピー無し）"""
+    parts = [arrays[s][a:b] for s, a, b in ranges]
+    if len(parts) == 1:
+        return parts[0]
+    if not parts:
+        return arrays[SPLITS[0]][:0]
+    return np.concatenate(parts)
+
+
+def fold_sizes(fold):
+    return {s: int(sum(b - a for _s, a, b in fold[s])) for s in SPLITS}
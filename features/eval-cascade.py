@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# eval-cascade.py
+# 確信度ゲート付きカスケード（features/cascade.py）の評価。
+#   1) val split で、安いモデル（--cheap）の確信度しきい値を決める
+#      （高いモデル --expensive を全窓に使った場合からの正解率低下が --max-drop 以内で、エスカレーション最小）
+#   2) test split で、カスケードと「高いモデルを全窓に使う」構成を実際に走らせて比べる
+#      - エスカレーション率 / 全体スループット（frames/s）/ 正解率・悪性 Recall / FPR の差
+# モデルごとに n が違うので、各 n の merged データセットのフレーム索引（pod / idx0）で同じ時点の窓を対応づけ、
+# 全ての n に存在する窓だけを評価に使う（件数は aligned_N として出す）。
+# 使い方:
+#   python features/eval-cascade.py --label 15m-30pct-r1-2 --cheap dt_35 --expensive rnn_40
+#   python features/eval-cascade.py --label 15m-30pct-r1-2 --cheap mlp_10 --expensive rnn_40,svm_50 --max-drop 0.002
+# 出力: eval/<label>-cascade.json
+
+from pathlib import Path
+import argparse
+import json
+import time
+import numpy as np
+from eval_common import MODELS, DATA_ROOT, now_jst_str, build_data_path, n_classes_of, find_malicious_id, bin_metrics
+from cascade import Cascade, align, calibrate, frame_keys, load_scorer, margin, vote
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Confidence-gated cascade: cheap model first, escalate low-margin windows")
+    ap.add_argument("--label", nargs="+", required=True, help="dataset label(s) (e.g., 15m-30pct-r1-2)")
+    ap.add_argument("--cheap", default="dt_35", help="全窓をスコアする安いモデル（MODELS の name）")
+    ap.add_argument("--expensive", default="rnn_40", help="エスカレーション先（カンマ区切りで複数ならアンサンブル）")
+    ap.add_argument("--max-drop", type=float, default=0.001,
+                    help="val で許す正解率の低下（高いモデルを全窓に使った場合との差）")
+    ap.add_argument("--threshold", type=float, default=None, help="確信度しきい値を直接指定（val での較正を省く）")
+    return ap.parse_args()
+
+def open_split(data_path: Path, split: str, n: int):
+    """X（mmap）, y, フレームキー。フレーム索引が無ければキーは None"""
+    d = data_path / split
+    X = np.load(d / "X.npy", mmap_mode="r", allow_pickle=False)
+    y = np.load(d / "y.npy", allow_pickle=False)
+    assert X.shape[1] == n, f"n mismatch: X.shape[1]={X.shape[1]} vs {n} ({d})"
+    if (d / "idx0.npy").exists() and (d / "pod.npy").exists():
+        return X, y, frame_keys(np.load(d / "idx0.npy"), np.load(d / "pod.npy"), n)
+    return X, y, None
+
+def aligned_windows(label: str, split: str, ns):
+    """n ごとの窓を同じフレーム順にそろえる。戻り値: ({n: X_n}, y)"""
+    opened = {n: open_split(build_data_path(label, n), split, n) for n in ns}
+    if len(ns) == 1:
+        X, y, _ = opened[ns[0]]
+        return {ns[0]: np.asarray(X)}, y
+    if any(o[2] is None for o in opened.values()):
+        raise FileNotFoundError(f"{split}: idx0.npy / pod.npy がありません（n の違うモデルの窓を対応づけられないため "
+                                "make_dataset.py で作り直してください）")
+    _common, rows = align([opened[n][2] for n in ns])
+    windows = {n: np.asarray(opened[n][0])[r] for n, r in zip(ns, rows)}
+    ys = [opened[n][1][r] for n, r in zip(ns, rows)]
+    bad = int(sum(np.count_nonzero(ys[0] != y) for y in ys[1:]))
+    if bad:
+        raise ValueError(f"{split}: 対応づけた窓のラベルが {bad} 件食い違っています")
+    return windows, ys[0]
+
+def expensive_scores(expensive, windows):
+    outs = [f(windows[n]) for n, f in expensive]
+    return vote([o[0] for o in outs], [o[1] for o in outs])
+
+def eval_label(label, cheap_m, exp_ms, args):
+    ns = sorted({int(m["n"]) for m in [cheap_m, *exp_ms]})
+    meta = json.load(open(build_data_path(label, int(cheap_m["n"])) / "meta.json"))
+    n_classes = n_classes_of(meta)
+    mal_id, mal_key = find_malicious_id(meta.get("label_map", {}))
+    cheap = (int(cheap_m["n"]), load_scorer(cheap_m, n_classes))
+    expensive = [(int(m["n"]), load_scorer(m, n_classes)) for m in exp_ms]
+
+    # 1) val でしきい値
+    if args.threshold is None:
+        Wv, yv = aligned_windows(label, "val", ns)
+        sc, _ = cheap[1](Wv[cheap[0]])
+        calib = calibrate(margin(sc), sc.argmax(axis=1) == yv,
+                          expensive_scores(expensive, Wv).argmax(axis=1) == yv, args.max_drop)
+        print(f"[CALIB] {label}  threshold={calib['threshold']:.6g}  val_escalated={calib['val_escalated_frac']:.4f}"
+              f"  val_acc cascade={calib['val_acc_cascade']:.4f} expensive={calib['val_acc_expensive']:.4f}"
+              f"  (N={calib['val_N']})")
+    else:
+        calib = {"threshold": args.threshold, "manual": True}
+
+    # 2) test でカスケード vs 高いモデルを全窓
+    Wt, yt = aligned_windows(label, "test", ns)
+    N = int(yt.shape[0])
+    t0 = time.perf_counter()
+    y_exp = expensive_scores(expensive, Wt).argmax(axis=1)
+    exp_sec = time.perf_counter() - t0
+    y_cas, esc, tm = Cascade(cheap, expensive, calib["threshold"]).predict(Wt)
+    cas_sec = tm["cheap_sec"] + tm["expensive_sec"]
+    y_cheap_only = cheap[1](Wt[cheap[0]])[0].argmax(axis=1)
+
+    acc = lambda yp: float(np.mean(yp == yt)) if N else None
+    fps = lambda sec: round(N / sec, 1) if sec > 0 else None
+    bm_cas = bin_metrics((yt == mal_id).astype(int), (y_cas == mal_id).astype(int))
+    bm_exp = bin_metrics((yt == mal_id).astype(int), (y_exp == mal_id).astype(int))
+    res = {
+        "aligned_N": N, "escalated": int(esc.sum()), "escalated_frac": float(esc.mean()) if N else None,
+        "accuracy": {"cascade": acc(y_cas), "expensive": acc(y_exp), "cheap": acc(y_cheap_only)},
+        "accuracy_delta": acc(y_cas) - acc(y_exp) if N else None,
+        "agreement_with_expensive": float(np.mean(y_cas == y_exp)) if N else None,
+        "binary": {"positive_class": mal_key, "positive_id": int(mal_id), "cascade": bm_cas, "expensive": bm_exp},
+        "recall_delta": bm_cas["recall"] - bm_exp["recall"], "fpr_delta": bm_cas["fpr"] - bm_exp["fpr"],
+        "time_sec": {"cascade_cheap": round(tm["cheap_sec"], 4), "cascade_expensive": round(tm["expensive_sec"], 4),
+                     "expensive_all": round(exp_sec, 4)},
+        "frames_per_sec": {"cascade": fps(cas_sec), "expensive": fps(exp_sec)},
+        "speedup": round(exp_sec / cas_sec, 3) if cas_sec > 0 else None,
+    }
+    print(f"[CASCADE] {label}  {cheap_m['name']} -> {'+'.join(m['name'] for m in exp_ms)}"
+          f"  escalated={res['escalated_frac']:.4f}  acc={res['accuracy']['cascade']:.4f}"
+          f" (Δ={res['accuracy_delta']:+.4f})  R={bm_cas['recall']:.4f} (Δ={res['recall_delta']:+.4f})"
+          f"  FPR={bm_cas['fpr']:.4f} (Δ={res['fpr_delta']:+.4f})"
+          f"  {res['frames_per_sec']['cascade']} vs {res['frames_per_sec']['expensive']} frames/s  x{res['speedup']}")
+    return {"ns": ns, "calibration": calib, **res}
+
+def main():
+    args = parse_args()
+    by_name = {m["name"]: m for m in MODELS}
+    names = [args.cheap, *[s.strip() for s in args.expensive.split(",") if s.strip()]]
+    unknown = [n for n in names if n not in by_name]
+    if unknown:
+        raise SystemExit(f"[ERROR] unknown model(s): {', '.join(unknown)} (choices: {', '.join(by_name)})")
+    cheap_m, exp_ms = by_name[names[0]], [by_name[n] for n in names[1:]]
+    print(f"[START] {now_jst_str()}  cascade {cheap_m['name']} -> {'+'.join(m['name'] for m in exp_ms)}"
+          f"  labels={len(args.label)}")
+    out_dir = Path("eval"); out_dir.mkdir(parents=True, exist_ok=True)
+    for label in args.label:
+        start = now_jst_str()
+        try:
+            result = eval_label(label, cheap_m, exp_ms, args)
+        except Exception as e:
+            result = {"error": f"{type(e).__name__}: {e}"}
+            print(f"[ERROR] {label}: {result['error']}")
+        out = out_dir / f"{label}-cascade.json"
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"started_at": start, "finished_at": now_jst_str(), "label": label, "data_root": DATA_ROOT,
+                       "cheap": cheap_m, "expensive": exp_ms, "max_drop": args.max_drop, **result}, f, indent=2)
+        print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -9,103 +9,36 @@
 from pathlib import Path
 import argparse
 import json
-import re
-import numpy as np
-import joblib
-from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
-from datetime import datetime
-from zoneinfo import ZoneInfo
-
-JST = ZoneInfo("Asia/Tokyo")
-
-# モデル⇔n（モデルは固定 / data_path は実行時に label から組み立て）
-MODELS = [
-    {"name": "rnn_40", "kind": "keras",   "model_path": "models/lstm.model.keras",  "n": 40},
-    {"name": "dt_35",  "kind": "sklearn", "model_path": "models/dt_35.joblib",      "n": 35},
-    {"name": "svm_50", "kind": "sklearn", "model_path": "models/svm_50_all.joblib", "n": 50},
-    {"name": "mlp_10", "kind": "sklearn", "model_path": "models/mlp_10.joblib",     "n": 10},
-    {"name": "knn_5",  "kind": "sklearn", "model_path": "models/knn_5.joblib",      "n": 5},
-]
-
-DATA_ROOT = "dataset/npy/merged"  # 変更しない（最小変更方針）
-
-def now_jst_str():
-    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S %Z")
-
-def now_jst_iso():
-    return datetime.now(JST).isoformat()
+from eval_common import (MODELS, DATA_ROOT, now_jst_str, build_data_path, load_test, n_classes_of, predict,
+                         find_malicious_id, bin_metrics)
+from results_store import record_results, STORE_DIR
+from pred_cache import CACHE_DIR
+from score_curves import DEFAULT_TARGET_FPRS, compact, curves
 
 def parse_args():
     ap = argparse.ArgumentParser(description="Binary eval (malicious vs non-malicious) for fixed models on a labeled dataset")
     ap.add_argument("--label", required=True, help="dataset label (e.g., 15m-40pct)")
+    ap.add_argument("--store-dir", default=STORE_DIR, help="結果ストア（SQLite シャード）の置き場所")
+    ap.add_argument("--no-store", action="store_true", help="結果ストアへの書き込みを省略（JSON のみ）")
+    ap.add_argument("--cache-dir", default=CACHE_DIR, help="推論結果キャッシュ（y_pred / scores）の置き場所")
+    ap.add_argument("--no-cache", action="store_true", help="推論結果キャッシュを使わない（毎回推論）")
+    ap.add_argument("--refresh-cache", action="store_true", help="キャッシュを無視して推論し、結果で上書き")
+    ap.add_argument("--scores", action="store_true",
+                    help="スコアモード: 悪性クラスのスコア（predict_proba / decision_function / softmax）で ROC・PR 曲線と動作点を算出")
+    ap.add_argument("--target-fpr", default=",".join(str(t) for t in DEFAULT_TARGET_FPRS),
+                    help="[--scores] 動作点を求める目標 FPR（カンマ区切り）")
+    ap.add_argument("--curve-points", type=int, default=256, help="[--scores] results.json に残す曲線の最大点数")
     return ap.parse_args()
 
-def build_data_path(label: str, n: int) -> Path:
-    # <DATA_ROOT>/<label>-<n>gram
-    return Path(DATA_ROOT) / f"{label}-{n}gram"
-
-def load_test(merged_dir: Path):
-    meta = json.load(open(merged_dir / "meta.json"))
-    X = np.load(merged_dir / "test" / "X.npy", mmap_mode="r", allow_pickle=False)
-    y = np.load(merged_dir / "test" / "y.npy", allow_pickle=False)
-    assert X.shape[1] == meta["n"], f"n mismatch: X.shape[1]={X.shape[1]} vs meta.n={meta['n']}"
-    return X, y, meta
-
-def eval_sklearn(model_path: Path, X):
-    clf = joblib.load(model_path)
-    y_pred = clf.predict(X)
-    return y_pred
-
-def eval_keras(model_path: Path, X):
-    import tensorflow as tf
-    X = np.asarray(X, dtype="int32")  # RNNのEmbedding前提でint32に
-    model = tf.keras.models.load_model(model_path)
-    y_prob = model.predict(X, verbose=0)
-    y_pred = y_prob.argmax(axis=1)
-    return y_pred
-
-def find_malicious_id(label_map: dict) -> tuple[int, str]:
-    """
-    label_map から悪性ラベルの id を推定する。
-    優先順位: キーに 'xmrig' / 'xmr' / 'noise' / 'malicious' / 'mining'
-    該当なしなら ValueError
-    """
-    patterns = ["xmrig", "xmr", "noise", "malicious", "mining"]
-    # まずキーで探す
-    for k, v in label_map.items():
-        lk = k.lower()
-        if any(p in lk for p in patterns):
-            return int(v), k
-    # 次に逆引き（値→キー）でもう一度（保険）
-    inv = {int(v): k for k, v in label_map.items()}
-    for vid, k in inv.items():
-        lk = k.lower()
-        if any(p in lk for p in patterns):
-            return vid, k
-    raise ValueError("malicious_id not found in label_map")
-
-def bin_metrics(y_true_bin: np.ndarray, y_pred_bin: np.ndarray):
-    # confusion matrix
-    tn, fp, fn, tp = confusion_matrix(y_true_bin, y_pred_bin, labels=[0,1]).ravel()
-    # P/R/F1（ゼロ割は0扱い）
-    p, r, f1, _ = precision_recall_fscore_support(
-        y_true_bin, y_pred_bin, average="binary", zero_division=0
-    )
-    # FPR
-    fpr = fp / (fp + tn) if (fp + tn) > 0 else 0.0
-    return {
-        "precision": float(p),
-        "recall": float(r),     # = TPR
-        "f1": float(f1),
-        "fpr": float(fpr),
-        "tp": int(tp), "fp": int(fp), "fn": int(fn), "tn": int(tn),
-        "support_pos": int(tp + fn),
-        "support_neg": int(tn + fp),
-    }
+def score_metrics(y_true_bin, scores, mal_id: int, source, target_fprs, max_points: int):
+    """悪性クラス列のスコアで ROC / PR を 1 ソートで求め、results.json 向けに間引いて返す"""
+    c = curves(y_true_bin, scores[:, mal_id], target_fprs)
+    return {"score_source": source, "positive_id": int(mal_id), **compact(c, max_points)}
 
 def main():
     args = parse_args()
     label = args.label
+    target_fprs = [float(t) for t in args.target_fpr.split(",") if t.strip()]
 
     all_results = []
     start_all = now_jst_str()
@@ -123,22 +56,33 @@ def main():
             start = now_jst_str()
             print(f"[START] {start}  {name}  (n={meta['n']}, test_N={len(y)})")
 
-            if kind == "sklearn":
-                y_pred = eval_sklearn(model_path, X)
-            elif kind == "keras":
-                y_pred = eval_keras(model_path, X)
-            else:
-                raise ValueError(f"unknown kind: {kind}")
+            y_pred, scores, hit, info = predict(m, X, data_path, n_classes_of(meta), scores=args.scores,
+                                                no_cache=args.no_cache, refresh=args.refresh_cache,
+                                                cache_dir=args.cache_dir, store_dir=args.store_dir)
+            if hit:
+                print(f"[CACHE] {name}  y_pred from {args.cache_dir}")
 
             # 二値化
             y_true_bin = (y == mal_id).astype(int)
             y_pred_bin = (y_pred == mal_id).astype(int)
 
             bm = bin_metrics(y_true_bin, y_pred_bin)
+            sm = None
+            if args.scores:
+                if scores is None or scores.shape[1] <= mal_id:
+                    print(f"[SCORE] {name}  no scores available (argmax only)")
+                else:
+                    sm = score_metrics(y_true_bin, scores, mal_id, info.get("score_source"), target_fprs,
+                                       args.curve_points)
 
             done = now_jst_str()
             print(f"[DONE ] {done}  {name}")
             print(f"[BINARY] {name}  P={bm['precision']:.4f}  R={bm['recall']:.4f}  F1={bm['f1']:.4f}  FPR={bm['fpr']:.4f}  TP={bm['tp']} FP={bm['fp']} FN={bm['fn']} TN={bm['tn']}")
+            if sm is not None:
+                ops = "  ".join(f"R@FPR<={op['target_fpr']:g}={op['recall']:.4f}" for op in sm["operating_points"])
+                auc = "n/a" if sm["roc_auc"] is None else f"{sm['roc_auc']:.4f}"
+                ap_ = "n/a" if sm["average_precision"] is None else f"{sm['average_precision']:.4f}"
+                print(f"[SCORE] {name}  {sm['score_source']}  AUC={auc}  AP={ap_}  {ops}")
 
             all_results.append({
                 "name": name,
@@ -150,6 +94,7 @@ def main():
                 "test_N": int(len(y)),
                 "started_at": start,
                 "finished_at": done,
+                "pred_cache": "hit" if hit else ("off" if args.no_cache else "miss"),
                 "binary_metrics": {
                     "positive_class": mal_key,
                     "positive_id": int(mal_id),
@@ -163,7 +108,8 @@ def main():
                 },
                 "confusion_matrix": {
                     "tp": bm["tp"], "fp": bm["fp"], "fn": bm["fn"], "tn": bm["tn"]
-                }
+                },
+                **({"score_metrics": sm} if sm is not None else {})
             })
         except Exception as e:
             err = f"{type(e).__name__}: {e}"
@@ -182,6 +128,9 @@ def main():
         json.dump({"started_at": start_all, "finished_at": now_jst_str(),
                    "label": label, "data_root": DATA_ROOT, "results": all_results}, f, indent=2)
     print(f"[SAVED] {out}")
+    if not args.no_store:
+        n = record_results(all_results, label=label, store_dir=args.store_dir)
+        print(f"[STORE] {args.store_dir}  rows={n}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# eval-sampling.py
+# 窓間引きポリシー（features/sampling.py）のオフライン再生。test split を pod ごとに元の順序で流し、
+# ポリシーがスコアする窓だけ判定を更新（見送った窓は直前の判定を保持）したときの
+#   - 節約できた CPU（スコアしなかった窓の割合）
+#   - 窓単位の Recall / FPR、悪性 pod の検知数と検知までの時間（TTD）、良性 pod の誤警報
+# を全窓スコア（every_1）と比べる。推論は eval-noise.py と同じ推論キャッシュを使う（全窓のスコアを先に求めて間引く）。
+# 使い方:
+#   python features/eval-sampling.py --label 15m-30pct-r1-2 [--every 4,16] [--adaptive 16:0.5:64] [--budget-fps 0,2000]
+# 出力: eval/<label>-sampling.json
+
+from pathlib import Path
+import argparse
+import json
+import time
+import numpy as np
+from eval_common import (MODELS, DATA_ROOT, now_jst_str, build_data_path, load_test, n_classes_of, predict,
+                         find_malicious_id, load_frame_index, malicious_score, bin_metrics)
+from pred_cache import CACHE_DIR
+from results_store import STORE_DIR
+from sampling import SamplingPolicy, hold_decisions, parse_policies, simulate
+from stream_agg import order_by_pod, evaluate, NO_TS
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Offline simulation of per-pod window sampling policies (CPU saved vs recall / delay)")
+    ap.add_argument("--label", nargs="+", required=True, help="dataset label(s) (e.g., 15m-30pct-r1-2)")
+    ap.add_argument("--models", default="", help="対象モデル名（カンマ区切り、既定: 全部）")
+    ap.add_argument("--every", default="2,4,8,16", help="固定ストライド k（カンマ区切り）")
+    ap.add_argument("--adaptive", default="16:0.5:64", help="適応型 k:rise:hold（スコア >= rise で hold 窓ぶん全窓、カンマ区切り）")
+    ap.add_argument("--budget-fps", default="0", help="CPU 予算（全 pod 合計の窓/秒、カンマ区切り。0 = 無制限）")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--store-dir", default=STORE_DIR)
+    return ap.parse_args()
+
+def fmt(v, spec):
+    return "n/a" if v is None else format(v, spec)
+
+def eval_label(label, models, policies, args):
+    results = []
+    for m in models:
+        name = m["name"]
+        data_path = build_data_path(label, int(m["n"]))
+        try:
+            X, y, meta = load_test(data_path)
+            idx0, pod, t_ns = load_frame_index(data_path, len(y))
+            mal_id, mal_key = find_malicious_id(meta.get("label_map", {}))
+            y_pred, scores, hit, info = predict(m, X, data_path, n_classes_of(meta), scores=True,
+                                                cache_dir=args.cache_dir, store_dir=args.store_dir)
+            if hit:
+                print(f"[CACHE] {name}  y_pred from {args.cache_dir}")
+            y_pred_bin = (np.asarray(y_pred) == mal_id)
+            score, score_source = malicious_score(scores, info.get("score_source"), mal_id, y_pred_bin)
+
+            order, starts, head = order_by_pod(pod, idx0)
+            dec = y_pred_bin[order]; sco = score[order]; ts = t_ns[order]
+            y_bin = (np.asarray(y)[order] == mal_id)
+            malicious_pod = y_bin[starts]
+            has_time = bool(ts.size) and bool((ts != NO_TS).all())
+
+            pols, base = {}, None
+            for pol_name, params in policies:
+                if params.get("budget_fps", 0) > 0 and not has_time:
+                    pols[pol_name] = {"params": params, "error": "t_ns が無いため CPU 予算を再生できません"}
+                    continue
+                policy = SamplingPolicy(**params)
+                t0 = time.perf_counter()
+                scored = simulate(policy, sco, starts, ts)
+                sim_sec = time.perf_counter() - t0
+                alarm = hold_decisions(dec, scored, starts)
+                bm = bin_metrics(y_bin.astype(int), alarm.astype(int))
+                ev = evaluate(alarm, starts, head, malicious_pod, ts)
+                row = {"params": params, "scored": int(scored.sum()),
+                       "cpu_saved": float(1.0 - scored.mean()) if scored.size else None, "shed": policy.shed,
+                       "window_recall": bm["recall"], "window_fpr": bm["fpr"], **ev, "sim_sec": round(sim_sec, 3)}
+                if base is None:
+                    base = row
+                else:
+                    row["recall_delta"] = row["window_recall"] - base["window_recall"]
+                    row["pods_detected_delta"] = row["pods_detected"] - base["pods_detected"]
+                    b, r = base["ttd_frames"]["median"], row["ttd_frames"]["median"]
+                    row["ttd_frames_delta"] = r - b if r is not None and b is not None else None
+                    b = (base["ttd_sec"] or {}).get("median"); r = (row["ttd_sec"] or {}).get("median")
+                    row["ttd_sec_delta"] = r - b if r is not None and b is not None else None
+                pols[pol_name] = row
+                tt = row["ttd_sec"] or {}
+                print(f"[SAMPLE] {label}  {name:<7} {pol_name:<26} cpu_saved={row['cpu_saved']:.3f}"
+                      f"  R={row['window_recall']:.4f} FPR={row['window_fpr']:.4f}"
+                      f"  detected={row['pods_detected']}/{row['pods_malicious']}"
+                      f"  TTD={fmt(tt.get('median'), '.2f')}s ({fmt(row['ttd_frames']['median'], '.0f')} frames)"
+                      f"  shed={row['shed']}")
+            results.append({"name": name, "kind": m["kind"], "model_path": m["model_path"], "data_path": str(data_path),
+                            "n": meta["n"], "test_N": int(len(y)), "positive_class": mal_key, "positive_id": int(mal_id),
+                            "score_source": score_source, "pods": int(starts.size), "policies": pols})
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] {label} {name}: {err}")
+            results.append({"name": name, "kind": m["kind"], "data_path": str(data_path), "error": err})
+    return results
+
+def main():
+    args = parse_args()
+    wanted = {s.strip() for s in args.models.split(",") if s.strip()}
+    models = [m for m in MODELS if not wanted or m["name"] in wanted]
+    policies = parse_policies(args.every, args.adaptive, args.budget_fps)
+    print(f"[START] {now_jst_str()}  sampling sim {len(models)} models x {len(policies)} policies x {len(args.label)} labels")
+    out_dir = Path("eval"); out_dir.mkdir(parents=True, exist_ok=True)
+    for label in args.label:
+        start = now_jst_str()
+        results = eval_label(label, models, policies, args)
+        out = out_dir / f"{label}-sampling.json"
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"started_at": start, "finished_at": now_jst_str(), "label": label, "data_root": DATA_ROOT,
+                       "policies": [{"name": n, **p} for n, p in policies], "results": results}, f, indent=2)
+        print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# eval-stream.py
+# pod 単位のストリーム評価: test split をフレームの元順序（make_dataset の idx0 / pod / t_ns）で pod ごとに再生し、
+# 窓ごとの判定を集約器（k-of-m / EWMA / CUSUM、features/stream_agg.py）で警報に変換して
+#   - 悪性 pod: 最初の警報までの時間（TTD, 秒とフレーム数）
+#   - 良性 pod: 誤警報数 / 時間（false alerts per hour）
+# をモデル × 集約器 × ラベル（ノイズ率）ごとに出す。推論は eval-noise.py と同じ推論キャッシュを使う。
+# 使い方:
+#   python features/eval-stream.py --label 15m-30pct-r1-2 15m-60pct-r1-2 [--kofm 3/5,8/10] [--ewma 0.1:0.6] [--cusum 0.5:5]
+# 出力: eval/<label>-stream.json
+
+from pathlib import Path
+import argparse
+import json
+import numpy as np
+from eval_common import (MODELS, DATA_ROOT, now_jst_str, build_data_path, load_test, n_classes_of, predict,
+                         find_malicious_id, load_frame_index, malicious_score)
+from pred_cache import CACHE_DIR
+from results_store import STORE_DIR
+from stream_agg import order_by_pod, parse_specs, run_aggregator, evaluate
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Pod-level streaming decision aggregation (time-to-detect / false alerts per hour)")
+    ap.add_argument("--label", nargs="+", required=True, help="dataset label(s) (e.g., 15m-30pct-r1-2)")
+    ap.add_argument("--models", default="", help="対象モデル名（カンマ区切り、既定: 全部）")
+    ap.add_argument("--kofm", default="3/5,8/10", help="k-of-m 投票（k/m をカンマ区切り）")
+    ap.add_argument("--ewma", default="0.1:0.6", help="スコアの EWMA（alpha:しきい値 をカンマ区切り）")
+    ap.add_argument("--cusum", default="0.5:5", help="スコアの CUSUM（ドリフト k:しきい値 h をカンマ区切り）")
+    ap.add_argument("--decisions-only", action="store_true",
+                    help="スコアを使わず、EWMA / CUSUM も 0/1 判定に適用（sklearn の追加推論を省く）")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    ap.add_argument("--store-dir", default=STORE_DIR)
+    return ap.parse_args()
+
+def fmt(v, spec):
+    return "n/a" if v is None else format(v, spec)
+
+def eval_label(label, models, specs, args):
+    results = []
+    for m in models:
+        name = m["name"]
+        data_path = build_data_path(label, int(m["n"]))
+        try:
+            X, y, meta = load_test(data_path)
+            idx0, pod, t_ns = load_frame_index(data_path, len(y))
+            mal_id, mal_key = find_malicious_id(meta.get("label_map", {}))
+            y_pred, scores, hit, info = predict(m, X, data_path, n_classes_of(meta), scores=not args.decisions_only,
+                                                cache_dir=args.cache_dir, store_dir=args.store_dir)
+            if hit:
+                print(f"[CACHE] {name}  y_pred from {args.cache_dir}")
+            y_pred_bin = (np.asarray(y_pred) == mal_id)
+            score, score_source = malicious_score(None if args.decisions_only else scores,
+                                                  info.get("score_source"), mal_id, y_pred_bin)
+
+            order, starts, head = order_by_pod(pod, idx0)
+            dec = y_pred_bin[order]; sco = score[order]; ts = t_ns[order]
+            malicious_pod = (np.asarray(y)[order][starts] == mal_id)
+
+            aggs = {}
+            for agg_name, kind, params in specs:
+                alarm = run_aggregator(kind, params, dec, sco, starts, head)
+                ev = evaluate(alarm, starts, head, malicious_pod, ts)
+                aggs[agg_name] = {"kind": kind, "params": params, **ev}
+                tt = ev["ttd_sec"] or {}
+                print(f"[STREAM] {label}  {name:<7} {agg_name:<14} detected={ev['pods_detected']}/{ev['pods_malicious']}"
+                      f"  TTD={fmt(tt.get('median'), '.2f')}s ({fmt(ev['ttd_frames']['median'], '.0f')} frames)"
+                      f"  FA/h={fmt(ev['false_alerts_per_hour'], '.2f')}  FA={ev['false_alerts']}")
+            results.append({"name": name, "kind": m["kind"], "model_path": m["model_path"], "data_path": str(data_path),
+                            "n": meta["n"], "test_N": int(len(y)), "positive_class": mal_key, "positive_id": int(mal_id),
+                            "score_source": score_source, "pods": int(starts.size), "aggregators": aggs})
+        except Exception as e:
+            err = f"{type(e).__name__}: {e}"
+            print(f"[ERROR] {label} {name}: {err}")
+            results.append({"name": name, "kind": m["kind"], "data_path": str(data_path), "error": err})
+    return results
+
+def main():
+    args = parse_args()
+    wanted = {s.strip() for s in args.models.split(",") if s.strip()}
+    models = [m for m in MODELS if not wanted or m["name"] in wanted]
+    specs = parse_specs(args.kofm, args.ewma, args.cusum)
+    print(f"[START] {now_jst_str()}  stream eval {len(models)} models x {len(specs)} aggregators x {len(args.label)} labels")
+    out_dir = Path("eval"); out_dir.mkdir(parents=True, exist_ok=True)
+    for label in args.label:
+        start = now_jst_str()
+        results = eval_label(label, models, specs, args)
+        out = out_dir / f"{label}-stream.json"
+        with open(out, "w", encoding="utf-8") as f:
+            json.dump({"started_at": start, "finished_at": now_jst_str(), "label": label, "data_root": DATA_ROOT,
+                       "aggregators": [{"name": a, "kind": k, "params": p} for a, k, p in specs],
+                       "results": results}, f, indent=2)
+        print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -2,12 +2,11 @@
 # features/eval_models_simple.py
 # シンプル一括評価: merged/test の X.npy,y.npy を各モデルで評価して、ログ出力＋JSON保存
 from pathlib import Path
-import json, numpy as np, joblib
+import json
+from eval_common import load_test, n_classes_of, now_jst_str, predict
+from model_bundle import is_bundle, bundle_path_for
+from results_store import record_results
 from sklearn.metrics import accuracy_score, precision_recall_fscore_support, classification_report
-from datetime import datetime
-from zoneinfo import ZoneInfo
-
-JST = ZoneInfo("Asia/Tokyo")
 
 # モデル⇔データ
 MODELS = [
@@ -32,32 +31,6 @@ MODELS = [
      "data_path": "dataset/npy/merged/15m-1000hz-5gram"},
 ]
 
-def now_jst_str():
-    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S %Z")
-
-def now_jst_iso():
-    return datetime.now(JST).isoformat()
-
-def load_test(merged_dir: Path):
-    meta = json.load(open(merged_dir/"meta.json"))
-    X = np.load(merged_dir/"test"/"X.npy", mmap_mode="r", allow_pickle=False)
-    y = np.load(merged_dir/"test"/"y.npy", allow_pickle=False)
-    assert X.shape[1] == meta["n"], f"n mismatch: X.shape[1]={X.shape[1]} vs meta.n={meta['n']}"
-    return X, y, meta
-
-def eval_sklearn(model_path: Path, X, y):
-    clf = joblib.load(model_path)
-    y_pred = clf.predict(X)
-    return y_pred
-
-def eval_keras(model_path: Path, X, y):
-    import tensorflow as tf
-    X = np.asarray(X, dtype="int32")  # RNNのEmbedding前提でint32に
-    model = tf.keras.models.load_model(model_path)
-    y_prob = model.predict(X, verbose=0)
-    y_pred = y_prob.argmax(axis=1)
-    return y_pred
-
 def metrics_dict(y_true, y_pred):
     acc = accuracy_score(y_true, y_pred)
     pw, rw, fw, _ = precision_recall_fscore_support(y_true, y_pred, average="weighted", zero_division=0)
@@ -81,16 +54,17 @@ def main():
         name = m["name"]; kind = m["kind"]
         model_path = Path(m["model_path"])
         data_path  = Path(m["data_path"])
+        if is_bundle(bundle_path_for(model_path.parent, name)):
+            model_path = bundle_path_for(model_path.parent, name)  # models/<name>.bundle を優先
         try:
             X, y, meta = load_test(data_path)
             start = now_jst_str()
             print(f"[START] {start}  {name}  (n={meta['n']}, test_N={len(y)})")
-            if kind == "sklearn":
-                y_pred = eval_sklearn(model_path, X, y)
-            elif kind == "keras":
-                y_pred = eval_keras(model_path, X, y)
-            else:
-                raise ValueError(f"unknown kind: {kind}")
+            # ロード・推論は eval-noise.py と共通（バンドルは n / label_map を確認、KNN 索引・NumPy LSTM を使う）。
+            # モデル・test X.npy が変わっていなければ eval/pred_cache の y_pred を使う
+            y_pred, _scores, hit, _key = predict({**m, "model_path": str(model_path)}, X, data_path, n_classes_of(meta))
+            if hit:
+                print(f"[CACHE] {name}  y_pred from eval/pred_cache")
 
             md = metrics_dict(y, y_pred)
             done = now_jst_str()
@@ -122,6 +96,9 @@ def main():
     with open(out, "w") as f:
         json.dump({"started_at": start_all, "finished_at": now_jst_str(), "results": all_results}, f, indent=2)
     print(f"[SAVED] {out}")
+    # label は data_path（merged/<label>-<n>gram）から導出して結果ストアにも記録
+    n = record_results(all_results)
+    print(f"[STORE] eval/store  rows={n}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,212 @@
+# -*- coding: utf-8 -*-
+# features/eval_common.py
+# eval-noise.py / eval-stream.py / eval-cascade.py / eval-sampling.py で共有する固定モデル群・データ参照・推論（推論キャッシュ経由）。
+from pathlib import Path
+import json
+import numpy as np
+import joblib
+from sklearn.metrics import precision_recall_fscore_support, confusion_matrix
+from knn_index import wrap_if_indexed
+from lstm_numpy import npz_path_for, current_npz, load_npz_model
+from model_bundle import is_bundle, load_bundle, with_bundles
+from pred_cache import cached_predict, CACHE_DIR
+from results_store import STORE_DIR
+from score_curves import sklearn_scores
+from datetime import datetime
+from zoneinfo import ZoneInfo
+
+JST = ZoneInfo("Asia/Tokyo")
+
+# モデル⇔n（モデルは固定 / data_path は実行時に label から組み立て）
+# models/<name>.bundle（features/model_bundle.py）があればそちらを使い、ここに無いバンドルは manifest の n で足す
+MODEL_FILES = [
+    {"name": "rnn_40", "kind": "keras",   "model_path": "models/lstm.model.keras",  "n": 40},
+    {"name": "dt_35",  "kind": "sklearn", "model_path": "models/dt_35.joblib",      "n": 35},
+    {"name": "svm_50", "kind": "sklearn", "model_path": "models/svm_50_all.joblib", "n": 50},
+    {"name": "mlp_10", "kind": "sklearn", "model_path": "models/mlp_10.joblib",     "n": 10},
+    {"name": "knn_5",  "kind": "sklearn", "model_path": "models/knn_5.joblib",      "n": 5},
+]
+MODELS = with_bundles(MODEL_FILES)
+
+DATA_ROOT = "dataset/npy/merged"  # 変更しない（最小変更方針）
+SYNTHETIC_VOCAB = 512  # x86_64 の syscall 番号は 0..~460
+
+def now_jst_str():
+    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+def now_jst_iso():
+    return datetime.now(JST).isoformat()
+
+def build_data_path(label: str, n: int) -> Path:
+    # <DATA_ROOT>/<label>-<n>gram
+    return Path(DATA_ROOT) / f"{label}-{n}gram"
+
+def load_test(merged_dir: Path):
+    meta = json.load(open(merged_dir / "meta.json"))
+    X = np.load(merged_dir / "test" / "X.npy", mmap_mode="r", allow_pickle=False)
+    y = np.load(merged_dir / "test" / "y.npy", allow_pickle=False)
+    assert X.shape[1] == meta["n"], f"n mismatch: X.shape[1]={X.shape[1]} vs meta.n={meta['n']}"
+    return X, y, meta
+
+def load_frame_index(merged_dir: Path, n_rows: int):
+    d = merged_dir / "test"
+    missing = [f for f in ("idx0.npy", "pod.npy", "t_ns.npy") if not (d / f).exists()]
+    if missing:
+        raise FileNotFoundError(f"{d}/{missing[0]} がありません（make_dataset.py で作り直すとフレーム索引が出力されます）")
+    idx0 = np.load(d / "idx0.npy"); pod = np.load(d / "pod.npy"); t_ns = np.load(d / "t_ns.npy")
+    assert idx0.shape[0] == pod.shape[0] == t_ns.shape[0] == n_rows, "frame index と X の行数が不一致"
+    return idx0, pod, t_ns
+
+def malicious_score(scores, source, mal_id, y_pred_bin):
+    """悪性クラスのスコアを [0,1] に寄せる（decision_function はシグモイド）。無ければ 0/1 判定"""
+    if scores is None or scores.shape[1] <= mal_id:
+        return y_pred_bin.astype(np.float64), "decision"
+    s = scores[:, mal_id].astype(np.float64)
+    if source == "decision_function":
+        return 1.0 / (1.0 + np.exp(-s)), "sigmoid(decision_function)"
+    return s, source or "softmax"
+
+def n_classes_of(meta: dict) -> int:
+    return max(int(v) for v in meta["label_map"].values()) + 1
+
+def load_sklearn(model_path: Path):
+    # バンドルは mmap でロード（索引も同梱）。ばらの .joblib は KNN の索引があれば前段に挟む
+    if is_bundle(model_path):
+        return load_bundle(model_path).model
+    return wrap_if_indexed(joblib.load(model_path), model_path)
+
+def eval_sklearn(model_path: Path, X, n_classes: int = 0):
+    # 戻り値: (y_pred, scores, info) / スコアは n_classes を渡したとき（--scores）だけ計算（追加の推論コストになるため）
+    clf = load_sklearn(model_path)
+    y_pred = clf.predict(X)
+    if not n_classes:
+        return y_pred, None, {}
+    scores, source = sklearn_scores(clf, X, n_classes)
+    return y_pred, scores, {"score_source": source}
+
+class KerasSoftmax:
+    """tf.keras モデルを NumpyLSTM と同じ predict_proba / predict の形にする"""
+
+    def __init__(self, model):
+        self.model = model
+
+    def predict_proba(self, X):
+        return self.model.predict(np.asarray(X, dtype="int32"), verbose=0)  # RNNのEmbedding前提でint32に
+
+    def predict(self, X):
+        return self.predict_proba(X).argmax(axis=1)
+
+def load_keras(model_path: Path, backend: str = "auto", threads: int = 0):
+    """
+    keras モデルをロードする。バンドル / 今の .keras から書き出した <model>.npz があれば TensorFlow を import せず NumPy LSTM、
+    無ければ（または backend="tf"）TensorFlow。backend="numpy" で NumPy LSTM が無ければ FileNotFoundError。
+    戻り値: (predict_proba / predict を持つモデル, 使った backend)
+    """
+    model_path = Path(model_path)
+    if is_bundle(model_path):
+        return load_bundle(model_path).model, "numpy"
+    npz = None if backend == "tf" else current_npz(model_path)
+    if npz is not None:
+        return load_npz_model(npz), "numpy"
+    if backend == "numpy":
+        raise FileNotFoundError(f"{npz_path_for(model_path)} が無いか {model_path} と一致しません")
+    import tensorflow as tf
+    if threads:
+        tf.config.threading.set_intra_op_parallelism_threads(threads)
+        tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+    return KerasSoftmax(tf.keras.models.load_model(model_path)), "tensorflow"
+
+def eval_keras(model_path: Path, X):
+    # 戻り値: (y_pred, softmax 出力, info)
+    model, _ = load_keras(model_path)
+    y_prob = model.predict_proba(X)
+    return y_prob.argmax(axis=1), y_prob, {"score_source": "softmax"}
+
+def load_predictor(kind: str, model_path: Path, backend: str = "auto", threads: int = 1):
+    """
+    推論を繰り返す側（bench-infer.py / model_server.py）向けにモデルを 1 回だけロードする。
+    戻り値: (predict(X) 関数, 使った backend, keras の語彙数 or None)
+    """
+    if kind == "sklearn":
+        return load_sklearn(model_path).predict, "sklearn", None
+    if kind != "keras":
+        raise ValueError(f"unknown kind: {kind}")
+    model, used = load_keras(model_path, backend, threads)
+    if used == "numpy":
+        vocab = next((model.w[f"L{i}_embeddings"].shape[0] for i, s in enumerate(model.layers)
+                      if s["kind"] == "Embedding"), None)
+        return model.predict, "numpy", vocab
+    tf_model = model.model
+    vocab = next((l.input_dim for l in tf_model.layers if hasattr(l, "input_dim")), None)
+    # model.predict は呼び出しごとのオーバーヘッドが大きく小バッチのレイテンシを測れないため predict_on_batch
+    return (lambda X: tf_model.predict_on_batch(np.asarray(X, dtype="int32")).argmax(axis=1)), "tensorflow", vocab
+
+def synthetic_windows(rows: int, n: int, vocab: int, seed: int):
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, vocab, size=(rows, n), dtype=np.int16)
+
+def predict(m: dict, X, data_path: Path, n_classes: int, *, scores=False, no_cache=False, refresh=False,
+            cache_dir=CACHE_DIR, store_dir=STORE_DIR):
+    """
+    MODELS の 1 要素で X を推論（推論キャッシュ経由）。
+    戻り値: (y_pred, scores|None, hit, info)  info は score_source などキャッシュの key
+    """
+    kind = m["kind"]; model_path = Path(m["model_path"])
+    if is_bundle(model_path):
+        # 推論（キャッシュ参照）の前に n / label_map の約束事を確認（manifest だけ読む）
+        load_bundle(model_path).check(json.load(open(data_path / "meta.json")))
+    if kind == "sklearn":
+        infer = lambda: eval_sklearn(model_path, X, n_classes if scores else 0)
+    elif kind == "keras":
+        infer = lambda: eval_keras(model_path, X)
+    else:
+        raise ValueError(f"unknown kind: {kind}")
+    if no_cache:
+        y_pred, sc, info = infer()
+        return y_pred, sc, False, info
+    # モデル・test X.npy が変わっていなければキャッシュ済みの y_pred / scores を使う（推論しない）
+    y_pred, sc, hit, info = cached_predict(model_path, data_path / "test" / "X.npy", X.shape[0], infer,
+                                           cache_dir=cache_dir, store_dir=store_dir, refresh=refresh,
+                                           need_scores=scores)
+    if scores and "score_source" not in info and kind == "keras":
+        info = {**info, "score_source": "softmax"}
+    return y_pred, sc, hit, info
+
+def bin_metrics(y_true_bin: np.ndarray, y_pred_bin: np.ndarray):
+    # confusion matrix
+    tn, fp, fn, tp = confusion_matrix(y_true_bin, y_pred_bin, labels=[0,1]).ravel()
+    # P/R/F1（ゼロ割は0扱い）
+    p, r, f1, _ = precision_recall_fscore_support(
+        y_true_bin, y_pred_bin, average="binary", zero_division=0
+    )
+    # FPR
+    fpr = fp / (fp + tn) if (fp + tn) > 0 else 0.0
+    return {
+        "precision": float(p),
+        "recall": float(r),     # = TPR
+        "f1": float(f1),
+        "fpr": float(fpr),
+        "tp": int(tp), "fp": int(fp), "fn": int(fn), "tn": int(tn),
+        "support_pos": int(tp + fn),
+        "support_neg": int(tn + fp),
+    }
+
+def find_malicious_id(label_map: dict) -> tuple[int, str]:
+    """
+    label_map から悪性ラベルの id を推定する。
+    優先順位: キーに 'xmrig' / 'xmr' / 'noise' / 'malicious' / 'mining'
+    該当なしなら ValueError
+    """
+    patterns = ["xmrig", "xmr", "noise", "malicious", "mining"]
+    # まずキーで探す
+    for k, v in label_map.items():
+        lk = k.lower()
+        if any(p in lk for p in patterns):
+            return int(v), k
+    # 次に逆引き（値→キー）でもう一度（保険）
+    inv = {int(v): k for k, v in label_map.items()}
+    for vid, k in inv.items():
+        lk = k.lower()
+        if any(p in lk for p in patterns):
+            return vid, k
+    raise ValueError("malicious_id not found in label_map")
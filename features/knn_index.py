@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+# features/knn_index.py
+# KNN の前段に置く「完全一致 n-gram ルックアップ索引」
+#   - 学習時: 学習窓のユニーク集合を整数キーに詰め、実際の KNN で 1 回だけ近傍投票を計算して保存
+#   - 推論時: 既知の窓は索引から即答、未知の窓だけ本物の KNN に問い合わせる
+# 索引の予測は fitted KNN 自身の出力を記録したものなので、元モデルの predict と完全一致する。
+# 索引には元モデル（.joblib）の sha256 を入れる。current_index() は今のモデルと一致する索引だけを返すので、
+# 学習し直したモデルの横に古い索引が残っていても推論には使われない。
+from pathlib import Path
+import hashlib
+import numpy as np
+
+INDEX_SUFFIX = ".index.npz"
+
+
+def index_path_for(model_path) -> Path:
+    """models/knn_5.joblib → models/knn_5.index.npz"""
+    p = Path(model_path)
+    return p.with_name(p.stem + INDEX_SUFFIX)
+
+
+def model_sha256(model_path) -> str:
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def current_index(model_path):
+    """<model>.index.npz が今の <model>.joblib から作ったものならそのパス、無い・古いなら None（記録の無い古い形式も古い扱い）"""
+    ip = index_path_for(model_path)
+    if not ip.exists():
+        return None
+    with np.load(ip, allow_pickle=False) as z:
+        src = str(z["model_sha256"]) if "model_sha256" in z.files else None
+    if src != model_sha256(model_path):
+        print(f"[WARN ] {ip} は {model_path} から作った索引ではないので使いません（train-knn.py で作り直す）")
+        return None
+    return ip
+
+
+def key_bits(max_id: int) -> int:
+    return max(1, int(max_id).bit_length())
+
+
+def key_fits(n: int, bits: int) -> bool:
+    """n 要素 × bits ビットが uint64 1 個に収まるか"""
+    return bits * n <= 64
+
+
+def pack_keys(X, bits: int):
+    """
+    [N, n] の整数窓を uint64 キーに詰める（1要素 bits ビット）。
+    戻り値: (keys[N], ok[N])  ok=False は語彙外（負値 or 2**bits 以上）で索引に載り得ない行
+    """
+    X = np.asarray(X)
+    n = X.shape[1]
+    if not key_fits(n, bits):
+        raise ValueError(f"key does not fit in 64 bits: n={n}, bits={bits}")
+    ok = ((X >= 0) & (X < (1 << bits))).all(axis=1)
+    Xu = np.where(ok[:, None], X, 0).astype(np.uint64)
+    keys = np.zeros(X.shape[0], dtype=np.uint64)
+    for j in range(n):
+        keys = (keys << np.uint64(bits)) | Xu[:, j]
+    return keys, ok
+
+
+def build_index(knn, Xtr, batch: int = 65536):
+    """
+    学習窓のユニーク集合に対して KNN を 1 回だけ実行し、
+    近傍ラベル票（votes）と予測ラベル（pred）をキー昇順で保持する。
+    窓がキーに収まらない（n × bits > 64）ときは索引を作らず None を返す。
+    """
+    Xtr = np.asarray(Xtr)
+    bits = key_bits(Xtr.max() if Xtr.size else 0)
+    if not key_fits(Xtr.shape[1], bits):
+        return None
+    keys, ok = pack_keys(Xtr, bits)
+    # 語彙外の行はキー 0 に潰れているので載せない（本物の全 0 窓の答えを横取りしないように）
+    ukeys, first = np.unique(keys[ok], return_index=True)
+    Xu = Xtr[ok][first]
+
+    classes = np.asarray(knn.classes_)
+    votes = np.zeros((Xu.shape[0], classes.shape[0]), dtype=np.uint16)
+    y_fit = np.asarray(knn._y)  # classes_ へのインデックス（sklearn の内部表現）
+    for s in range(0, Xu.shape[0], batch):
+        xb = Xu[s:s + batch]
+        nbr = knn.kneighbors(xb, return_distance=False)
+        lab = y_fit[nbr]
+        for c in range(classes.shape[0]):
+            votes[s:s + batch, c] = (lab == c).sum(axis=1)
+    # weights="uniform" の predict は票の最多クラス（同数なら classes_ の小さい方）なので、近傍探索をもう一度回さない
+    pred = classes[votes.argmax(axis=1)]
+
+    return {
+        "keys": ukeys,
+        "votes": votes,
+        "pred": pred,
+        "classes": classes,
+        "bits": np.int64(bits),
+        "n": np.int64(Xtr.shape[1]),
+        "k": np.int64(knn.n_neighbors),
+    }
+
+
+def save_index(path, index) -> None:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    np.savez(path, **index)
+
+
+def save_index_for(model_path, index):
+    """
+    保存済みの model_path の隣に索引をモデルの sha256 付きで書く。index が None なら古い索引を消す。
+    戻り値: 書いた索引のパス（None なら書いていない）
+    """
+    ip = index_path_for(model_path)
+    if index is None:
+        if ip.exists():
+            ip.unlink()
+            print(f"[INDEX] removed stale {ip}")
+        return None
+    save_index(ip, {**index, "model_sha256": np.array(model_sha256(model_path))})
+    return ip
+
+
+def load_index(path):
+    with np.load(path, allow_pickle=False) as z:
+        return {k: z[k] for k in z.files}
+
+
+class KNNLookup:
+    """
+    KNN と完全一致索引の合成。predict / predict_proba は元 KNN と同じ形で返す。
+    last_hit_rate に直近呼び出しの索引ヒット率を残す（ログ用）。
+    """
+
+    def __init__(self, knn, index):
+        self.knn = knn
+        self.index = index
+        self.classes_ = index["classes"]
+        self.bits = int(index["bits"])
+        self.n = int(index["n"])
+        self.last_hit_rate = 0.0
+
+    def _lookup(self, X):
+        X = np.asarray(X)
+        if X.shape[1] != self.n:
+            raise ValueError(f"n mismatch: X.shape[1]={X.shape[1]} vs index.n={self.n}")
+        keys, ok = pack_keys(X, self.bits)
+        ukeys = self.index["keys"]
+        pos = np.searchsorted(ukeys, keys)
+        pos_c = np.minimum(pos, max(ukeys.shape[0] - 1, 0))
+        hit = ok & (pos < ukeys.shape[0])
+        if ukeys.shape[0]:
+            hit &= ukeys[pos_c] == keys
+        self.last_hit_rate = float(hit.mean()) if hit.size else 0.0
+        return X, pos_c, hit
+
+    def predict(self, X):
+        X, pos, hit = self._lookup(X)
+        out = np.empty(X.shape[0], dtype=self.classes_.dtype)
+        out[hit] = self.index["pred"][pos[hit]]
+        miss = ~hit
+        if miss.any():
+            out[miss] = self.knn.predict(X[miss])
+        return out
+
+    def predict_proba(self, X):
+        X, pos, hit = self._lookup(X)
+        k = float(self.index["k"])
+        out = np.empty((X.shape[0], self.classes_.shape[0]), dtype=np.float64)
+        out[hit] = self.index["votes"][pos[hit]] / k
+        miss = ~hit
+        if miss.any():
+            out[miss] = self.knn.predict_proba(X[miss])
+        return out
+
+
+def wrap_if_indexed(clf, model_path):
+    """model_path の隣に今のモデルから作った索引があれば KNNLookup で包む（無い・古いならそのまま返す）"""
+    if not hasattr(clf, "kneighbors"):
+        return clf
+    ip = current_index(model_path)
+    return KNNLookup(clf, load_index(ip)) if ip is not None else clf
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+# features/lstm_numpy.py
+# Keras の LSTM モデル（Embedding → LSTM → LSTM → Dense, train-rnn.py 構成）を
+# .npz に書き出し、TensorFlow を import せずに NumPy だけで推論する。
+#
+# 書き出し（TensorFlow が必要なのはここだけ）:
+#   python features/lstm_numpy.py --model models/lstm.model.keras [--out models/lstm.model.npz]
+#                                 [--verify dataset/npy/merged/15m-1000hz-40gram]
+# 推論:
+#   from lstm_numpy import load_npz_model
+#   m = load_npz_model("models/lstm.model.npz"); prob = m.predict_proba(X)
+# .npz には書き出し元 .keras の sha256 を入れる。current_npz() は .keras と一致する .npz だけを返すので、
+# 学習し直した .keras の横に古い .npz が残っていても推論には使われない。
+from pathlib import Path
+import argparse, hashlib, json
+import numpy as np
+
+SUPPORTED = ("Embedding", "LSTM", "Dropout", "Dense")
+
+
+def npz_path_for(model_path) -> Path:
+    """models/lstm.model.keras → models/lstm.model.npz"""
+    return Path(model_path).with_suffix(".npz")
+
+
+def source_sha256(model_path) -> str:
+    h = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def current_npz(model_path):
+    """
+    <model>.npz が今の <model>.keras から書き出したものならそのパス、無い・古いなら None。
+    .keras が無ければ .npz が唯一の実体なのでそのまま使う。書き出し元の記録が無い古い形式の .npz は古い扱い。
+    """
+    npz = npz_path_for(model_path)
+    if not npz.exists():
+        return None
+    if not Path(model_path).is_file():
+        return npz
+    with np.load(npz, allow_pickle=False) as z:
+        src = str(z["source_sha256"]) if "source_sha256" in z.files else None
+    if src != source_sha256(model_path):
+        print(f"[WARN ] {npz} は {model_path} から書き出したものではないので使いません"
+              f"（python features/lstm_numpy.py --model {model_path} で書き出し直す）")
+        return None
+    return npz
+
+
+# ---------------------------
+# 活性化
+# ---------------------------
+
+def _sigmoid(x):
+    return 1.0 / (1.0 + np.exp(-x))
+
+def _softmax(x):
+    z = x - x.max(axis=-1, keepdims=True)
+    e = np.exp(z)
+    return e / e.sum(axis=-1, keepdims=True)
+
+ACTIVATIONS = {
+    "relu": lambda x: np.maximum(x, 0),
+    "tanh": np.tanh,
+    "sigmoid": _sigmoid,
+    "linear": lambda x: x,
+    "softmax": _softmax,
+}
+
+
+def _act(name: str):
+    if name not in ACTIVATIONS:
+        raise ValueError(f"unsupported activation: {name}")
+    return ACTIVATIONS[name]
+
+
+# ---------------------------
+# 書き出し（Keras → npz）
+# ---------------------------
+
+def export_keras(model_path, out_path) -> Path:
+    import tensorflow as tf
+    model = tf.keras.models.load_model(model_path)
+    layers = []
+    arrays = {}
+    for i, layer in enumerate(model.layers):
+        kind = type(layer).__name__
+        if kind not in SUPPORTED:
+            raise ValueError(f"unsupported layer: {kind} ({layer.name})")
+        cfg = layer.get_config()
+        spec = {"kind": kind, "name": layer.name}
+        w = layer.get_weights()
+        if kind == "Embedding":
+            arrays[f"L{i}_embeddings"] = w[0].astype(np.float32)
+        elif kind == "LSTM":
+            if cfg.get("go_backwards") or cfg.get("stateful"):
+                raise ValueError(f"unsupported LSTM option in {layer.name}")
+            spec.update(units=int(cfg["units"]),
+                        activation=cfg["activation"],
+                        recurrent_activation=cfg["recurrent_activation"],
+                        return_sequences=bool(cfg["return_sequences"]))
+            arrays[f"L{i}_kernel"] = w[0].astype(np.float32)
+            arrays[f"L{i}_recurrent_kernel"] = w[1].astype(np.float32)
+            arrays[f"L{i}_bias"] = (w[2] if len(w) > 2 else np.zeros(w[0].shape[1])).astype(np.float32)
+        elif kind == "Dense":
+            spec.update(activation=cfg["activation"])
+            arrays[f"L{i}_kernel"] = w[0].astype(np.float32)
+            arrays[f"L{i}_bias"] = (w[1] if len(w) > 1 else np.zeros(w[0].shape[1])).astype(np.float32)
+        layers.append(spec)
+
+    out_path = Path(out_path)
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    shape = getattr(model, "input_shape", None)
+    input_len = int(shape[1]) if isinstance(shape, tuple) and len(shape) == 2 and shape[1] is not None else -1
+    np.savez(out_path, layers=np.array(json.dumps(layers)), source_sha256=np.array(source_sha256(model_path)),
+             input_len=np.int64(input_len), **arrays)
+    return out_path
+
+
+# ---------------------------
+# 推論（NumPy のみ）
+# ---------------------------
+
+class NumpyLSTM:
+    """
+    Keras と同じゲート順 (i, f, c, o) の LSTM を時間方向にループし、
+    入力射影 x·W + b は全時刻まとめて 1 回の行列積で計算する。
+    """
+
+    def __init__(self, layers, arrays, n=None):
+        self.layers = layers
+        self.w = arrays
+        self.n = n  # 学習時の窓長（Keras の input_shape。不明なら None）
+        for spec in layers:
+            for key in ("activation", "recurrent_activation"):
+                if key in spec:
+                    _act(spec[key])  # 未対応の活性化はロード時点で弾く
+
+    def _lstm(self, i, spec, x):
+        W = self.w[f"L{i}_kernel"]; U = self.w[f"L{i}_recurrent_kernel"]; b = self.w[f"L{i}_bias"]
+        u = spec["units"]
+        act = _act(spec["activation"]); ract = _act(spec["recurrent_activation"])
+        B, T, _ = x.shape
+        xw = x @ W + b  # [B, T, 4u]
+        h = np.zeros((B, u), dtype=np.float32)
+        c = np.zeros((B, u), dtype=np.float32)
+        seq = np.empty((B, T, u), dtype=np.float32) if spec["return_sequences"] else None
+        for t in range(T):
+            z = xw[:, t, :] + h @ U
+            ig = ract(z[:, :u]); fg = ract(z[:, u:2*u])
+            cg = act(z[:, 2*u:3*u]); og = ract(z[:, 3*u:])
+            c = fg * c + ig * cg
+            h = og * act(c)
+            if seq is not None:
+                seq[:, t, :] = h
+        return seq if seq is not None else h
+
+    def _forward(self, X):
+        x = np.asarray(X)
+        for i, spec in enumerate(self.layers):
+            kind = spec["kind"]
+            if kind == "Embedding":
+                x = self.w[f"L{i}_embeddings"][x.astype(np.int64)]
+            elif kind == "LSTM":
+                x = self._lstm(i, spec, x)
+            elif kind == "Dense":
+                x = _act(spec["activation"])(x @ self.w[f"L{i}_kernel"] + self.w[f"L{i}_bias"])
+            # Dropout は推論時は恒等
+        return x
+
+    def predict_proba(self, X, batch_size: int = 4096):
+        X = np.asarray(X)
+        outs = [self._forward(X[s:s + batch_size]) for s in range(0, X.shape[0], batch_size)]
+        if not outs:
+            n_out = self.w[f"L{len(self.layers) - 1}_kernel"].shape[1]
+            return np.empty((0, n_out), dtype=np.float32)
+        return np.concatenate(outs, axis=0)
+
+    def predict(self, X, batch_size: int = 4096):
+        return self.predict_proba(X, batch_size).argmax(axis=1)
+
+
+def load_npz_model(path) -> NumpyLSTM:
+    with np.load(path, allow_pickle=False) as z:
+        layers = json.loads(str(z["layers"]))
+        n = int(z["input_len"]) if "input_len" in z.files else -1
+        arrays = {k: z[k] for k in z.files if k not in ("layers", "source_sha256", "input_len")}
+    return NumpyLSTM(layers, arrays, n if n > 0 else None)
+
+
+# ---------------------------
+# CLI（書き出し + 任意で Keras との一致確認）
+# ---------------------------
+
+def main():
+    ap = argparse.ArgumentParser(description="Export Keras LSTM weights to .npz for TensorFlow-free inference")
+    ap.add_argument("--model", default="models/lstm.model.keras")
+    ap.add_argument("--out", default="", help="保存先（未指定なら <model>.npz）")
+    ap.add_argument("--verify", default="", help="merged ディレクトリを与えると test 先頭で Keras と出力を比較")
+    ap.add_argument("--verify-n", type=int, default=20000)
+    args = ap.parse_args()
+
+    out = export_keras(args.model, args.out or npz_path_for(args.model))
+    print("Saved:", out, f"({out.stat().st_size} bytes)")
+
+    if args.verify:
+        import tensorflow as tf
+        base = Path(args.verify)
+        X = np.load(base/"test"/"X.npy", mmap_mode="r", allow_pickle=False)[:args.verify_n]
+        X = np.asarray(X, dtype="int32")
+        p_tf = tf.keras.models.load_model(args.model).predict(X, verbose=0)
+        p_np = load_npz_model(out).predict_proba(X)
+        print(f"[VERIFY] N={len(X)}  max_abs_diff={float(np.abs(p_tf - p_np).max()):.3e}"
+              f"  argmax_agreement={float((p_tf.argmax(1) == p_np.argmax(1)).mean()):.6f}")
+
+if __name__ == "__main__":
+    main()
@@ -107,5 +107,8 @@ for entry in "${pairs[@]}"; do
   eval_one "${label}"
 done
 
+# ===== フェーズ3: 図・平均表（結果ストアから、入力が変わったものだけ） =====
+python3 features/plot_results.py || echo "[WARN] plot_results.py failed (matplotlib?)"
+
 echo "========== ALL DONE =========="
 
@@ -8,6 +8,8 @@ make_dataset.py
       * フレームサイズ = n（設定ファイルで指定）
       * ストライド = 1（固定）
       * 前後 10% のイベントを内部的に削除（trim）
+      * 入力 paths の glob は .jsonl / .jsonl.gz / ブロック圧縮セグメントを区別なく拾う（features/raw_reader.py）。
+        ブロック索引付きなら trim で捨てる先頭・末尾のブロックは展開せずに飛ばす
       * フレームは raw から全生成、先頭から target_frames を採用（不足は警告）
       * 分割は元論文準拠の 3分割（train:56%, val:14%, test:30%）
         - 実装は 70/30 → train を 80/20 に再分割
@@ -16,7 +18,20 @@ make_dataset.py
       * 出力:
           dataset/npy/workloads/<workload>/n{n}-gram/{train,val,test}/{X.npy,y.npy}, meta.json
           dataset/npy/merged/<cfg_basename>/{train,val,test}/{X.npy,y.npy}, meta.json
+          （merged の meta.json には split 間・ワークロード間で完全一致する窓の割合 overlap も書く。features/ngram_overlap.py）
+          各 split には X の行と 1 対 1 のフレーム索引も置く（pod ごとのストリーム評価 eval-stream.py 用）:
+            idx0.npy（raw イベント列でのフレーム開始位置）, pod.npy（pod 連番）, t_ns.npy（フレーム末尾イベントの UNIX ns）
+      * グループ化（任意, framing.group_by: [tid] など）: trim 後のイベントを (segment, group_by のフィールド, 時刻)
+        の 1 回の lexsort で並べ替え、グループ（例: pod 内のスレッド）ごとに連続した列からフレームを作る。
+        グループ境界はセグメント境界と同じく跨がない。フレームは末尾イベントの元の時刻順に戻してから選抜・分割し、
+        同じグループで前の split とイベントを共有する val/test フレームは追加で捨てる。pod.npy はグループ連番になる
       * ログは標準出力のみ。最後に生成ファイル一覧と shape を表示
+      * 追加特徴（任意, 設定の features キー）:
+          histogram: 窓ごとの syscall 頻度ヒストグラム（密な語彙）を累積和の差分で O(N·V) 計算
+                     → {split}/H.npy（dense）または H.npz（CSR, scipy 必須）
+          subgram:   窓内 k-サブグラム（例: 2,3-gram）のハッシュ化カウント。多項式ローリングハッシュを
+                     基底系列全体で 1 回だけベクトル計算し、窓ごとのカウントはそこから集計
+                     → {split}/S.npz（CSR, scipy 必須）
 """
 
 from __future__ import annotations
@@ -31,11 +46,19 @@ from typing import Any, Dict, List, Tuple, Optional
 
 import numpy as np
 
+from raw_reader import discover as discover_raw, iter_lines as iter_raw_lines, read_blocks, select_blocks, ts_to_ns
+from ngram_overlap import analyze as analyze_overlap
+
 try:
     import yaml  # type: ignore
 except Exception:
     yaml = None  # YAMLが無い場合はJSON設定のみ対応
 
+try:
+    import scipy.sparse as sp  # type: ignore
+except Exception:
+    sp = None  # CSR 出力（features.*.format: csr）時のみ必要
+
 # ---------------------------
 # ユーティリティ
 # ---------------------------
@@ -174,53 +197,111 @@ def parse_timestamp(rec: Any) -> Optional[float]:
                     pass
     return None
 
-def load_raw_events(paths: List[str]) -> Tuple[List[int], List[int], List[Optional[float]]]:
+def parse_raw_rec(line: bytes, group_fields: Tuple[str, ...] = ()
+                  ) -> Optional[Tuple[int, int, Optional[float], Any, Tuple[Any, ...]]]:
+    """
+    raw の 1 行 → (syscall_id, segment_key, timestamp, ts の生値, group_fields の値)。使えない行は None。
+    ts の生値（ISO 文字列など。並べ替えには使わない）はフレーム時刻 t_ns の算出用。
+    group_fields は "tid" / "k8s.pod" のようなドット区切りのキー（無ければ None）。
+    """
+    line = line.strip()
+    if not line:
+        return None
+    try:
+        rec = json.loads(line)
+    except Exception:
+        # もし単なる数値のみの行ならそのまま扱う
+        if line.isdigit():
+            return (int(line), 0, None, None, (None,) * len(group_fields))
+        return None
+    sc = parse_syscall_id(rec)
+    if sc is None:
+        return None
+    grp = tuple(get_in(rec, f.split(".")) for f in group_fields) if isinstance(rec, dict) else (None,) * len(group_fields)
+    return (sc, parse_segment_key(rec), parse_timestamp(rec), rec.get("ts") if isinstance(rec, dict) else None, grp)
+
+def parse_raw_line(line: bytes) -> Optional[Tuple[int, int, Optional[float]]]:
     """
-    JSONL を複数読み込み、syscall_id と segment_key, timestamp の列を返す。
+    raw の 1 行 → (syscall_id, segment_key, timestamp)。使えない行は None。
     """
-    files: List[str] = []
-    for p in paths:
-        files.extend(glob.glob(p))
-    if not files:
+    r = parse_raw_rec(line)
+    return r[:3] if r is not None else None
+
+def load_raw_events(paths: List[str], group_fields: Tuple[str, ...] = ()
+                    ) -> Tuple[List[int], List[int], List[Optional[float]], List[Any], List[Tuple[Any, ...]]]:
+    """
+    JSONL（.jsonl / .jsonl.gz / ブロック圧縮セグメント）を複数読み込み、
+    syscall_id, segment_key, timestamp（並べ替えキー）, ts の生値, group_fields の値 の列を返す。
+    """
+    sources = discover_raw(paths)
+    if not sources:
         warn(f"INPUT - no files matched: {paths}")
-        return [], [], []
+        return [], [], [], [], []
 
-    all_recs: List[Tuple[int,int,Optional[float]]] = []
-    for fp in sorted(files):
+    all_recs: List[Tuple[int,int,Optional[float],Any,Tuple[Any, ...]]] = []
+    for src in sources:
         try:
-            with open(fp, "r", encoding="utf-8") as f:
-                for line in f:
-                    line = line.strip()
-                    if not line:
-                        continue
-                    try:
-                        rec = json.loads(line)
-                    except Exception:
-                        # もし単なる数値のみの行ならそのまま扱う
-                        if line.isdigit():
-                            sc = int(line)
-                            all_recs.append((sc, 0, None))
-                        continue
-                    sc = parse_syscall_id(rec)
-                    if sc is None:
-                        continue
-                    seg = parse_segment_key(rec)
-                    ts = parse_timestamp(rec)
-                    all_recs.append((sc, seg, ts))
+            for line in iter_raw_lines([src]):
+                r = parse_raw_rec(line, group_fields)
+                if r is not None:
+                    all_recs.append(r)
         except Exception as e:
-            warn(f"INPUT - failed to read {fp}: {e}")
+            warn(f"INPUT - failed to read {src.key}: {e}")
 
     if not all_recs:
-        return [], [], []
+        return [], [], [], [], []
 
     # タイムスタンプがあればそれでソート（無い行は元順を保つように補助キー付与）
-    indexed = [(i, sc, seg, ts if ts is not None else float(i)) for i, (sc, seg, ts) in enumerate(all_recs)]
+    indexed = [(i, sc, seg, ts if ts is not None else float(i), raw, grp)
+               for i, (sc, seg, ts, raw, grp) in enumerate(all_recs)]
     indexed.sort(key=lambda x: x[3])
 
     sc_list = [x[1] for x in indexed]
     seg_list = [x[2] for x in indexed]
     ts_list  = [x[3] for x in indexed]  # float
-    return sc_list, seg_list, ts_list
+    raw_list = [x[4] for x in indexed]
+    grp_list = [x[5] for x in indexed]
+    return sc_list, seg_list, ts_list, raw_list, grp_list
+
+def load_raw_events_trimmed(paths: List[str], head_pct: float = 0.10, tail_pct: float = 0.10,
+                            group_fields: Tuple[str, ...] = ()
+                            ) -> Tuple[List[int], List[int], List[Any], List[Tuple[Any, ...]], int, int, int]:
+    """
+    load_raw_events + trim_head_tail。
+    戻り値: (trim 後の syscall_id, segment_key, ts の生値, group_fields の値, events_total, start, end)
+    全入力がブロック索引付き（全行が整数 sc と索引に記録）なら、索引の行数から trim 範囲を先に決め、
+    先頭・末尾の捨てる範囲に完全に含まれるブロックは展開も parse もしない。
+    読んだ範囲に数値タイムスタンプ（並べ替えが起きる）や捨てられる行があれば全量読み込みに戻す。
+    """
+    sources = discover_raw(paths)
+    if sources and all(s.all_sc_int() for s in sources):
+        blocks = [b for s in sources for b in s.blocks()]
+        E_total = sum(b.count for b in blocks)
+        start, end = trim_head_tail(E_total, head_pct=head_pct, tail_pct=tail_pct)
+        keep, skipped = select_blocks(blocks, skip_head=start, skip_tail=E_total - end)
+        sc_l: List[int] = []; seg_l: List[int] = []; raw_l: List[Any] = []; grp_l: List[Tuple[Any, ...]] = []
+        exact = True
+        for buf in read_blocks(keep):
+            for line in buf.split(b"\n"):
+                if not line.strip():
+                    continue
+                r = parse_raw_rec(line, group_fields)
+                if r is None or r[2] is not None:
+                    exact = False; break
+                sc_l.append(r[0]); seg_l.append(r[1]); raw_l.append(r[3]); grp_l.append(r[4])
+            if not exact:
+                break
+        if exact and len(sc_l) == sum(b.count for b in keep):
+            lo = start - skipped
+            info(f"INPUT  - block index: read {len(keep)}/{len(blocks)} blocks, skipped {skipped} head lines")
+            hi = lo + (end - start)
+            return sc_l[lo:hi], seg_l[lo:hi], raw_l[lo:hi], grp_l[lo:hi], E_total, start, end
+        warn("INPUT  - block index not usable for trim (numeric ts or unparsable lines), reading all")
+
+    sc_list, seg_list, _ts, raw_list, grp_list = load_raw_events(paths, group_fields)
+    E_total = len(sc_list)
+    start, end = trim_head_tail(E_total, head_pct=head_pct, tail_pct=tail_pct)
+    return sc_list[start:end], seg_list[start:end], raw_list[start:end], grp_list[start:end], E_total, start, end
 
 # ---------------------------
 # 前処理・フレーミング
@@ -259,6 +340,153 @@ def slide_windows(seq: np.ndarray, seg: np.ndarray, n: int) -> Tuple[np.ndarray,
     idx0 = np.nonzero(ok_mask)[0].astype(np.int64)  # 各フレームの開始位置
     return frames, idx0
 
+def pod_ids(seg: np.ndarray) -> np.ndarray:
+    """segment_key（pod/job 等のハッシュ）→ 出現順の連番（int32）。ハッシュは実行ごとに変わり得るため連番で保存"""
+    if seg.shape[0] == 0:
+        return np.empty((0,), dtype=np.int32)
+    _u, first, inv = np.unique(seg, return_index=True, return_inverse=True)
+    rank = np.empty(first.shape[0], dtype=np.int32)
+    rank[np.argsort(first, kind="stable")] = np.arange(first.shape[0], dtype=np.int32)
+    return rank[inv.reshape(-1)]
+
+def group_codes(vals: List[Any]) -> np.ndarray:
+    """group_by の 1 フィールド分の値 → 並べ替え用の整数コード（全部 int なら値そのもの、それ以外は文字列の順位）"""
+    if all(isinstance(v, int) and not isinstance(v, bool) for v in vals):
+        return np.asarray(vals, dtype=np.int64)
+    _u, inv = np.unique(np.asarray(["" if v is None else str(v) for v in vals]), return_inverse=True)
+    return inv.reshape(-1).astype(np.int64)
+
+def group_order(seg: np.ndarray, grp: List[Tuple[Any, ...]], n_fields: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    時刻順のイベント列を (segment, group_by の各フィールド) でまとめる並べ替え。
+    lexsort は安定なので 1 回のソートでグループ内は元の時刻順のまま（O(N log N)、グループ数ぶんのループ無し）。
+    戻り値:
+      order: 並べ替え後の位置 → 元の位置（int64）
+      gid:   並べ替え後の各イベントのグループ連番（int32。グループ最初のイベントの出現順）
+    """
+    N = seg.shape[0]
+    if N == 0:
+        return np.empty((0,), dtype=np.int64), np.empty((0,), dtype=np.int32)
+    keys = [pod_ids(seg).astype(np.int64)] + [group_codes([g[j] for g in grp]) for j in range(n_fields)]
+    order = np.lexsort(keys[::-1]).astype(np.int64)  # 最後のキーが第 1 キー
+    head = np.zeros(N, dtype=bool)
+    head[0] = True
+    for k in keys:
+        ks = k[order]
+        head[1:] |= ks[1:] != ks[:-1]
+    first = order[head]  # 各グループ最初のイベントの元の位置（並べ替え順）
+    rank = np.empty(first.shape[0], dtype=np.int32)
+    rank[np.argsort(first, kind="stable")] = np.arange(first.shape[0], dtype=np.int32)
+    return order, rank[np.cumsum(head) - 1]
+
+def frame_times(ts_raw: List[Any], idx0: np.ndarray, n: int) -> np.ndarray:
+    """各フレームの末尾イベント（判定が確定する時点）の ts → UNIX ns（不明は NO_TS）"""
+    if idx0.shape[0] == 0:
+        return np.empty((0,), dtype=np.int64)
+    vals = [ts_raw[i] for i in (idx0 + (n - 1)).tolist()]
+    return ts_to_ns([b"" if v is None else str(v).encode() for v in vals])
+
+def count_dtype(n: int) -> np.dtype:
+    """窓内カウント（最大 n）を保持できる最小の符号なし整数型"""
+    if n <= np.iinfo(np.uint8).max:
+        return np.dtype(np.uint8)
+    if n <= np.iinfo(np.uint16).max:
+        return np.dtype(np.uint16)
+    return np.dtype(np.uint32)
+
+def subgram_max_count(n: int, ks: List[int]) -> int:
+    """全 k が 1 つのバケット空間を共有するので、1 バケットのカウントは最大 Σ_k (n-k+1)"""
+    return sum(n - k + 1 for k in ks if k <= n)
+
+def window_histograms(seq: np.ndarray, starts: np.ndarray, n: int, vocab: np.ndarray) -> np.ndarray:
+    """
+    窓 [s, s+n) ごとの syscall 頻度ヒストグラムを累積和の差分で計算する。
+      - 列は vocab（昇順の syscall ID）+ 末尾に語彙外（OOV）列
+      - 各列について基底系列全体の cumsum を 1 回取り、C[s+n] - C[s] を全窓まとめて引く
+      - 計算量 O(E·V)（E=系列長, V=語彙数）で n に依存しない
+    戻り値: shape = [len(starts), V+1]
+    """
+    V = int(vocab.shape[0])
+    H = np.zeros((starts.shape[0], V + 1), dtype=count_dtype(n))
+    if starts.shape[0] == 0 or seq.shape[0] == 0:
+        return H
+    # 密な列番号へ写像（語彙外は V）
+    if V:
+        pos = np.minimum(np.searchsorted(vocab, seq), V - 1)
+        col = np.where(vocab[pos] == seq, pos, V)
+    else:
+        col = np.full(seq.shape, V, dtype=np.int64)
+
+    cs = np.zeros(seq.shape[0] + 1, dtype=np.int64)
+    ends = starts + n
+    for v in np.unique(col):
+        np.cumsum(col == v, out=cs[1:])
+        H[:, v] = cs[ends] - cs[starts]
+    return H
+
+HASH_P = np.uint64(0x100000001B3)   # 多項式ハッシュの基数（FNV prime）
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+def rolling_subgram_buckets(seq: np.ndarray, k: int, buckets: int) -> np.ndarray:
+    """
+    位置 t から始まる k-サブグラムのハッシュバケットを系列全体について返す（長さ E-k+1）。
+    h_t = sum_j (seq[t+j]+1) * P^(k-1-j)  (mod 2^64) を k 回のベクトル積和で計算し、
+    k で種を変えて混ぜたのち buckets で割る（異なる k が同じ列空間を共有）。
+    """
+    L = seq.shape[0] - k + 1
+    if L <= 0:
+        return np.empty((0,), dtype=np.int64)
+    s1 = seq.astype(np.uint64) + np.uint64(1)
+    with np.errstate(over="ignore"):
+        h = np.full(L, np.uint64(k), dtype=np.uint64)
+        for j in range(k):
+            h = h * HASH_P + s1[j:j + L]
+        h = (h ^ (h >> np.uint64(31))) * HASH_MIX
+        h ^= h >> np.uint64(29)
+    return (h % np.uint64(buckets)).astype(np.int64)
+
+def window_subgram_counts(seq: np.ndarray, starts: np.ndarray, n: int, ks: List[int], buckets: int,
+                          chunk: int = 65536) -> Any:
+    """
+    窓 [s, s+n) に含まれる k-サブグラム（開始位置 s..s+n-k）のバケット別カウントを CSR で返す。
+    ハッシュは rolling_subgram_buckets で系列ごとに 1 回だけ計算し、窓側はその列を切り出して
+    数えるだけなので、窓ごとに k 要素をハッシュし直す O(N·n·k) は発生しない。
+    """
+    if sp is None:
+        raise RuntimeError("scipy がありません。`pip install scipy` を実行してください。")
+    dt = count_dtype(subgram_max_count(n, ks))
+    F = starts.shape[0]
+    pieces = []
+    bks = [(k, rolling_subgram_buckets(seq, k, buckets)) for k in ks if k <= n]
+    for c0 in range(0, max(F, 1), chunk):
+        st = starts[c0:c0 + chunk]
+        cols = [b[st[:, None] + np.arange(n - k + 1)[None, :]] for k, b in bks]
+        cols = np.concatenate(cols, axis=1) if cols else np.empty((st.shape[0], 0), dtype=np.int64)
+        rows = np.repeat(np.arange(st.shape[0]), cols.shape[1])
+        m = sp.csr_matrix((np.ones(rows.shape[0], dtype=dt), (rows, cols.ravel())),
+                          shape=(st.shape[0], buckets))
+        m.sum_duplicates()
+        pieces.append(m)
+    return sp.vstack(pieces, format="csr") if pieces else sp.csr_matrix((0, buckets), dtype=dt)
+
+def resolve_vocab(spec: Any, seqs: List[np.ndarray]) -> np.ndarray:
+    """
+    features.histogram.vocab の解決:
+      auto（既定） : 全ワークロードの trim 後系列に現れる syscall ID の和集合
+      int V        : 0..V-1 の連番
+      list[int]    : 明示リスト（それ以外は OOV 列に集計）
+    """
+    if spec is None or spec == "auto":
+        non_empty = [q for q in seqs if q.size]
+        if not non_empty:
+            return np.empty((0,), dtype=np.int64)
+        return np.unique(np.concatenate(non_empty)).astype(np.int64)
+    if isinstance(spec, int):
+        return np.arange(spec, dtype=np.int64)
+    if isinstance(spec, list):
+        return np.unique(np.asarray(spec, dtype=np.int64))
+    raise ValueError(f"features.histogram.vocab が不正です: {spec!r}")
+
 def take_head(frames: np.ndarray, idx0: np.ndarray, target: int) -> Tuple[np.ndarray, np.ndarray]:
     if frames.shape[0] <= target:
         return frames, idx0
@@ -310,6 +538,28 @@ def split_70_30_then_80_20_with_guard(frames: np.ndarray, idx0: np.ndarray, n: i
             "val":   (val_frames,   val_idx0),
             "test":  (test_frames,  test_idx0)}
 
+def drop_group_overlap(splits: Dict[str, Tuple[np.ndarray, np.ndarray]], gid: np.ndarray, n: int
+                       ) -> Tuple[Dict[str, Tuple[np.ndarray, np.ndarray]], Dict[str, int]]:
+    """
+    グループ化モード用の追加ガード。フレームを時刻順に並べ直すと、境界の前後 n フレームを捨てても
+    同じグループの後の split のフレームが前の split のフレームとイベントを共有し得る。
+    グループごとに前の split までに使った最後のイベント位置を np.maximum.at で求め、
+    それ以前から始まる val/test のフレームを捨てる。戻り値: (splits, split ごとの破棄数)
+    """
+    last = np.full(int(gid.max()) + 1 if gid.shape[0] else 0, -1, dtype=np.int64)
+    out: Dict[str, Tuple[np.ndarray, np.ndarray]] = {}
+    dropped: Dict[str, int] = {}
+    for split in ["train", "val", "test"]:
+        X, idx = splits[split]
+        if split != "train" and idx.shape[0]:
+            keep = idx > last[gid[idx]]
+            dropped[split] = int((~keep).sum())
+            X, idx = X[keep], idx[keep]
+        if idx.shape[0]:
+            np.maximum.at(last, gid[idx], idx + (n - 1))
+        out[split] = (X, idx)
+    return out, dropped
+
 # ---------------------------
 # 保存 & サマリ
 # ---------------------------
@@ -323,6 +573,36 @@ def save_split_npy(root: Path, split: str, X: np.ndarray, y: np.ndarray) -> List
     paths.extend([x_path, y_path])
     return paths
 
+FRAME_INDEX_FILES = ("idx0.npy", "pod.npy", "t_ns.npy")
+IDX0_BASE_GROUPED = "grouped (trim 後のイベントをグループごとに並べ替えた列の位置 + trim 先頭の位置)"
+
+def save_frame_index(root: Path, split: str, idx0: np.ndarray, pod: np.ndarray, t_ns: np.ndarray) -> List[Tuple[str, Tuple[int, ...]]]:
+    """X.npy の行と 1 対 1 のフレーム索引（idx0 / pod / t_ns）を保存"""
+    out = []
+    for name, arr in zip(FRAME_INDEX_FILES, (idx0.astype(np.int64), pod.astype(np.int32), t_ns.astype(np.int64))):
+        path = root / split / name
+        np_save(path, arr)
+        out.append((str(path), tuple(arr.shape)))
+    return out
+
+def save_feature(root: Path, split: str, name: str, arr: Any, fmt: str) -> Path:
+    """追加特徴を X.npy の隣に保存（dense: <name>.npy / csr: <name>.npz）"""
+    ensure_dir(root / split)
+    if fmt == "csr":
+        if sp is None:
+            raise RuntimeError("scipy がありません。`pip install scipy` を実行するか format: dense を指定してください。")
+        path = root / split / f"{name}.npz"
+        sp.save_npz(str(path), arr if sp.issparse(arr) else sp.csr_matrix(arr))
+    else:
+        path = root / split / f"{name}.npy"
+        np.save(str(path), arr.toarray() if (sp is not None and sp.issparse(arr)) else arr)
+    return path
+
+def concat_feature(parts: List[Any]) -> Any:
+    if sp is not None and any(sp.issparse(a) for a in parts):
+        return sp.vstack([sp.csr_matrix(a) for a in parts], format="csr")
+    return np.concatenate(parts, axis=0)
+
 def print_output_summary(paths_and_shapes: List[Tuple[str, Tuple[int, ...]]]) -> None:
     print("===== OUTPUT SUMMARY =====")
     for p, shp in paths_and_shapes:
@@ -333,7 +613,8 @@ def print_output_summary(paths_and_shapes: List[Tuple[str, Tuple[int, ...]]]) ->
 # メイン処理（1ワークロード → 保存）
 # ---------------------------
 
-def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) -> Dict[str, Any]:
+def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path,
+                     group_by: Tuple[str, ...] = ()) -> Dict[str, Any]:
     workload = wl_cfg["workload"]
     name = wl_cfg.get("name", workload)
     label_id = int(wl_cfg["label_id"])
@@ -342,24 +623,37 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
 
     info(f"INPUT  - workload={workload}, target_frames={target_frames}, paths={paths}")
 
-    sc_list, seg_list, ts_list = load_raw_events(paths)
-    E_total = len(sc_list)
+    sc_trim, seg_trim, ts_trim, grp_trim, E_total, start, end = load_raw_events_trimmed(
+        paths, head_pct=0.10, tail_pct=0.10, group_fields=group_by)
     if E_total == 0:
         warn(f"INPUT  - workload={workload}, no events")
         # 空データとして処理継続
         frames = np.empty((0, cfg_n), dtype=np.int64)
         idx0 = np.empty((0,), dtype=np.int64)
+        sc_np = np.empty((0,), dtype=np.int64)
+        pod_ev = np.empty((0,), dtype=np.int32)
     else:
-        # trim
-        start, end = trim_head_tail(E_total, head_pct=0.10, tail_pct=0.10)
+        # trim（load_raw_events_trimmed で適用済み）
         info(f"TRIM   - workload={workload}, events_total={E_total}, trim=[{start},{end}) -> {end-start}")
 
-        sc_np = np.asarray(sc_list[start:end], dtype=np.int64)
-        seg_np = np.asarray(seg_list[start:end], dtype=np.int64)
+        sc_np = np.asarray(sc_trim, dtype=np.int64)
+        seg_np = np.asarray(seg_trim, dtype=np.int64)
 
         # フレーミング（stride=1） + ラベル跨ぎ禁止
         F_possible = max(0, sc_np.shape[0] - cfg_n + 1)
-        frames_all, idx_all = slide_windows(sc_np, seg_np, cfg_n)
+        if group_by:
+            # グループごとに連続させた列で窓を切る（グループ境界もセグメント境界として扱う）
+            order, pod_ev = group_order(seg_np, grp_trim, len(group_by))
+            sc_np = sc_np[order]
+            ts_trim = [ts_trim[i] for i in order.tolist()]
+            frames_all, idx_all = slide_windows(sc_np, pod_ev, cfg_n)
+            # 末尾イベント（判定が確定する時点）の元の時刻順へ戻す（先頭採用・分割は時刻順のまま）
+            fo = np.argsort(order[idx_all + (cfg_n - 1)], kind="stable")
+            frames_all, idx_all = frames_all[fo], idx_all[fo]
+            info(f"GROUP  - workload={workload}, group_by={list(group_by)}, groups={int(pod_ev.max()) + 1}")
+        else:
+            pod_ev = pod_ids(seg_np)
+            frames_all, idx_all = slide_windows(sc_np, seg_np, cfg_n)
         F_valid = frames_all.shape[0]
         info(f"FRAME  - workload={workload}, n={cfg_n}, F_possible={F_possible}, F_valid={F_valid}")
 
@@ -373,6 +667,9 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
 
     # 分割（70/30 → 80/20, ガード=n）
     splits = split_70_30_then_80_20_with_guard(frames, idx0, cfg_n)
+    if group_by and pod_ev.shape[0]:
+        splits, dropped = drop_group_overlap(splits, pod_ev, cfg_n)
+        info(f"GUARD  - workload={workload}, group overlap dropped={dropped}")
     out_root = base_out_dir / "dataset" / "npy" / "workloads" / workload / f"n{cfg_n}-gram"
     ensure_dir(out_root)
 
@@ -387,8 +684,14 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
         "guard_frames": cfg_n,
         "target_frames": target_frames,
         "splits": {},
+        "frame_index": {"files": list(FRAME_INDEX_FILES), "idx0_base": IDX0_BASE_GROUPED if group_by else "raw (trim 前の全イベント列)",
+                        "pods": int(pod_ev.max()) + 1 if pod_ev.shape[0] else 0,
+                        "t_ns": "フレーム末尾イベントの UNIX ns（不明は int64 最小値）"},
     }
+    if group_by:
+        meta["frame_index"]["group_by"] = list(group_by)
 
+    frame_index: Dict[str, Tuple[np.ndarray, np.ndarray, np.ndarray]] = {}
     for split_name in ["train", "val", "test"]:
         X, _idx = splits[split_name]
         y = np.full((X.shape[0],), label_id, dtype=np.int64)
@@ -397,6 +700,12 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
             produced_paths.append((str(p), tuple(np.load(str(p)).shape)))
         meta["splits"][split_name] = {"count": int(X.shape[0])}
 
+        # フレームの元順序（pod ごとのストリーム再生用）: raw イベント列での開始位置 / pod 連番 / 末尾イベント時刻
+        fi = (_idx + start, pod_ev[_idx] if _idx.shape[0] else np.empty((0,), dtype=np.int32),
+              frame_times(ts_trim, _idx, cfg_n))
+        frame_index[split_name] = fi
+        produced_paths.extend(save_frame_index(out_root, split_name, *fi))
+
         # ログ（shape）
         info(f"SAVE   - workload={workload}, split={split_name}, X.shape={X.shape}, y.shape={y.shape}")
 
@@ -409,8 +718,66 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
         "paths": produced_paths,
         "split_counts": {k: int(v[0].shape[0]) for k, v in splits.items()},
         "split_arrays": splits,  # 後でマージに使う
+        "frame_index": frame_index,  # split → (idx0[raw 基準], pod, t_ns)
+        "pods": int(pod_ev.max()) + 1 if pod_ev.shape[0] else 0,
+        "seq": sc_np,            # 追加特徴（窓の開始位置 idx0 は sc_np 基準。グループ化時は並べ替え後の列）
+        "out_root": out_root,
+        "features": {},          # name -> {"format", "splits": {split: array}, "meta"}
     }
 
+# ---------------------------
+# 追加特徴（features キー）
+# ---------------------------
+
+def build_window_features(per_wl: List[Dict[str, Any]], fname: str, stem: str, fmt: str,
+                          feat_meta: Dict[str, Any], fn) -> List[Tuple[str, Tuple[int, ...]]]:
+    """fn(seq, idx0) で split ごとの特徴を作り、ワークロード別に保存（マージ用に保持）"""
+    feat_meta = {"file": f"{stem}.npz" if fmt == "csr" else f"{stem}.npy", "format": fmt, **feat_meta}
+    produced: List[Tuple[str, Tuple[int, ...]]] = []
+    for d in per_wl:
+        per_split = {}
+        for split in ["train", "val", "test"]:
+            _X, idx0 = d["split_arrays"][split]
+            F = fn(d["seq"], idx0)
+            per_split[split] = F
+            path = save_feature(d["out_root"], split, stem, F, fmt)
+            produced.append((str(path), tuple(F.shape)))
+        d["features"][fname] = {"name": stem, "format": fmt, "splits": per_split, "meta": feat_meta}
+        update_meta_features(d["out_root"] / "meta.json", {fname: feat_meta})
+    return produced
+
+def build_histogram_features(cfg_n: int, per_wl: List[Dict[str, Any]], hist_cfg: Dict[str, Any]) -> List[Tuple[str, Tuple[int, ...]]]:
+    """全ワークロード共通の語彙でヒストグラムを計算し、ワークロード別に保存"""
+    fmt = str(hist_cfg.get("format", "dense"))
+    vocab = resolve_vocab(hist_cfg.get("vocab", "auto"), [d["seq"] for d in per_wl])
+    info(f"FEAT   - histogram: vocab={vocab.shape[0]} (+OOV), format={fmt}")
+    feat_meta = {"vocab": [int(v) for v in vocab], "oov_column": int(vocab.shape[0]),
+                 "dtype": str(count_dtype(cfg_n))}
+    return build_window_features(per_wl, "histogram", "H", fmt, feat_meta,
+                                 lambda seq, idx0: window_histograms(seq, idx0, cfg_n, vocab))
+
+def build_subgram_features(cfg_n: int, per_wl: List[Dict[str, Any]], sub_cfg: Dict[str, Any]) -> List[Tuple[str, Tuple[int, ...]]]:
+    """k-サブグラムのハッシュ化カウント（CSR）を計算し、ワークロード別に保存"""
+    ks = sub_cfg.get("k", [2, 3])
+    ks = sorted({int(k) for k in (ks if isinstance(ks, list) else [ks])})
+    buckets = int(sub_cfg.get("buckets", 4096))
+    if not ks or ks[0] < 1 or buckets < 1:
+        raise ValueError(f"features.subgram が不正です: k={ks}, buckets={buckets}")
+    skipped = [k for k in ks if k > cfg_n]
+    if skipped:
+        warn(f"FEAT   - subgram: k={skipped} > n={cfg_n} は窓に収まらないため無視します")
+    info(f"FEAT   - subgram: k={ks}, buckets={buckets}, format=csr")
+    feat_meta = {"k": ks, "buckets": buckets, "hash": "poly64(P=0x100000001B3, seed=k)+mix % buckets",
+                 "dtype": str(count_dtype(subgram_max_count(cfg_n, ks)))}
+    return build_window_features(per_wl, "subgram", "S", "csr", feat_meta,
+                                 lambda seq, idx0: window_subgram_counts(seq, idx0, cfg_n, ks, buckets))
+
+def update_meta_features(meta_path: Path, feats: Dict[str, Any]) -> None:
+    with meta_path.open("r", encoding="utf-8") as f:
+        meta = json.load(f)
+    meta.setdefault("features", {}).update(feats)
+    save_json(meta_path, meta)
+
 # ---------------------------
 # マージ（設定ファイル名ベース）
 # ---------------------------
@@ -418,7 +785,8 @@ def process_workload(cfg_n: int, wl_cfg: Dict[str, Any], base_out_dir: Path) ->
 def merge_and_save(cfg_basename: str,
                    cfg_n: int,
                    per_wl: List[Dict[str, Any]],
-                   base_out_dir: Path) -> List[Tuple[str, Tuple[int, ...]]]:
+                   base_out_dir: Path,
+                   group_by: Tuple[str, ...] = ()) -> List[Tuple[str, Tuple[int, ...]]]:
     out_root = base_out_dir / "dataset" / "npy" / "merged" / cfg_basename
     ensure_dir(out_root)
 
@@ -432,6 +800,16 @@ def merge_and_save(cfg_basename: str,
         "label_map": {d["workload"]: d["label_id"] for d in per_wl},
         "workloads": [d["workload"] for d in per_wl],
     }
+    # pod 連番はワークロードごとにずらして merged 全体で一意にする
+    pod_offset, off = {}, 0
+    for d in per_wl:
+        pod_offset[d["workload"]] = off; off += d["pods"]
+    merged_meta["frame_index"] = {"files": list(FRAME_INDEX_FILES),
+                                  "idx0_base": IDX0_BASE_GROUPED if group_by else "raw (ワークロードごとの trim 前イベント列)",
+                                  "pod_offset": pod_offset, "pods": off,
+                                  "t_ns": "フレーム末尾イベントの UNIX ns（不明は int64 最小値）"}
+    if group_by:
+        merged_meta["frame_index"]["group_by"] = list(group_by)
 
     for split in ["train", "val", "test"]:
         # 順番は設定ファイルの記載順
@@ -456,8 +834,33 @@ def merge_and_save(cfg_basename: str,
             produced_paths.append((str(p), tuple(np.load(str(p)).shape)))
         merged_meta["splits"][split] = {"count": int(X_merged.shape[0])}
 
+        # フレーム索引も同じ順序で縦結合
+        fis = [d["frame_index"][split] for d in per_wl]
+        if fis:
+            produced_paths.extend(save_frame_index(
+                out_root, split,
+                np.concatenate([f[0] for f in fis]),
+                np.concatenate([f[1].astype(np.int32) + pod_offset[d["workload"]] for f, d in zip(fis, per_wl)]),
+                np.concatenate([f[2] for f in fis])))
+
+        # 追加特徴も同じ順序で縦結合
+        for fname, f0 in (per_wl[0]["features"].items() if per_wl else []):
+            F_merged = concat_feature([d["features"][fname]["splits"][split] for d in per_wl])
+            path = save_feature(out_root, split, f0["name"], F_merged, f0["format"])
+            produced_paths.append((str(path), tuple(F_merged.shape)))
+            merged_meta.setdefault("features", {})[fname] = f0["meta"]
+
         info(f"MERGE  - split={split}, total_shape={X_merged.shape}, classes={len(per_wl)}")
 
+    # split 間（train → val/test）とワークロード間で完全一致する窓の割合（features/ngram_overlap.py）
+    splits_X = {s: np.load(str(out_root / s / "X.npy"), mmap_mode="r") for s in ["train", "val", "test"]}
+    splits_y = {s: np.load(str(out_root / s / "y.npy"), mmap_mode="r") for s in ["train", "val", "test"]}
+    ov = analyze_overlap(splits_X, splits_y, merged_meta["label_map"])
+    merged_meta["overlap"] = ov
+    for pair, r in ov["pairs"].items():
+        per = ", ".join(f"{k}={v['in_ref']:.4f}" for k, v in r["per_class"].items())
+        info(f"OVERLAP- {pair}: in_ref={r['in_ref']:.4f} (other_class={r['in_ref_other_class']:.4f}) [{per}]")
+
     save_json(out_root / "meta.json", merged_meta)
     produced_paths.append((str(out_root / "meta.json"), ()))
     return produced_paths
@@ -483,12 +886,25 @@ def main(argv: List[str]) -> int:
         error("config.framing.n が必要です。")
         return 2
     n = int(framing["n"])
+    group_by = framing.get("group_by") or []
+    if isinstance(group_by, str):
+        group_by = [g.strip() for g in group_by.split(",")]
+    if not isinstance(group_by, list) or not all(isinstance(g, str) and g for g in group_by):
+        error(f"config.framing.group_by はフィールド名のリストにしてください: {framing.get('group_by')!r}")
+        return 2
+    group_by = tuple(group_by)
 
     workloads = cfg.get("workloads", [])
     if not workloads:
         error("config.workloads が空です。")
         return 2
 
+    features = cfg.get("features") or {}
+    unknown = sorted(set(features) - {"histogram", "subgram"})
+    if unknown:
+        error(f"config.features に未対応のキーがあります: {unknown}")
+        return 2
+
     # 出力先ベース名（設定ファイル名）
     cfg_basename_raw = sanitize_basename(cfg_path.name)
     merged_dir = Path("dataset") / "npy" / "merged" / cfg_basename_raw
@@ -510,6 +926,8 @@ def main(argv: List[str]) -> int:
 
     info(f"START  - config={cfg_path}, cfg_basename={cfg_basename_raw}, n={n}")
     info("POLICY - trim=10%/10%, stride=1, split=56/14/30 (70/30→80/20), guard=n")
+    if group_by:
+        info(f"POLICY - group_by={list(group_by)} (segment + fields, frames per group, overlap guard per group)")
 
     # label_id 重複チェック
     label_ids = [int(w["label_id"]) for w in workloads]
@@ -523,12 +941,18 @@ def main(argv: List[str]) -> int:
     # 各ワークロード処理
     per_wl_results: List[Dict[str, Any]] = []
     for wl in workloads:
-        res = process_workload(n, wl, base_out_dir)
+        res = process_workload(n, wl, base_out_dir, group_by)
         per_wl_results.append(res)
         all_produced.extend(res["paths"])
 
+    # 追加特徴
+    if "histogram" in features:
+        all_produced.extend(build_histogram_features(n, per_wl_results, features.get("histogram") or {}))
+    if "subgram" in features:
+        all_produced.extend(build_subgram_features(n, per_wl_results, features.get("subgram") or {}))
+
     # マージ
-    merged_paths = merge_and_save(cfg_basename_raw, n, per_wl_results, base_out_dir)
+    merged_paths = merge_and_save(cfg_basename_raw, n, per_wl_results, base_out_dir, group_by)
     all_produced.extend(merged_paths)
 
     # バリデーション（基本）
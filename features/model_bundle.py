@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# features/model_bundle.py
+# モデルバンドル: models/<name>.bundle/ に 1 モデル分をまとめ、入力の約束事（n・dtype・語彙・label_map・学習データ）を添える。
+#   manifest.json  : format/version, name, kind（sklearn | keras）, estimator, n, input_dtype, vocab, label_map, classes,
+#                    dataset（学習に使った merged ディレクトリと train の sha256）, files（各ファイルの sha256）, 各ライブラリの版
+#   model.joblib   : 推定器（sklearn）または NumPy LSTM（lstm_numpy.NumpyLSTM）。圧縮しない joblib なので
+#                    joblib.load(mmap_mode="r") で配列がファイルの読み取り専用 mmap になり、同じバンドルを読む
+#                    プロセス間でページキャッシュを共有する（ロード時に配列をコピー・展開しない）
+#   index.joblib   : KNN の完全一致索引（knn_index.build_index の dict。あれば KNNLookup で前段に挟む）
+# ロード時は manifest だけを読み、check() で merged の meta.json と n / label_map を突き合わせる（不一致は ContractError）。
+# モデル本体は最初に .model を触ったときに読む。
+# 使い方:
+#   python features/model_bundle.py pack --model models/dt_35.joblib --merged dataset/npy/merged/15m-1000hz-35gram
+#   python features/model_bundle.py pack --model models/lstm.model.keras --merged ... --name rnn_40
+#   python features/model_bundle.py inspect models/*.bundle
+#   python features/model_bundle.py check models/dt_35.bundle --merged dataset/npy/merged/15m-30pct-r1-2-35gram
+# Python から:
+#   from model_bundle import load_bundle
+#   b = load_bundle("models/dt_35.bundle"); b.check(meta); y = b.model.predict(X)
+from pathlib import Path
+import argparse, json, platform, sys
+from datetime import datetime, timezone
+import numpy as np
+
+FORMAT = "model-bundle"
+VERSION = 1
+SUFFIX = ".bundle"
+MANIFEST = "manifest.json"
+MODEL_FILE = "model.joblib"
+INDEX_FILE = "index.joblib"
+
+
+class ContractError(ValueError):
+    """バンドルの入力の約束事とデータセットが合わない"""
+
+
+def is_bundle(path) -> bool:
+    return (Path(path) / MANIFEST).is_file()
+
+
+def bundle_path_for(model_dir, name: str) -> Path:
+    """models, dt_35 → models/dt_35.bundle"""
+    return Path(model_dir) / f"{name}{SUFFIX}"
+
+
+def train_vocab(X, chunk: int = 1 << 20):
+    """train の窓に出る syscall ID（昇順）。bincount をチャンクごとに足すだけなので O(N)"""
+    counts = np.zeros(1, dtype=np.int64)
+    for s in range(0, X.shape[0], chunk):
+        xb = np.asarray(X[s:s + chunk]).ravel()
+        if xb.size == 0:
+            continue
+        if xb.min() < 0:
+            raise ValueError("負の syscall ID があります")
+        c = np.bincount(xb.astype(np.int64))
+        if c.shape[0] > counts.shape[0]:
+            counts = np.pad(counts, (0, c.shape[0] - counts.shape[0]))
+        counts[:c.shape[0]] += c
+    return np.flatnonzero(counts)
+
+
+def model_input_width(model):
+    """モデルが学習した窓長（sklearn の n_features_in_ / NumpyLSTM の n）。分からなければ None"""
+    w = getattr(model, "n_features_in_", None)
+    if w is None:
+        w = getattr(model, "n", None)
+    return int(w) if w is not None else None
+
+
+def malicious_id(label_map: dict):
+    """eval_common.find_malicious_id と同じ推定。悪性ラベルが無ければ None"""
+    from eval_common import find_malicious_id
+    try:
+        return find_malicious_id(label_map)[0]
+    except ValueError:
+        return None
+
+
+# ---------------------------
+# 書き出し
+# ---------------------------
+
+def save_bundle(out, model, *, name: str, kind: str, data_path, index=None, source=None) -> Path:
+    """
+    model（学習済み推定器 / NumpyLSTM）を data_path（学習に使った merged ディレクトリ）の約束事と一緒に書き出す。
+    out が既にあれば中身を置き換える。
+    """
+    import joblib, sklearn
+    from results_store import file_sha256, train_dataset_hash
+    out = Path(out); data_path = Path(data_path)
+    meta = json.load(open(data_path / "meta.json"))
+    Xtr = np.load(data_path / "train" / "X.npy", mmap_mode="r", allow_pickle=False)
+    n = int(meta["n"])
+    if Xtr.shape[1] != n:
+        raise ValueError(f"X width {Xtr.shape[1]} != meta.n={n} ({data_path})")
+    width = model_input_width(model)
+    if width is not None and width != n:
+        raise ContractError(f"{name}: model input width {width} != dataset n={n} ({data_path})")
+    vocab = train_vocab(Xtr)
+
+    out.mkdir(parents=True, exist_ok=True)
+    for f in (MODEL_FILE, INDEX_FILE, MANIFEST):
+        (out / f).unlink(missing_ok=True)
+    joblib.dump(model, out / MODEL_FILE, compress=0)  # mmap_mode で読むため非圧縮
+    files = [MODEL_FILE]
+    if index is not None:
+        joblib.dump(index, out / INDEX_FILE, compress=0)
+        files.append(INDEX_FILE)
+
+    classes = getattr(model, "classes_", None)
+    manifest = {
+        "format": FORMAT, "version": VERSION, "name": name, "kind": kind,
+        "estimator": type(model).__name__, "n": n, "input_dtype": str(Xtr.dtype),
+        "vocab": [int(v) for v in vocab], "vocab_size": int(vocab[-1]) + 1 if vocab.size else 0,
+        "label_map": {k: int(v) for k, v in meta["label_map"].items()},
+        "classes": [int(c) for c in classes] if classes is not None else sorted(int(v) for v in meta["label_map"].values()),
+        "dataset": {"path": str(data_path), "train_sha256": train_dataset_hash(data_path),
+                    "train_rows": int(Xtr.shape[0]), "config_basename": meta.get("config_basename")},
+        "files": {f: file_sha256(out / f) for f in files},
+        "source": str(source) if source else None,
+        "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"),
+        "versions": {"python": platform.python_version(), "numpy": np.__version__,
+                     "sklearn": sklearn.__version__, "joblib": joblib.__version__},
+    }
+    if kind == "keras":
+        emb = next((model.w[f"L{i}_embeddings"].shape[0] for i, s in enumerate(model.layers)
+                    if s["kind"] == "Embedding"), None)
+        manifest["embedding_rows"] = int(emb) if emb is not None else None
+    with open(out / MANIFEST, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return out
+
+
+def pack(model_path, data_path, out=None, name=None) -> Path:
+    """既存のばらのモデル（.joblib + .index.npz / .keras の .npz）をバンドルにする"""
+    import joblib
+    from knn_index import current_index, load_index
+    from lstm_numpy import npz_path_for, current_npz, load_npz_model
+    model_path = Path(model_path)
+    name = name or model_path.name.split(".")[0]
+    out = Path(out) if out else bundle_path_for(model_path.parent, name)
+    if model_path.suffix == ".keras":
+        npz = npz_path_for(model_path)
+        if current_npz(model_path) is None or load_npz_model(npz).n is None:  # 窓長を記録していない書き出しも作り直す
+            from lstm_numpy import export_keras  # TensorFlow が必要
+            export_keras(model_path, npz)
+        return save_bundle(out, load_npz_model(npz), name=name, kind="keras", data_path=data_path, source=model_path)
+    ip = current_index(model_path)  # 別のモデルから作った古い索引は同梱しない
+    index = load_index(ip) if ip is not None else None
+    return save_bundle(out, joblib.load(model_path), name=name, kind="sklearn", data_path=data_path,
+                       index=index, source=model_path)
+
+
+# ---------------------------
+# 読み込み
+# ---------------------------
+
+class Bundle:
+    def __init__(self, path, mmap_mode="r"):
+        self.path = Path(path)
+        with open(self.path / MANIFEST, encoding="utf-8") as f:
+            self.manifest = json.load(f)
+        if self.manifest.get("format") != FORMAT or int(self.manifest.get("version", 0)) > VERSION:
+            raise ContractError(f"{self.path}: 未対応のバンドル（format={self.manifest.get('format')},"
+                                f" version={self.manifest.get('version')}）")
+        self.mmap_mode = mmap_mode
+        self._model = None
+
+    @property
+    def name(self) -> str:
+        return self.manifest["name"]
+
+    @property
+    def kind(self) -> str:
+        return self.manifest["kind"]
+
+    @property
+    def n(self) -> int:
+        return int(self.manifest["n"])
+
+    @property
+    def model(self):
+        """推定器（KNN は索引があれば KNNLookup）/ NumpyLSTM。配列は mmap（読み取り専用）"""
+        if self._model is None:
+            import joblib
+            model = joblib.load(self.path / MODEL_FILE, mmap_mode=self.mmap_mode)
+            if (self.path / INDEX_FILE).exists():
+                from knn_index import KNNLookup
+                model = KNNLookup(model, joblib.load(self.path / INDEX_FILE, mmap_mode=self.mmap_mode))
+            self._model = model
+        return self._model
+
+    def verify_files(self):
+        """manifest の sha256 とファイルの中身を突き合わせる（ContractError）"""
+        from results_store import file_sha256
+        for f, digest in self.manifest["files"].items():
+            if file_sha256(self.path / f) != digest:
+                raise ContractError(f"{self.path / f}: sha256 が manifest と一致しません")
+
+    def check(self, meta: dict, X=None, data_path=None):
+        """
+        merged の meta.json（と任意で test X / データセットのパス）とバンドルの約束事を突き合わせる。
+        n が違う・label_map の id の集合（クラス数）か悪性ラベルの id（find_malicious_id）が違えば ContractError。
+        ワークロード名だけの違い（学習用 xmrig-noise-15m-1000hz とノイズ評価用 xmrig 等）は警告のみ。戻り値: 参考情報の dict
+          oov_rows: 学習時の語彙に無い ID を含む行の割合（X を渡したとき）
+          same_dataset: 学習に使った train と同じか（data_path を渡したとき）
+        """
+        m = self.manifest
+        problems = []
+        if int(meta["n"]) != self.n:
+            problems.append(f"n: bundle={self.n} vs dataset={meta['n']}")
+        lm = {k: int(v) for k, v in meta.get("label_map", {}).items()}
+        out = {}
+        if sorted(lm.values()) != sorted(m["label_map"].values()):
+            problems.append(f"label ids: bundle={sorted(m['label_map'].values())} vs dataset={sorted(lm.values())}")
+        elif malicious_id(lm) != malicious_id(m["label_map"]):
+            problems.append(f"malicious id: bundle={malicious_id(m['label_map'])} vs dataset={malicious_id(lm)}")
+        elif lm != m["label_map"]:
+            out["label_names_differ"] = True
+            print(f"[WARN ] {self.path.name}: label_map の名前が違います（id は一致）: bundle={m['label_map']} vs dataset={lm}")
+        if X is not None:
+            if X.ndim != 2 or X.shape[1] != self.n:
+                problems.append(f"X shape {X.shape} (n={self.n})")
+            elif np.dtype(X.dtype).kind not in "iu":
+                problems.append(f"X dtype {X.dtype} (expected integer, bundle={m['input_dtype']})")
+            else:
+                vocab = np.asarray(m["vocab"], dtype=np.int64)
+                oov = np.zeros(X.shape[0], dtype=bool)
+                for s in range(0, X.shape[0], 1 << 18):
+                    xb = np.asarray(X[s:s + (1 << 18)], dtype=np.int64)
+                    pos = np.minimum(np.searchsorted(vocab, xb), max(vocab.shape[0] - 1, 0))
+                    oov[s:s + xb.shape[0]] = (vocab[pos] != xb).any(axis=1) if vocab.size else True
+                    if m.get("embedding_rows") is not None and int(xb.max(initial=0)) >= int(m["embedding_rows"]):
+                        problems.append(f"syscall ID {int(xb.max())} >= embedding rows {m['embedding_rows']}")
+                        break
+                out["oov_rows"] = float(oov.mean()) if oov.size else 0.0
+        if data_path is not None:
+            from results_store import train_dataset_hash
+            out["same_dataset"] = train_dataset_hash(data_path) == m["dataset"]["train_sha256"]
+        if problems:
+            raise ContractError(f"{self.path}: " + "; ".join(problems))
+        return out
+
+
+def load_bundle(path, mmap_mode="r") -> Bundle:
+    return Bundle(path, mmap_mode)
+
+
+def with_bundles(models, model_dir="models"):
+    """
+    MODELS 形式のリストのうち <model_dir>/<name>.bundle があるものはバンドルに差し替え、
+    リストに無いバンドルは manifest の name / kind / n で末尾に足す
+    """
+    out, seen = [], set()
+    for m in models:
+        b = bundle_path_for(model_dir, m["name"])
+        out.append({**m, "model_path": str(b)} if is_bundle(b) else m)
+        seen.add(m["name"])
+    for b in sorted(Path(model_dir).glob(f"*{SUFFIX}")) if Path(model_dir).is_dir() else []:
+        if not is_bundle(b):
+            continue
+        mf = json.load(open(b / MANIFEST, encoding="utf-8"))
+        if mf.get("name") not in seen:
+            out.append({"name": mf["name"], "kind": mf["kind"], "model_path": str(b), "n": int(mf["n"])})
+            seen.add(mf["name"])
+    return out
+
+
+# ---------------------------
+# CLI
+# ---------------------------
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Model bundles: mmap-loadable models with an input contract")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    p = sub.add_parser("pack", help="ばらのモデルファイルをバンドルにする")
+    p.add_argument("--model", required=True, help="models/<x>.joblib または models/<x>.keras")
+    p.add_argument("--merged", required=True, help="学習に使った merged ディレクトリ")
+    p.add_argument("--name", default="", help="バンドル名（既定: ファイル名の最初の . まで）")
+    p.add_argument("--out", default="", help="既定: <model のディレクトリ>/<name>.bundle")
+    p = sub.add_parser("inspect", help="manifest の要約を表示")
+    p.add_argument("bundles", nargs="+")
+    p = sub.add_parser("check", help="データセットとの約束事とファイルの sha256 を確認")
+    p.add_argument("bundle")
+    p.add_argument("--merged", required=True)
+    args = ap.parse_args(argv)
+
+    if args.cmd == "pack":
+        out = pack(args.model, args.merged, args.out or None, args.name or None)
+        mf = load_bundle(out).manifest
+        print(f"[SAVED] {out}  {mf['name']} ({mf['kind']}/{mf['estimator']}) n={mf['n']} vocab={len(mf['vocab'])}"
+              f"  files={list(mf['files'])}")
+        return 0
+    if args.cmd == "inspect":
+        for b in args.bundles:
+            mf = load_bundle(b).manifest
+            print(f"{b}: {mf['name']} {mf['kind']}/{mf['estimator']} n={mf['n']} dtype={mf['input_dtype']}"
+                  f" vocab={len(mf['vocab'])} (max {mf['vocab_size'] - 1}) label_map={mf['label_map']}"
+                  f" trained_on={mf['dataset']['path']} ({mf['dataset']['train_sha256'][:12]}) created={mf['created_at']}")
+        return 0
+    b = load_bundle(args.bundle)
+    base = Path(args.merged)
+    meta = json.load(open(base / "meta.json"))
+    X = np.load(base / "test" / "X.npy", mmap_mode="r", allow_pickle=False)
+    try:
+        b.verify_files()
+        info = b.check(meta, X, base)
+    except ContractError as e:
+        print(f"[ERROR] {e}")
+        return 1
+    print(f"[OK   ] {b.path}  n={b.n} label_map ok  test oov_rows={info['oov_rows']:.4f}"
+          f"  same_dataset={info['same_dataset']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+# features/model_server.py
+# models/ のモデルを 1 プロセスだけでロードして、複数の取り込みワーカから共有メモリ経由で推論を受ける。
+#   - 共有メモリ 1 ブロックに slots 個のスロットを持つリングバッファ
+#       state[slots] int32 / meta[slots, 4] int32（モデル番号, 行数, 所有ワーカ, エラー）
+#       X[slots, max_rows, max_n] int16（窓）/ y[slots, max_rows] int32（予測）
+#   - スロット s はワーカ s % n_workers 専用（割り当てにロック不要）。ワーカは窓を書いて READY にし、
+#     サーバは READY を拾って共有メモリ上の view をそのままモデルに渡し、予測を y に書いて DONE にする
+#     （窓・予測とも pickle しない。通知はセマフォだけ: 共有 ready と ワーカごとの done）
+#   - サーバは溜まった READY をモデルごとにまとめて 1 回で推論する（coalesce。小バッチのオーバーヘッドを均す）
+#   - セマフォは spawn 時の引数で継承させるので、ワーカは ModelServer を作った親から Process で起動すること
+# 例:
+#   srv = ModelServer(models, n_workers=4).start()
+#   mp.get_context("spawn").Process(target=worker, args=(srv.client_args(w), ...)).start()
+#   （ワーカ内）cli = RingClient(*args); y = cli.predict("dt_35", X)
+import multiprocessing as mp
+from multiprocessing import shared_memory
+from pathlib import Path
+import numpy as np
+
+FREE, READY, BUSY, DONE = 0, 1, 2, 3
+ALIGN = 64
+
+
+def _layout(slots: int, max_rows: int, max_n: int):
+    """(名前, dtype, shape, offset) と総バイト数"""
+    parts, off = [], 0
+    for name, dt, shape in (("state", np.int32, (slots,)), ("meta", np.int32, (slots, 4)),
+                            ("X", np.int16, (slots, max_rows, max_n)), ("y", np.int32, (slots, max_rows))):
+        parts.append((name, dt, shape, off))
+        off += -(-int(np.prod(shape)) * np.dtype(dt).itemsize // ALIGN) * ALIGN
+    return parts, off
+
+
+def _views(shm, slots: int, max_rows: int, max_n: int):
+    parts, _ = _layout(slots, max_rows, max_n)
+    return {name: np.ndarray(shape, dtype=dt, buffer=shm.buf, offset=off) for name, dt, shape, off in parts}
+
+
+def serve(shm_name, slots, max_rows, max_n, models, n_workers, ready, dones, stop, loaded, ok, threads, backend,
+          coalesce):
+    """サーバプロセス本体"""
+    from threadpoolctl import threadpool_limits
+    from eval_common import load_predictor
+    shm = shared_memory.SharedMemory(name=shm_name)
+    v = _views(shm, slots, max_rows, max_n)
+    state, meta, X, y = v["state"], v["meta"], v["X"], v["y"]
+    try:
+        with threadpool_limits(limits=threads):
+            predictors = []
+            for m in models:
+                fn, used, _vocab = load_predictor(m["kind"], Path(m["model_path"]), backend, threads)
+                predictors.append((fn, int(m["n"])))
+                print(f"[SERVE] loaded {m['name']} ({used}) n={m['n']}", flush=True)
+            ok.value = 1
+            loaded.set()
+            while True:
+                if not ready.acquire(timeout=0.05):
+                    if stop.is_set():
+                        break
+                    continue
+                todo = np.flatnonzero(state == READY)
+                for _ in range(len(todo) - 1):  # まとめて拾った分のトークンを回収（来ていなければそのまま）
+                    ready.acquire(False)
+                state[todo] = BUSY
+                for mid in np.unique(meta[todo, 0]).tolist():
+                    group = todo[meta[todo, 0] == mid].tolist()
+                    fn, n = predictors[mid]
+                    try:
+                        if coalesce and len(group) > 1:
+                            rows = [int(meta[s, 1]) for s in group]
+                            pred = np.asarray(fn(np.concatenate([X[s, :r, :n] for s, r in zip(group, rows)])))
+                            for s, a, b in zip(group, np.cumsum([0] + rows[:-1]).tolist(), np.cumsum(rows).tolist()):
+                                y[s, :b - a] = pred[a:b]
+                        else:
+                            for s in group:
+                                r = int(meta[s, 1])
+                                y[s, :r] = fn(X[s, :r, :n])
+                        err = 0
+                    except Exception as e:
+                        print(f"[ERROR] model_server {models[mid]['name']}: {type(e).__name__}: {e}", flush=True)
+                        err = 1
+                    for s in group:
+                        meta[s, 3] = err
+                        state[s] = DONE
+                        dones[int(meta[s, 2])].release()
+    finally:
+        loaded.set()  # ロード失敗時も親を待たせない
+        del state, meta, X, y, v
+        shm.close()
+
+
+class ModelServer:
+    """
+    models: eval_common.MODELS 形式の dict のリスト。スロットはワーカごとに slots_per_worker 本（計 n_workers 倍）。
+    max_rows: 1 スロットの最大行数（これより大きい X はクライアントが分割して流す）
+    """
+
+    def __init__(self, models, n_workers: int = 1, slots_per_worker: int = 4, max_rows: int = 4096,
+                 threads: int = 1, backend: str = "auto", coalesce: bool = True, ctx=None):
+        self.models = [dict(m) for m in models]
+        self.names = [m["name"] for m in self.models]
+        self.n_workers = max(1, int(n_workers))
+        self.slots = self.n_workers * max(1, int(slots_per_worker))
+        self.max_rows = int(max_rows)
+        self.max_n = max(int(m["n"]) for m in self.models)
+        self.threads, self.backend, self.coalesce = threads, backend, coalesce
+        self.ctx = ctx or mp.get_context("spawn")
+        _parts, size = _layout(self.slots, self.max_rows, self.max_n)
+        self.shm = shared_memory.SharedMemory(create=True, size=size)
+        _views(self.shm, self.slots, self.max_rows, self.max_n)["state"][:] = FREE
+        self.ready = self.ctx.Semaphore(0)
+        self.dones = [self.ctx.Semaphore(0) for _ in range(self.n_workers)]
+        self.stop_event = self.ctx.Event()
+        self.loaded = self.ctx.Event()
+        self.ok = self.ctx.Value("b", 0)
+        self.proc = None
+
+    def start(self, timeout: float = 600.0):
+        self.proc = self.ctx.Process(target=serve, daemon=True, args=(
+            self.shm.name, self.slots, self.max_rows, self.max_n, self.models, self.n_workers, self.ready,
+            self.dones, self.stop_event, self.loaded, self.ok, self.threads, self.backend, self.coalesce))
+        self.proc.start()
+        self.loaded.wait(timeout)
+        if not self.ok.value:
+            self.close()
+            raise RuntimeError("model server がモデルのロード中に終了しました")
+        return self
+
+    def client_args(self, worker: int):
+        """RingClient(*args) に渡す引数（Process の args としてワーカに渡すこと）"""
+        return (self.shm.name, self.slots, self.max_rows, self.max_n, [(m["name"], int(m["n"])) for m in self.models],
+                worker, self.n_workers,
+                self.ready, self.dones[worker])
+
+    def close(self):
+        self.stop_event.set()
+        if self.proc is not None:
+            self.proc.join(timeout=30)
+        self.shm.close()
+        self.shm.unlink()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class RingClient:
+    """取り込みワーカ側。自分のスロットだけを使い、最大で自分のスロット数ぶんのバッチを投げておける"""
+
+    def __init__(self, shm_name, slots, max_rows, max_n, models, worker, n_workers, ready, done):
+        self.shm = shared_memory.SharedMemory(name=shm_name)
+        v = _views(self.shm, slots, max_rows, max_n)
+        self.state, self.meta, self.X, self.y = v["state"], v["meta"], v["X"], v["y"]
+        self.max_rows = max_rows
+        self.model_ids = {name: (i, n) for i, (name, n) in enumerate(models)}
+        self.worker = worker
+        self.mine = list(range(worker, slots, n_workers))
+        self.ready, self.done = ready, done
+        self.inflight = []  # 投げた順の (slot, rows)
+
+    def submit(self, model: str, X) -> int:
+        """X（max_rows 行以下）を空きスロットに書いて READY にする。空きが無ければ RuntimeError"""
+        free = [s for s in self.mine if self.state[s] == FREE]
+        if not free:
+            raise RuntimeError("空きスロットがありません（collect() で結果を回収してから submit してください）")
+        s = free[0]
+        mid, n = self.model_ids[model]
+        r = X.shape[0]
+        if r > self.max_rows or X.shape[1] != n:
+            raise ValueError(f"X shape {X.shape} does not fit {model} (rows <= {self.max_rows}, n = {n})")
+        self.X[s, :r, :n] = X
+        self.meta[s, :3] = (mid, r, self.worker)
+        self.state[s] = READY
+        self.ready.release()
+        self.inflight.append((s, r))
+        return s
+
+    def collect(self):
+        """最古の投げたバッチの予測を返す（コピー）"""
+        s, r = self.inflight.pop(0)
+        while self.state[s] != DONE:
+            self.done.acquire()
+        failed = int(self.meta[s, 3])
+        out = self.y[s, :r].copy()
+        self.state[s] = FREE
+        if failed:
+            raise RuntimeError(f"model server が slot {s} の推論に失敗しました")
+        return out
+
+    def predict(self, model: str, X):
+        """X を max_rows ごとに分割し、自分のスロット数まで投げっぱなしにして順に回収する"""
+        if self.inflight:
+            raise RuntimeError("submit() 済みのバッチが残っています（先に collect() してください）")
+        X = np.asarray(X)
+        outs = []
+        for a in range(0, X.shape[0], self.max_rows):
+            if len(self.inflight) >= len(self.mine):
+                outs.append(self.collect())
+            self.submit(model, X[a:a + self.max_rows])
+        while self.inflight:
+            outs.append(self.collect())
+        return np.concatenate(outs) if outs else np.empty(0, dtype=np.int32)
+
+    def close(self):
+        del self.state, self.meta, self.X, self.y
+        self.shm.close()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+# features/ngram_overlap.py
+# split 間（train → val / test）・ワークロード間で「まったく同じ窓」がどれだけ出るかを数える。
+#   - 窓 [N, n] を 1 行 1 個の uint64 キーに詰める。ビット幅と完全一致 / ハッシュの別は全 split の最小・最大から 1 回だけ決める
+#     （split ごとに決めると split 間でキー空間が食い違い、同じ窓でもキーが一致しない）
+#       n × bits <= 64 なら knn_index.pack_keys と同じビット詰め（完全一致）
+#       それより長い窓は多項式ハッシュ（make_dataset の subgram と同じ基数・混合）。一致した行は元の窓を突き合わせて確認し、
+#       衝突（キーは同じで窓が違う）は一致から外して件数を報告する
+#   - 参照側（例: train）のキーをソートして一意化し、キーごとに出てくるクラスのビットマスクを reduceat で作る。
+#     照会側は searchsorted 1 回で「参照にある / 同じクラスで参照にある / 別クラスで参照にある」を全行まとめて判定する
+#   - 計算量 O(N log N)。行やキーごとの Python ループは無い
+import time
+import numpy as np
+from knn_index import key_bits, key_fits, pack_keys
+
+HASH_P = np.uint64(0x100000001B3)   # make_dataset.HASH_P と同じ
+HASH_MIX = np.uint64(0x9E3779B97F4A7C15)
+PAIRS = (("val", ("train",)), ("test", ("train",)), ("test", ("train", "val")))
+
+
+def key_space(Xs):
+    """全 split の窓 → (bits, exact)。exact=True なら bits ビット詰めの完全一致キー、False なら 64bit ハッシュ"""
+    Xs = [X for X in Xs if X.shape[0]]
+    if not Xs:
+        return 1, True
+    lo = min(int(X.min()) for X in Xs)
+    bits = key_bits(max(int(X.max()) for X in Xs))
+    return bits, lo >= 0 and key_fits(Xs[0].shape[1], bits)
+
+
+def row_keys(X, bits: int, exact: bool, chunk: int = 1 << 20):
+    """窓 → keys uint64[N]（bits / exact は key_space で全 split 共通に決めたもの）。exact=False ならハッシュ（一致は窓の突き合わせで確認すること）"""
+    N, n = X.shape
+    if exact:
+        return np.concatenate([pack_keys(X[s:s + chunk], bits)[0] for s in range(0, N, chunk)] or
+                              [np.empty(0, dtype=np.uint64)])
+    out = np.empty(N, dtype=np.uint64)
+    with np.errstate(over="ignore"):
+        for s in range(0, N, chunk):
+            xb = np.asarray(X[s:s + chunk]).astype(np.int64).astype(np.uint64) + np.uint64(1)
+            h = np.full(xb.shape[0], np.uint64(n), dtype=np.uint64)
+            for j in range(n):
+                h = h * HASH_P + xb[:, j]
+            h = (h ^ (h >> np.uint64(31))) * HASH_MIX
+            h ^= h >> np.uint64(29)
+            out[s:s + chunk] = h
+    return out
+
+
+class KeySet:
+    """参照側の窓集合: 一意キー（昇順）・キーごとのクラスのビットマスク・キーの代表行"""
+
+    def __init__(self, keys, cls, rows):
+        order = np.argsort(keys, kind="stable")
+        k = keys[order]
+        head = np.ones(k.shape[0], dtype=bool)
+        head[1:] = k[1:] != k[:-1]
+        starts = np.flatnonzero(head)
+        self.keys = k[starts]
+        bit = np.left_shift(np.uint64(1), cls[order].astype(np.uint64))
+        self.mask = np.bitwise_or.reduceat(bit, starts) if starts.size else np.empty(0, dtype=np.uint64)
+        self.rep = rows[order[starts]]  # 代表行（参照側の通し行番号）
+
+    def lookup(self, keys):
+        """→ (found[N], pos[N])"""
+        if self.keys.shape[0] == 0:
+            return np.zeros(keys.shape[0], dtype=bool), np.zeros(keys.shape[0], dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.keys, keys), self.keys.shape[0] - 1)
+        return self.keys[pos] == keys, pos
+
+
+def _fetch(Xs, offsets, rows):
+    """splits を縦に繋いだ通し行番号 → 窓（split ごとにまとめて読む）"""
+    out = np.empty((rows.shape[0], Xs[0].shape[1]), dtype=Xs[0].dtype)
+    which = np.searchsorted(offsets, rows, side="right") - 1
+    for i, X in enumerate(Xs):
+        m = which == i
+        if m.any():
+            out[m] = X[rows[m] - offsets[i]]
+    return out
+
+
+def rates(hit, cls, n_classes):
+    """クラスごとの行数と hit の割合"""
+    cnt = np.bincount(cls, minlength=n_classes)
+    hits = np.bincount(cls[hit], minlength=n_classes)
+    return cnt, np.divide(hits, cnt, out=np.zeros(n_classes), where=cnt > 0)
+
+
+def analyze(X, y, label_map):
+    """
+    X, y: split → 窓 / ラベル（mmap で良い）。label_map: {workload: label_id}（merged meta.json と同じ）
+    戻り値: merged meta.json の "overlap" にそのまま入れる dict
+    """
+    t0 = time.perf_counter()
+    names = {int(v): k for k, v in label_map.items()}
+    ids = sorted(names)
+    if len(ids) > 64:
+        raise ValueError("ビットマスクは 64 クラスまで")
+    lut = np.full(max(ids) + 1 if ids else 1, -1, dtype=np.int64)
+    lut[ids] = np.arange(len(ids))
+    bits, exact = key_space(list(X.values()))
+    keys, cls = {}, {}
+    for s in X:
+        keys[s] = row_keys(X[s], bits, exact)
+        cls[s] = lut[np.asarray(y[s], dtype=np.int64)]
+    C = len(ids)
+    out = {"key": "packed" if exact else "hash64", "n": int(X["train"].shape[1]), "pairs": {}, "within": {}}
+
+    for q, refs in PAIRS:
+        Xs = [X[r] for r in refs]
+        offsets = np.cumsum([0] + [x.shape[0] for x in Xs[:-1]])
+        ref = KeySet(np.concatenate([keys[r] for r in refs]), np.concatenate([cls[r] for r in refs]),
+                     np.arange(sum(x.shape[0] for x in Xs)))
+        found, pos = ref.lookup(keys[q])
+        collisions = 0
+        if not exact and found.any():
+            rows = np.flatnonzero(found)
+            same = (_fetch(Xs, offsets, ref.rep[pos[rows]]) == np.asarray(X[q])[rows]).all(axis=1)
+            collisions = int((~same).sum())
+            found[rows[~same]] = False
+        bit = np.left_shift(np.uint64(1), cls[q].astype(np.uint64))
+        m = np.where(found, ref.mask[pos], np.uint64(0))
+        same_cls = (m & bit) != 0
+        other_cls = (m & ~bit) != 0
+        cnt, r_any = rates(found, cls[q], C)
+        _c, r_same = rates(same_cls, cls[q], C)
+        _c, r_other = rates(other_cls, cls[q], C)
+        uq, first = np.unique(keys[q], return_index=True)
+        N = int(keys[q].shape[0])
+        out["pairs"][f"{q}~{'+'.join(refs)}"] = {
+            "rows": N,
+            "in_ref": float(found.mean()) if N else 0.0,
+            "in_ref_same_class": float(same_cls.mean()) if N else 0.0,
+            "in_ref_other_class": float(other_cls.mean()) if N else 0.0,
+            "unique_windows": int(uq.shape[0]),
+            "unique_in_ref": float(found[first].mean()) if N else 0.0,
+            "hash_collisions": collisions,
+            "per_class": {names[ids[c]]: {"rows": int(cnt[c]), "in_ref": float(r_any[c]),
+                                          "same_class": float(r_same[c]), "other_class": float(r_other[c])}
+                          for c in range(C)},
+        }
+
+    # split 内のワークロード間: 2 クラス以上に出る窓（ラベルだけでは区別できない行）
+    for s in X:
+        ks = KeySet(keys[s], cls[s], np.arange(keys[s].shape[0]))
+        multi = (ks.mask & (ks.mask - np.uint64(1))) != 0  # ビットが 2 つ以上
+        found, pos = ks.lookup(keys[s])
+        amb = found & multi[pos]
+        cnt, r_amb = rates(amb, cls[s], C)
+        N = int(keys[s].shape[0])
+        out["within"][s] = {
+            "rows": N, "unique_windows": int(ks.keys.shape[0]),
+            "duplicate_rows": float(1.0 - ks.keys.shape[0] / N) if N else 0.0,
+            "multi_class_windows": int(multi.sum()),
+            "ambiguous_rows": float(amb.mean()) if N else 0.0,
+            "per_class": {names[ids[c]]: {"rows": int(cnt[c]), "ambiguous": float(r_amb[c])} for c in range(C)},
+        }
+        if not exact:
+            out["within"][s]["note"] = "hash64: split 内の重複・クラス間共有は衝突を確認していない（上限値）"
+    out["sec"] = round(time.perf_counter() - t0, 3)
+    return out
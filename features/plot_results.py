@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+plot_results.py
+結果ストア（results_store.py）から図・表を生成する。入力行（キー + row_digest）のダイジェストを
+eval/store/index.sqlite の figures テーブルと比べ、変化した図だけ描き直す。
+  recall_vs_noise   → plots/recall_vs_noise.png         （15m-<pct>pct の単発評価、凡例は「名前 (n=N)」）
+  recall_vs_noise2  → docs/assets/recall_vs_noise2.png  （15m-<pct>pct-r{1,2,3}-2 のレプリケート平均）
+  avg_tables        → eval/avg_tables.txt               （avg_tables.sh 互換の平均表）
+使い方:
+  python3 features/plot_results.py [--only recall_vs_noise2] [--force] [--import-json]
+"""
+
+import argparse, sys
+from glob import glob
+from pathlib import Path
+
+from results_store import (STORE_DIR, TABLE_PCTS, TABLE_REPS, avg_table, figure_changed, import_json,
+                           latest, mark_figure, open_index, rows_digest)
+
+DISPLAY = {"dt_35": "Decision Tree", "mlp_10": "MLP", "knn_5": "kNN", "rnn_40": "RNN", "svm_50": "SVM"}
+
+def _pct_of(label: str):
+    # '15m-30pct' → 30
+    tail = label.rsplit("-", 1)[-1]
+    return int(tail[:-3]) if tail.endswith("pct") and tail[:-3].isdigit() else None
+
+def _noise_rows(store_dir, replicates):
+    labels = [f"15m-{p}pct" for p in TABLE_PCTS]
+    return [r for r in latest(store_dir, labels=labels)
+            if r["replicate"] in replicates and r["model"] in DISPLAY and r["recall"] is not None]
+
+def _series(rows):
+    """model → ([pct...], [mean recall...], n)。レプリケートは平均"""
+    acc = {}
+    for r in rows:
+        acc.setdefault(r["model"], {}).setdefault(_pct_of(r["label"]), []).append(r["recall"])
+    out = {}
+    for m, by_pct in acc.items():
+        xs = sorted(by_pct)
+        out[m] = (xs, [sum(by_pct[x]) / len(by_pct[x]) for x in xs],
+                  next(r["n"] for r in rows if r["model"] == m))
+    return out
+
+def _setup_style():
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    try:
+        import seaborn as sns
+        sns.set_theme(style="whitegrid", context="talk")
+    except ImportError:
+        plt.rcParams.update({"axes.grid": True, "font.size": 16})
+    return plt
+
+def _plot_recall(series, out_path, *, figsize, ylabel, legend_with_n, order):
+    plt = _setup_style()
+    fig, ax = plt.subplots(figsize=figsize)
+    for m in order:
+        if m not in series:
+            continue
+        xs, ys, n = series[m]
+        name = f"{DISPLAY[m]} (n={n})" if legend_with_n else DISPLAY[m]
+        ax.plot(xs, ys, marker="o", linewidth=3, markersize=10, label=name)
+    ax.set_xlim(0, 90); ax.set_ylim(0, 1.0 if legend_with_n else 1.05)
+    ax.set_xticks(TABLE_PCTS)
+    ax.set_xlabel("Noise insertion rate (%)"); ax.set_ylabel(ylabel)
+    ax.legend(loc="lower left")
+    fig.tight_layout()
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    fig.savefig(out_path, dpi=600)
+    plt.close(fig)
+
+def fig_recall_vs_noise(rows, out_path):
+    series = _series(rows)
+    _plot_recall(series, out_path, figsize=(7.7, 4.7), ylabel="Recall", legend_with_n=True,
+                 order=sorted(series, key=lambda m: DISPLAY[m]))
+
+def fig_recall_vs_noise2(rows, out_path):
+    series = _series(rows)
+    # 凡例は平均 Recall の高い順
+    order = sorted(series, key=lambda m: -sum(series[m][1]) / max(len(series[m][1]), 1))
+    _plot_recall(series, out_path, figsize=(6.7, 5.7), ylabel="Recall(TPR)", legend_with_n=False, order=order)
+
+def table_avg(rows, out_path, store_dir):
+    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        f.write(avg_table(store_dir) + "\n")
+
+# name → (出力先, 入力行の取得, 生成関数)
+FIGURES = {
+    "recall_vs_noise":  ("plots/recall_vs_noise.png",
+                         lambda sd: _noise_rows(sd, {""}), lambda rows, out, sd: fig_recall_vs_noise(rows, out)),
+    "recall_vs_noise2": ("docs/assets/recall_vs_noise2.png",
+                         lambda sd: _noise_rows(sd, set(TABLE_REPS)), lambda rows, out, sd: fig_recall_vs_noise2(rows, out)),
+    "avg_tables":       ("eval/avg_tables.txt",
+                         lambda sd: _noise_rows(sd, set(TABLE_REPS)), table_avg),
+}
+
+def main():
+    ap = argparse.ArgumentParser(description="Regenerate figures/reports from the results store (changed rows only)")
+    ap.add_argument("--store-dir", default=STORE_DIR)
+    ap.add_argument("--only", action="append", choices=sorted(FIGURES), help="対象の図（複数可、既定: 全部）")
+    ap.add_argument("--force", action="store_true", help="入力が変わっていなくても描き直す")
+    ap.add_argument("--import-json", action="store_true", help="先に eval/*-results.json をストアへ取り込む")
+    args = ap.parse_args()
+
+    if args.import_json:
+        files = sorted(glob("eval/*-results.json"))
+        print(f"[STORE] imported rows={import_json(files, args.store_dir)} files={len(files)}")
+
+    index = open_index(args.store_dir)
+    rc = 0
+    for name in args.only or list(FIGURES):
+        out, select, render = FIGURES[name]
+        rows = select(args.store_dir)
+        if not rows:
+            print(f"[SKIP ] {name}: no rows in store"); continue
+        digest = rows_digest(rows)
+        if not args.force and not figure_changed(index, name, out, digest):
+            print(f"[SAME ] {name}: {out} (rows={len(rows)})"); continue
+        try:
+            render(rows, out, args.store_dir)
+        except Exception as e:
+            print(f"[ERROR] {name}: {type(e).__name__}: {e}"); rc = 1; continue
+        mark_figure(index, name, out, digest, len(rows))
+        print(f"[SAVED] {name}: {out} (rows={len(rows)})")
+    index.close()
+    return rc
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,132 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+pred_cache.py
+フレーム（窓）ごとの推論結果を (モデルハッシュ, test X.npy ハッシュ) をキーに保存する永続キャッシュ。
+指標の定義を変えたときは推論をやり直さず、キャッシュした y_pred / scores から数秒で再計算できる。
+  - 置き場所: eval/pred_cache/<model_hash[:16]>-<x_hash[:16]>.npz
+      y_pred : 最小の整数 dtype（クラス id）
+      scores : クラス id 列のスコア行列 (N, n_classes) float32。keras / NumPy LSTM は softmax をついでに保持、
+               sklearn は eval-noise.py --scores のときだけ（predict_proba / decision_function）
+      key    : JSON（model_hash, x_hash, model_path, x_path, 作成時刻, score_source）
+  - ハッシュは results_store.model_hash / file_sha256 を使う（eval/store/index.sqlite で size/mtime キャッシュ）
+    モデル本体・サイドカー（.npz / .index.npz）・X.npy のどれかが変われば別キーになり、推論し直す
+使い方:
+  python3 features/pred_cache.py ls
+  python3 features/pred_cache.py prune [--keep-days 30]   # 一定期間使われていないエントリを削除
+"""
+
+import argparse, json, os, sys, time
+from datetime import datetime, timezone
+from glob import glob
+from pathlib import Path
+
+import numpy as np
+
+from results_store import STORE_DIR, file_sha256, model_hash, open_index
+
+CACHE_DIR = "eval/pred_cache"
+
+def cache_path(mh: str, xh: str, cache_dir=CACHE_DIR) -> Path:
+    return Path(cache_dir) / f"{mh[:16]}-{xh[:16]}.npz"
+
+def _compact_labels(y):
+    y = np.asarray(y)
+    if y.size and np.issubdtype(y.dtype, np.integer):
+        lo, hi = int(y.min()), int(y.max())
+        for dt in (np.uint8, np.int8, np.uint16, np.int16, np.int32):
+            info = np.iinfo(dt)
+            if info.min <= lo and hi <= info.max:
+                return y.astype(dt)
+    return y
+
+def load(mh: str, xh: str, n_rows: int, cache_dir=CACHE_DIR):
+    """ヒットすれば (y_pred, scores|None, key)、無い・壊れている・行数不一致なら None"""
+    p = cache_path(mh, xh, cache_dir)
+    if not p.exists():
+        return None
+    try:
+        with np.load(p, allow_pickle=False) as z:
+            key = json.loads(str(z["key"]))
+            if key.get("model_hash") != mh or key.get("x_hash") != xh:
+                return None
+            y_pred = z["y_pred"]
+            scores = z["scores"] if "scores" in z.files else None
+    except Exception as e:
+        print(f"[WARN] pred cache unreadable {p}: {type(e).__name__}: {e}", file=sys.stderr)
+        return None
+    if y_pred.shape[0] != n_rows:
+        return None
+    os.utime(p)  # prune 用に最終利用時刻を更新
+    return y_pred, scores, key
+
+def save(mh: str, xh: str, y_pred, scores=None, cache_dir=CACHE_DIR, **info) -> Path:
+    p = cache_path(mh, xh, cache_dir)
+    p.parent.mkdir(parents=True, exist_ok=True)
+    key = {"model_hash": mh, "x_hash": xh, "created_at": datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ"), **info}
+    arrays = {"y_pred": _compact_labels(y_pred), "key": np.array(json.dumps(key))}
+    if scores is not None:
+        arrays["scores"] = np.asarray(scores, dtype=np.float32)  # float16 だと 1.0 付近の順位が潰れ ROC が粗くなる
+    tmp = p.with_name(p.name + ".tmp.npz")
+    np.savez_compressed(tmp, **arrays)
+    os.replace(tmp, p)
+    return p
+
+def cached_predict(model_path, x_path, n_rows: int, infer, *, cache_dir=CACHE_DIR, store_dir=STORE_DIR,
+                   refresh=False, need_scores=False):
+    """
+    infer() -> (y_pred, scores|None[, info: dict]) を必要なときだけ呼ぶ（info はキャッシュの key に残る）。
+    need_scores=True ならスコアの無いエントリはミス扱い。
+    戻り値: (y_pred, scores|None, hit: bool, key: dict)
+    """
+    index = open_index(store_dir)
+    try:
+        mh = model_hash(model_path, index)
+        xh = file_sha256(x_path, index)
+    finally:
+        index.close()
+    if not refresh:
+        got = load(mh, xh, n_rows, cache_dir)
+        if got is not None and (got[1] is not None or not need_scores):
+            return got[0], got[1], True, got[2]
+    y_pred, scores, *extra = infer()
+    info = {"model_path": str(model_path), "x_path": str(x_path), **(extra[0] if extra else {})}
+    save(mh, xh, y_pred, scores, cache_dir, **info)
+    return y_pred, scores, False, {"model_hash": mh, "x_hash": xh, **info}
+
+def _entries(cache_dir):
+    for p in sorted(glob(os.path.join(cache_dir, "*.npz"))):
+        if p.endswith(".tmp.npz"):
+            continue
+        try:
+            with np.load(p, allow_pickle=False) as z:
+                key = json.loads(str(z["key"])); n = int(z["y_pred"].shape[0]); has_scores = "scores" in z.files
+        except Exception:
+            key, n, has_scores = {}, -1, False
+        yield p, key, n, has_scores
+
+def main():
+    ap = argparse.ArgumentParser(description="Persistent per-frame prediction cache")
+    ap.add_argument("--cache-dir", default=CACHE_DIR)
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("ls")
+    pr = sub.add_parser("prune")
+    pr.add_argument("--keep-days", type=float, default=30.0, help="最終利用からこの日数を超えたものを削除")
+    args = ap.parse_args()
+
+    if args.cmd == "ls":
+        print("FILE\tROWS\tSCORES\tBYTES\tMODEL\tX")
+        for p, key, n, has_scores in _entries(args.cache_dir):
+            print(f"{os.path.basename(p)}\t{n}\t{int(has_scores)}\t{os.path.getsize(p)}\t"
+                  f"{key.get('model_path', '')}\t{key.get('x_path', '')}")
+        return 0
+    cutoff = time.time() - args.keep_days * 86400
+    removed = 0
+    for p in glob(os.path.join(args.cache_dir, "*.npz")):
+        if os.path.getmtime(p) < cutoff:
+            os.remove(p); removed += 1
+    print(f"[PRUNE] removed={removed} dir={args.cache_dir}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,36 @@
+# -*- coding: utf-8 -*-
+# features/proc_mem.py
+# プロセスのメモリ量（MB）の共通読み出し（train-all.py / bench-infer.py / bench-server.py から利用）。
+#   - /proc/<pid>/status の VmRSS（現在）/ VmHWM（ピーク）を読む
+#   - ru_maxrss は exec をまたいで spawn 元（親）のピークを引き継ぐので、/proc が読めないときだけの代用
+# spawn の子でも読まれるので、標準ライブラリ以外は import しない
+import resource
+
+
+def proc_status_mb(key: str, pid="self"):
+    """/proc/<pid>/status の key（例: "VmHWM:"）の値（MB）。読めなければ None"""
+    try:
+        with open(f"/proc/{pid}/status") as f:
+            for line in f:
+                if line.startswith(key):
+                    return int(line.split()[1]) / 1024.0
+    except OSError:
+        pass
+    return None
+
+
+def peak_rss_mb() -> float:
+    """自プロセスのピーク RSS（VmHWM、/proc が無ければ ru_maxrss）"""
+    v = proc_status_mb("VmHWM:")
+    return v if v is not None else resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024.0  # Linux: KiB
+
+
+def rss_mb() -> float:
+    """自プロセスの現在の RSS（VmRSS、/proc が無ければ peak_rss_mb で代用）"""
+    v = proc_status_mb("VmRSS:")
+    return v if v is not None else peak_rss_mb()
+
+
+def proc_hwm_mb(pid: int):
+    """他プロセスのピーク RSS（VmHWM）。読めなければ None"""
+    return proc_status_mb("VmHWM:", pid)
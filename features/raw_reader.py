@@ -0,0 +1,304 @@
+# -*- coding: utf-8 -*-
+# features/raw_reader.py
+# raw JSONL の共通リーダ（make_dataset.py / analyze_run.py から利用）。ts 列の一括変換 ts_to_ns もここに置く。
+#   - 同じ glob（例: dataset/raw/xmrig-*.jsonl）で .jsonl / .jsonl.gz / ブロック圧縮セグメント
+#     （<base>.<seq>.jsonl.gz + <base>.<seq>.idx.json。k8s/capture_filter.py --segment-secs の出力）を拾う
+#   - 同じ中身の X.jsonl と X.jsonl.gz が両方あれば plain を優先。セグメント列は <base>.jsonl 1 本として扱う
+#   - 索引付き gzip はブロック（独立した gzip メンバ）単位でスレッド並列に展開（zlib は GIL を解放）
+#   - 索引の count / ts 範囲で、不要なブロック（trim で捨てる先頭・末尾、時間窓の外）は読まずに飛ばす
+#   - 出力は改行境界で切った bytes ブロック（iter_blocks）か bytes 行（iter_lines）
+# CLI:
+#   python features/raw_reader.py compress dataset/raw/x.jsonl [--level 6] [--remove]  → x.jsonl.gz + x.idx.json
+#   python features/raw_reader.py cat 'dataset/raw/x*.jsonl' | jq ...
+#   python features/raw_reader.py info 'runs/*/*.jsonl'
+import argparse, glob, gzip, json, os, re, sys, zlib
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+
+READ_BLOCK = 64 << 20        # plain / 索引なし gzip の読み出し単位
+WRITE_BLOCK = 4 << 20        # compress の 1 ブロック（非圧縮）サイズ
+DEFAULT_THREADS = max(1, min(8, os.cpu_count() or 1))
+RE_SEG = re.compile(r"^(?P<root>.+)\.(?P<seq>\d+)\.jsonl\.gz$")
+RE_TS = re.compile(rb'"ts":\s*"([^"]*)"')
+RE_SC_INT = re.compile(rb'"sc":\s*-?\d')
+
+
+class Block:
+    """索引付き gzip の 1 ブロック（offset/length は圧縮側、count は行数）"""
+    __slots__ = ("path", "offset", "length", "count", "ts_min_ns", "ts_max_ns")
+
+    def __init__(self, path, b):
+        self.path = path; self.offset = int(b["offset"]); self.length = int(b["length"])
+        self.count = int(b["count"]); self.ts_min_ns = b.get("ts_min_ns"); self.ts_max_ns = b.get("ts_max_ns")
+
+
+class RawSource:
+    """1 本の論理入力。parts は [(path, idx dict or None)]（セグメント列なら seq 順）"""
+
+    def __init__(self, key, parts):
+        self.key = key; self.parts = parts
+
+    @property
+    def indexed(self):
+        return all(idx is not None for _p, idx in self.parts)
+
+    @property
+    def compressed(self):
+        return any(p.endswith(".gz") for p, _idx in self.parts)
+
+    def blocks(self):
+        """索引付きのときのみ Block のリスト（それ以外は None）"""
+        if not self.indexed: return None
+        return [Block(p, b) for p, idx in self.parts for b in idx["blocks"]]
+
+    def count(self):
+        """索引から分かる行数（索引なしは None）"""
+        return sum(int(idx["count"]) for _p, idx in self.parts) if self.indexed else None
+
+    def all_sc_int(self):
+        """全行が整数 sc を持つと索引に記録されているか"""
+        return self.indexed and all(idx.get("sc_all_int") for _p, idx in self.parts)
+
+    def size(self):
+        return sum(os.path.getsize(p) for p, _idx in self.parts)
+
+    def __repr__(self):
+        return f"RawSource({self.key!r}, parts={len(self.parts)}, indexed={self.indexed})"
+
+
+def idx_path_for(gz_path):
+    """x.jsonl.gz → x.idx.json"""
+    return gz_path[:-len(".jsonl.gz")] + ".idx.json" if gz_path.endswith(".jsonl.gz") else gz_path + ".idx.json"
+
+def _load_idx(gz_path):
+    p = idx_path_for(gz_path)
+    if not os.path.exists(p): return None
+    try:
+        with open(p, "r", encoding="utf-8") as f: idx = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return idx if isinstance(idx.get("blocks"), list) else None
+
+def discover(patterns):
+    """glob パターン（str か list）→ RawSource のリスト（key = 論理 .jsonl パス の昇順）"""
+    if isinstance(patterns, str): patterns = [patterns]
+    files = set()
+    for p in patterns:
+        files.update(glob.glob(p))
+        files.update(glob.glob(p + ".gz"))
+        if p.endswith(".jsonl"):
+            files.update(glob.glob(p[:-len(".jsonl")] + ".[0-9]*.jsonl.gz"))
+    plain, single_gz, segs = {}, {}, {}
+    for f in files:
+        if not os.path.isfile(f): continue
+        m = RE_SEG.match(f)
+        if m:
+            segs.setdefault(m.group("root") + ".jsonl", []).append((int(m.group("seq")), f))
+        elif f.endswith(".gz"):
+            single_gz[f[:-3]] = f
+        else:
+            plain[f] = f
+    sources = {}
+    for key, f in single_gz.items():
+        sources[key] = RawSource(key, [(f, _load_idx(f))])
+    for key, lst in segs.items():
+        if key in plain or key in single_gz: continue
+        sources[key] = RawSource(key, [(f, _load_idx(f)) for _seq, f in sorted(lst)])
+    for key, f in plain.items():
+        sources[key] = RawSource(key, [(f, None)])  # plain を優先
+    return [sources[k] for k in sorted(sources)]
+
+# ---------------------------
+# 読み出し
+# ---------------------------
+
+def _align(chunks):
+    """任意の bytes 列 → 改行境界で切ったブロック列"""
+    rest = b""
+    for buf in chunks:
+        if not buf: continue
+        buf = rest + buf
+        cut = buf.rfind(b"\n")
+        if cut < 0: rest = buf; continue
+        rest = buf[cut+1:]
+        yield buf[:cut+1]
+    if rest: yield rest + b"\n"
+
+def _read_stream(path, block=READ_BLOCK):
+    opener = gzip.open if path.endswith(".gz") else open
+    with opener(path, "rb") as f:
+        while True:
+            buf = f.read(block)
+            if not buf: return
+            yield buf
+
+def _read_block(b):
+    with open(b.path, "rb") as f:
+        f.seek(b.offset)
+        comp = f.read(b.length)
+    return zlib.decompress(comp, 31)  # 1 ブロック = 1 gzip メンバ
+
+def read_blocks(blocks, threads=DEFAULT_THREADS):
+    """Block 列をスレッド並列で展開し、順序どおり bytes で返す（先読みは 2×threads まで）"""
+    if threads <= 1:
+        for b in blocks: yield _read_block(b)
+        return
+    window = 2 * threads
+    with ThreadPoolExecutor(max_workers=threads) as ex:
+        pending = []
+        for b in blocks:
+            pending.append(ex.submit(_read_block, b))
+            if len(pending) >= window:
+                yield pending.pop(0).result()
+        for fut in pending:
+            yield fut.result()
+
+def select_blocks(blocks, skip_head=0, skip_tail=0, ts_range=None):
+    """
+    行数で先頭 skip_head / 末尾 skip_tail 行に完全に含まれるブロックと、ts_range=(lo_ns, hi_ns) の外のブロックを除く。
+    戻り値: (残すブロック, 先頭で飛ばした行数)
+    """
+    total = sum(b.count for b in blocks)
+    keep, head_skipped, pos = [], 0, 0
+    for b in blocks:
+        lo, hi = pos, pos + b.count; pos = hi
+        if hi <= skip_head and not keep:
+            head_skipped += b.count; continue
+        if lo >= total - skip_tail:
+            break
+        if ts_range is not None and b.ts_min_ns is not None and b.ts_max_ns is not None:
+            if b.ts_max_ns < ts_range[0] or b.ts_min_ns > ts_range[1]: continue
+        keep.append(b)
+    return keep, head_skipped
+
+def iter_blocks(source, threads=DEFAULT_THREADS, ts_range=None):
+    """1 ソースを改行境界の bytes ブロックで返す。索引付きなら ts_range 外のブロックは読まない"""
+    blocks = source.blocks()
+    if blocks is not None:
+        if ts_range is not None: blocks, _ = select_blocks(blocks, ts_range=ts_range)
+        yield from _align(read_blocks(blocks, threads))
+        return
+    for path, _idx in source.parts:
+        yield from _align(_read_stream(path))
+
+def iter_lines(patterns_or_sources, threads=DEFAULT_THREADS):
+    """glob パターンまたは RawSource 列の全行（bytes、改行なし、空行除く）をソース順に返す"""
+    srcs = patterns_or_sources
+    if isinstance(srcs, str) or (isinstance(srcs, (list, tuple)) and srcs and isinstance(srcs[0], str)):
+        srcs = discover(srcs)
+    for s in srcs:
+        for buf in iter_blocks(s, threads):
+            for line in buf.split(b"\n"):
+                if line.strip(): yield line
+
+# ---------------------------
+# 書き出し（既存 .jsonl → ブロック圧縮 + 索引）
+# ---------------------------
+
+def _iso_to_ns(ts):
+    try:
+        ts = ts.decode() if isinstance(ts, bytes) else ts
+        head, _, frac = ts.rstrip("Z").partition(".")
+        sec = int(datetime.strptime(head, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+        return sec * 1_000_000_000 + (int(frac[:9].ljust(9, "0")) if frac else 0)
+    except ValueError:
+        return None
+
+# ts 列の一括変換（analyze_run のタイムライン / make_dataset のフレーム時刻）
+NO_TS = -(1 << 63)  # 不明な ts（int64 最小値）
+
+
+def _iso_ns(v):
+    import numpy as np
+    try: return int(np.datetime64(v, "ns").astype(np.int64))
+    except ValueError: return NO_TS
+
+
+def ts_to_ns(vals):
+    """ts 列（bytes/str: ISO8601 'YYYY-mm-ddTHH:MM:SS.fffffffffZ' か数値秒/ナノ秒）→ UNIX ns の int64 配列（不明は NO_TS）"""
+    import warnings
+    import numpy as np
+    a = np.asarray(vals, dtype="S40")
+    out = np.full(a.shape, NO_TS, dtype=np.int64)
+    if a.size == 0: return out
+    iso = np.char.find(a, b"T") >= 0
+    if iso.any():
+        # S→M8 の直接変換は不正な文字列で落ちる NumPy があるため U を経由し、ValueError 時だけ 1 件ずつ解釈
+        u = np.char.rstrip(a[iso], b"Z").astype("U40")
+        with warnings.catch_warnings():
+            warnings.simplefilter("ignore")  # タイムゾーン付き文字列の UserWarning 等
+            try:
+                t = u.astype("M8[ns]").astype(np.int64)
+            except ValueError:
+                t = np.array([_iso_ns(v) for v in u], dtype=np.int64)
+        out[iso] = t  # NaT は int64 最小値 = NO_TS
+    num = ~iso & (np.char.str_len(a) > 0) & (a != b"null") & (a != b"None")
+    if num.any():
+        try:
+            v = a[num].astype(np.float64)
+            out[num] = np.where(v > 1e12, v, v * 1e9).astype(np.int64)  # 1e12 超はナノ秒とみなす
+        except ValueError:
+            pass
+    return out
+
+
+def compress_file(src, dst=None, level=6, block_bytes=WRITE_BLOCK):
+    """plain JSONL を独立 gzip メンバのブロック列 + idx.json（capture_filter のセグメントと同じ形式）に変換"""
+    dst = dst or src + ".gz"
+    blocks, raw_off, count, all_int = [], 0, 0, True
+    with open(dst, "wb") as out:
+        for raw in _align(_read_stream(src, block_bytes)):
+            n = raw.count(b"\n")
+            all_int = all_int and len(RE_SC_INT.findall(raw)) == n
+            ts = [_iso_to_ns(t) for t in RE_TS.findall(raw)]
+            ts = [t for t in ts if t is not None]
+            comp = gzip.compress(raw, compresslevel=level, mtime=0)
+            blocks.append({"offset": out.tell(), "length": len(comp), "raw_offset": raw_off, "raw_length": len(raw),
+                           "count": n, "ts_min_ns": min(ts, default=None), "ts_max_ns": max(ts, default=None)})
+            out.write(comp); raw_off += len(raw); count += n
+        size = out.tell()
+    ts_min = min((b["ts_min_ns"] for b in blocks if b["ts_min_ns"] is not None), default=None)
+    ts_max = max((b["ts_max_ns"] for b in blocks if b["ts_max_ns"] is not None), default=None)
+    idx = {"file": os.path.basename(dst), "format": "jsonl.gz", "count": count,
+           "ts_min_ns": ts_min, "ts_max_ns": ts_max, "sc_all_int": all_int,
+           "bytes": size, "raw_bytes": raw_off, "blocks": blocks}
+    with open(idx_path_for(dst), "w", encoding="utf-8") as f:
+        json.dump(idx, f, ensure_ascii=False, indent=1)
+    return dst, idx
+
+def main():
+    ap = argparse.ArgumentParser(description="Shared reader for raw .jsonl / .jsonl.gz / block-indexed segments")
+    sub = ap.add_subparsers(dest="cmd", required=True)
+    c = sub.add_parser("compress", help="plain .jsonl → ブロック圧縮 .jsonl.gz + .idx.json")
+    c.add_argument("files", nargs="+")
+    c.add_argument("--level", type=int, default=6)
+    c.add_argument("--block-mb", type=float, default=WRITE_BLOCK / (1 << 20))
+    c.add_argument("--remove", action="store_true", help="変換後に元の .jsonl を削除")
+    k = sub.add_parser("cat", help="展開した行を stdout へ")
+    k.add_argument("patterns", nargs="+")
+    k.add_argument("--threads", type=int, default=DEFAULT_THREADS)
+    i = sub.add_parser("info", help="見つかった論理ソースと索引の有無")
+    i.add_argument("patterns", nargs="+")
+    args = ap.parse_args()
+
+    if args.cmd == "compress":
+        for src in args.files:
+            if src.endswith(".gz"):
+                print(f"[SKIP] {src}: already compressed"); continue
+            dst, idx = compress_file(src, level=args.level, block_bytes=int(args.block_mb * (1 << 20)))
+            print(f"[OK] {src} -> {dst}  lines={idx['count']} blocks={len(idx['blocks'])} "
+                  f"{idx['raw_bytes']/1e6:.1f}MB -> {idx['bytes']/1e6:.1f}MB")
+            if args.remove: os.remove(src)
+    elif args.cmd == "cat":
+        out = sys.stdout.buffer
+        for s in discover(args.patterns):
+            for buf in iter_blocks(s, args.threads): out.write(buf)
+    else:
+        for s in discover(args.patterns):
+            n = s.count()
+            print(f"{s.key}\tparts={len(s.parts)}\tindexed={int(s.indexed)}\t"
+                  f"lines={'' if n is None else n}\tbytes={s.size()}")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
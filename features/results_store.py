@@ -0,0 +1,365 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+results_store.py
+eval.py / eval-noise.py の評価結果を SQLite に索引化して保持する結果ストア。
+  - シャード: eval/store/<label>.sqlite（label はレプリケート接尾辞 -r<k>[-<m>] を除いたもの）
+  - 主キー  : (label, replicate, model, n, model_hash, dataset_hash)
+      model_hash   = モデルファイル（+ 推論に使うサイドカー: lstm の .npz / kNN の .index.npz。バンドルは中の全ファイル）の sha256
+      dataset_hash = merged/<label>-<n>gram の meta.json + test/X.npy + test/y.npy の sha256
+    モデルを再学習・データセットを作り直すと別行になり、latest() は (label, replicate, model) ごとに最新行を返す
+  - eval/store/index.sqlite: ファイル sha256 のキャッシュ（path, size, mtime_ns で再計算を省略）と
+    図・表ごとの入力行ダイジェスト（plot_results.py が変化した図だけ再生成するのに使う）
+使い方:
+  python3 features/results_store.py import eval/*-results.json   # 既存 JSON の取り込み（ハッシュは空 = 不明）
+  python3 features/results_store.py query [--label 15m-30pct] [--model svm_50] [--format tsv|json]
+  python3 features/results_store.py table                        # avg_tables.sh 互換の平均表（ストアに無い行は JSON から取り込む）
+Python から:
+  from results_store import record_results, latest
+"""
+
+import argparse, hashlib, json, os, re, sqlite3, sys
+from datetime import datetime, timezone
+from glob import glob
+from pathlib import Path
+
+STORE_DIR = "eval/store"
+INDEX_NAME = "index.sqlite"
+
+RE_REPLICATE = re.compile(r"^(?P<label>.+?)-(?P<rep>r\d+(?:-\d+)?)$")
+RE_NGRAM_DIR = re.compile(r"^(?P<label>.+)-(?P<n>\d+)gram$")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+  label         TEXT NOT NULL,
+  replicate     TEXT NOT NULL,
+  model         TEXT NOT NULL,
+  n             INTEGER NOT NULL,
+  model_hash    TEXT NOT NULL,
+  dataset_hash  TEXT NOT NULL,
+  kind          TEXT,
+  model_path    TEXT,
+  data_path     TEXT,
+  test_n        INTEGER,
+  accuracy      REAL,
+  precision     REAL,
+  recall        REAL,
+  f1            REAL,
+  fpr           REAL,
+  tp INTEGER, fp INTEGER, fn INTEGER, tn INTEGER,
+  metrics       TEXT,
+  row_digest    TEXT,
+  finished_at   TEXT,
+  updated_at    TEXT,
+  PRIMARY KEY (label, replicate, model, n, model_hash, dataset_hash)
+);
+CREATE INDEX IF NOT EXISTS results_model ON results(model, n);
+"""
+
+INDEX_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_hashes (
+  path      TEXT PRIMARY KEY,
+  size      INTEGER,
+  mtime_ns  INTEGER,
+  sha256    TEXT
+);
+CREATE TABLE IF NOT EXISTS figures (
+  name        TEXT PRIMARY KEY,
+  out_path    TEXT,
+  digest      TEXT,
+  rows        INTEGER,
+  updated_at  TEXT
+);
+"""
+
+TABLE_ORDER = [("Decision Tree", "dt_35"), ("MLP", "mlp_10"), ("kNN", "knn_5"), ("RNN", "rnn_40"), ("SVM", "svm_50")]
+TABLE_PCTS = [0, 10, 20, 30, 40, 50, 60, 70, 80, 90]
+TABLE_REPS = ["r1-2", "r2-2", "r3-2"]
+
+METRIC_COLS = ["test_n", "accuracy", "precision", "recall", "f1", "fpr", "tp", "fp", "fn", "tn"]
+KEY_COLS = ["label", "replicate", "model", "n", "model_hash", "dataset_hash"]
+COLUMNS = KEY_COLS + ["kind", "model_path", "data_path"] + METRIC_COLS + ["metrics", "row_digest", "finished_at", "updated_at"]
+
+def now_utc_iso():
+    return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+def split_label(label: str):
+    """'15m-30pct-r1-2' → ('15m-30pct', 'r1-2') / レプリケート無しは replicate=''"""
+    m = RE_REPLICATE.match(label)
+    return (m["label"], m["rep"]) if m else (label, "")
+
+def label_from_data_path(data_path) -> str:
+    """dataset/npy/merged/15m-1000hz-40gram → '15m-1000hz'"""
+    name = Path(data_path).name
+    m = RE_NGRAM_DIR.match(name)
+    return m["label"] if m else name
+
+def _shard_name(label: str) -> str:
+    return re.sub(r"[^A-Za-z0-9._-]", "_", label) or "_"
+
+# ---------- 接続 ----------
+
+def open_index(store_dir=STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(store_dir, INDEX_NAME))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(INDEX_SCHEMA)
+    return conn
+
+def open_shard(label: str, store_dir=STORE_DIR):
+    os.makedirs(store_dir, exist_ok=True)
+    conn = sqlite3.connect(os.path.join(store_dir, _shard_name(label) + ".sqlite"))
+    conn.row_factory = sqlite3.Row
+    conn.executescript(SCHEMA)
+    return conn
+
+def shard_paths(store_dir=STORE_DIR):
+    return sorted(p for p in glob(os.path.join(store_dir, "*.sqlite")) if os.path.basename(p) != INDEX_NAME)
+
+# ---------- ハッシュ ----------
+
+def file_sha256(path, index=None) -> str:
+    """ファイルの sha256。index（open_index の接続）を渡すと size/mtime_ns が同じ間は再計算しない"""
+    path = os.path.abspath(path)
+    st = os.stat(path)
+    if index is not None:
+        r = index.execute("SELECT size, mtime_ns, sha256 FROM file_hashes WHERE path=?", (path,)).fetchone()
+        if r and (r["size"], r["mtime_ns"]) == (st.st_size, st.st_mtime_ns):
+            return r["sha256"]
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    digest = h.hexdigest()
+    if index is not None:
+        index.execute("INSERT OR REPLACE INTO file_hashes (path, size, mtime_ns, sha256) VALUES (?,?,?,?)",
+                      (path, st.st_size, st.st_mtime_ns, digest))
+        index.commit()
+    return digest
+
+def _combined_sha256(paths, index=None) -> str:
+    h = hashlib.sha256()
+    for p in paths:
+        if os.path.exists(p):
+            h.update(os.path.basename(p).encode()); h.update(file_sha256(p, index).encode())
+    return h.hexdigest()
+
+def model_hash(model_path, index=None) -> str:
+    """モデル本体 + 推論結果を左右するサイドカー（<model>.npz / <model>.index.npz）。バンドル（ディレクトリ）は中の全ファイル"""
+    p = Path(model_path)
+    if p.is_dir():
+        return _combined_sha256(sorted(str(f) for f in p.iterdir() if f.is_file()), index)
+    return _combined_sha256([str(p), str(p.with_suffix(".npz")), str(p.with_suffix(".index.npz"))], index)
+
+def dataset_hash(data_path, index=None) -> str:
+    d = Path(data_path)
+    return _combined_sha256([str(d / "meta.json"), str(d / "test" / "X.npy"), str(d / "test" / "y.npy")], index)
+
+def train_dataset_hash(data_path, index=None) -> str:
+    """学習側: merged/<label>-<n>gram の train/X.npy + train/y.npy の sha256（model_bundle の manifest に記録）"""
+    d = Path(data_path)
+    return _combined_sha256([str(d / "train" / "X.npy"), str(d / "train" / "y.npy")], index)
+
+# ---------- 書き込み ----------
+
+def _row_from_result(r: dict, label: str, replicate: str, mh: str, dh: str) -> dict:
+    bm = r.get("binary_metrics") or {}; cm = r.get("confusion_matrix") or {}
+    metrics = {k: v for k, v in r.items()
+               if k not in ("name", "kind", "model_path", "data_path", "label", "n", "test_N",
+                            "started_at", "finished_at", "pred_cache")}
+    row = {
+        "label": label, "replicate": replicate, "model": r["name"], "n": int(r["n"]),
+        "model_hash": mh, "dataset_hash": dh,
+        "kind": r.get("kind"), "model_path": r.get("model_path"), "data_path": r.get("data_path"),
+        "test_n": r.get("test_N"), "accuracy": r.get("accuracy"),
+        "precision": bm.get("precision"), "recall": bm.get("recall"), "f1": bm.get("f1"), "fpr": bm.get("fpr"),
+        "tp": cm.get("tp"), "fp": cm.get("fp"), "fn": cm.get("fn"), "tn": cm.get("tn"),
+        "metrics": json.dumps(metrics, sort_keys=True), "finished_at": r.get("finished_at"),
+        "updated_at": now_utc_iso(),
+    }
+    return row
+
+_UPSERT = (f"INSERT INTO results ({','.join(COLUMNS)}) VALUES ({','.join('?' * len(COLUMNS))}) "
+           f"ON CONFLICT ({','.join(KEY_COLS)}) DO UPDATE SET "
+           + ", ".join(f"{c}=COALESCE(excluded.{c}, results.{c})"
+                       for c in ["kind", "model_path", "data_path"] + METRIC_COLS + ["finished_at"])
+           + ", metrics=json_patch(results.metrics, excluded.metrics), updated_at=excluded.updated_at")
+
+def _refresh_digest(conn, row):
+    """行の中身（指標）から row_digest を作り直す（図の再生成判定に使う）"""
+    cur = conn.execute(f"SELECT {','.join(METRIC_COLS)}, metrics FROM results WHERE "
+                       + " AND ".join(f"{c}=?" for c in KEY_COLS), [row[c] for c in KEY_COLS]).fetchone()
+    digest = hashlib.sha256(json.dumps(list(cur), sort_keys=True).encode()).hexdigest()[:16]
+    conn.execute("UPDATE results SET row_digest=? WHERE row_digest IS NOT ? AND "
+                 + " AND ".join(f"{c}=?" for c in KEY_COLS), [digest, digest] + [row[c] for c in KEY_COLS])
+
+def record_results(results, label=None, store_dir=STORE_DIR, hash_files=True):
+    """
+    eval の results（各要素は results.json の 1 モデル分）をストアへ upsert。error 行は既存行を壊さないよう無視。
+    label を省略すると各結果の label（無ければ data_path の <label>-<n>gram）を使う。
+    hash_files=False なら model_hash / dataset_hash は空文字（既存 JSON の取り込み用: 当時のファイルは不明）。
+    戻り値: 書き込んだ行数
+    """
+    index = open_index(store_dir) if hash_files else None
+    shards = {}; written = 0
+    try:
+        for r in results:
+            if "error" in r or "n" not in r:
+                continue
+            base, rep = split_label(r.get("label") or label or label_from_data_path(r.get("data_path", "")))
+            mh = model_hash(r["model_path"], index) if hash_files and os.path.exists(r.get("model_path", "")) else ""
+            dh = dataset_hash(r["data_path"], index) if hash_files and os.path.isdir(r.get("data_path", "")) else ""
+            row = _row_from_result(r, base, rep, mh, dh)
+            conn = shards.get(base) or shards.setdefault(base, open_shard(base, store_dir))
+            conn.execute(_UPSERT, [row.get(c) for c in COLUMNS])
+            _refresh_digest(conn, row)
+            written += 1
+        for conn in shards.values():
+            conn.commit()
+    finally:
+        for conn in shards.values():
+            conn.close()
+        if index is not None:
+            index.close()
+    return written
+
+def import_json(paths, store_dir=STORE_DIR):
+    total = 0
+    for p in paths:
+        with open(p, "r", encoding="utf-8") as f:
+            d = json.load(f)
+        total += record_results(d.get("results", []), label=d.get("label"), store_dir=store_dir, hash_files=False)
+    return total
+
+def import_missing_json(json_dir, store_dir=STORE_DIR, prefix="15m", pcts=TABLE_PCTS, reps=TABLE_REPS):
+    """
+    平均表の対象 (label, replicate) で、ストアに行が無いモデルだけを <json_dir>/<label>-<rep>-results.json から取り込む。
+    ストアにある行（eval が記録した新しい結果）は上書きしない。戻り値: 取り込んだ行数
+    """
+    total = 0
+    for pct in pcts:
+        label = f"{prefix}-{pct}pct"
+        have = {(r["replicate"], r["model"]) for r in latest(store_dir, label=label)}
+        for rep in reps:
+            path = os.path.join(json_dir, f"{label}-{rep}-results.json")
+            if not os.path.exists(path):
+                continue
+            with open(path, "r", encoding="utf-8") as f:
+                d = json.load(f)
+            missing = [r for r in d.get("results", []) if (rep, r.get("name")) not in have]
+            if missing:
+                total += record_results(missing, label=d.get("label") or f"{label}-{rep}",
+                                        store_dir=store_dir, hash_files=False)
+    return total
+
+# ---------- 参照 ----------
+
+def latest(store_dir=STORE_DIR, label=None, model=None, labels=None):
+    """
+    (label, replicate, model) ごとの最新行（updated_at 最大）を dict で返す。
+    label / labels でシャードを絞る（labels はレプリケート除去後の label のリスト）。
+    """
+    if label is not None:
+        labels = [label]
+    paths = ([os.path.join(store_dir, _shard_name(l) + ".sqlite") for l in labels]
+             if labels is not None else shard_paths(store_dir))
+    sql = ("SELECT * FROM results r WHERE updated_at = (SELECT MAX(updated_at) FROM results s WHERE "
+           "s.label=r.label AND s.replicate=r.replicate AND s.model=r.model)")
+    params = []
+    if model:
+        sql += " AND model=?"; params.append(model)
+    rows = []
+    for p in paths:
+        if not os.path.exists(p):
+            continue
+        conn = sqlite3.connect(p); conn.row_factory = sqlite3.Row
+        try:
+            seen = set()
+            for r in conn.execute(sql + " ORDER BY label, replicate, model, finished_at DESC", params):
+                k = (r["label"], r["replicate"], r["model"])
+                if k not in seen:
+                    seen.add(k); rows.append(dict(r))
+        finally:
+            conn.close()
+    return rows
+
+def rows_digest(rows) -> str:
+    """図・表の入力行集合のダイジェスト（キー + row_digest）"""
+    keys = sorted((r["label"], r["replicate"], r["model"], r["n"], r["model_hash"], r["dataset_hash"],
+                   r["row_digest"] or "") for r in rows)
+    return hashlib.sha256(json.dumps(keys).encode()).hexdigest()
+
+def figure_changed(index, name, out_path, digest) -> bool:
+    r = index.execute("SELECT out_path, digest FROM figures WHERE name=?", (name,)).fetchone()
+    return not (r and r["digest"] == digest and r["out_path"] == str(out_path) and os.path.exists(out_path))
+
+def mark_figure(index, name, out_path, digest, n_rows):
+    index.execute("INSERT OR REPLACE INTO figures (name, out_path, digest, rows, updated_at) VALUES (?,?,?,?,?)",
+                  (name, str(out_path), digest, n_rows, now_utc_iso()))
+    index.commit()
+
+# ---------- 平均表（avg_tables.sh 互換） ----------
+
+def avg_table(store_dir=STORE_DIR, prefix="15m", pcts=TABLE_PCTS, reps=TABLE_REPS, json_dir=None) -> str:
+    """json_dir を渡すと、ストアに無いモデルの行を先に <json_dir>/*-results.json から取り込む"""
+    if json_dir:
+        import_missing_json(json_dir, store_dir, prefix, pcts, reps)
+    out = []
+    for pct in pcts:
+        label = f"{prefix}-{pct}pct"
+        rows = [r for r in latest(store_dir, label=label) if r["replicate"] in reps]
+        out.append(f"=== Noise {pct}% ===")
+        if not rows:
+            out.append(f"(no rows in {store_dir}/ for {pct}%)"); out.append("")
+            continue
+        out.append("Model,Recall(TPR),FPR,Precision,F1")
+        for disp, code in TABLE_ORDER:
+            mr = [r for r in rows if r["model"] == code and r["recall"] is not None]
+            if not mr:
+                out.append(f"{disp},N/A,N/A,N/A,N/A"); continue
+            avg = [sum(r[k] for r in mr) / len(mr) * 100 for k in ("recall", "fpr", "precision", "f1")]
+            out.append(f"{disp}," + ",".join(f"{v:.2f}%" for v in avg))
+        out.append("")
+    return "\n".join(out)
+
+def _fmt(v):
+    if v is None: return ""
+    if isinstance(v, float): return f"{v:.6g}"
+    return str(v)
+
+def main():
+    p = argparse.ArgumentParser(description="Sharded SQLite store of eval results")
+    p.add_argument("--store-dir", default=STORE_DIR)
+    sub = p.add_subparsers(dest="cmd", required=True)
+    im = sub.add_parser("import", help="eval/*-results.json を取り込む")
+    im.add_argument("files", nargs="+")
+    q = sub.add_parser("query")
+    q.add_argument("--label", help="レプリケート接尾辞を除いた label（例: 15m-30pct）")
+    q.add_argument("--model")
+    q.add_argument("--format", choices=["tsv", "json"], default="tsv")
+    t = sub.add_parser("table", help="avg_tables.sh 互換のレプリケート平均表")
+    t.add_argument("--prefix", default="15m")
+    t.add_argument("--json-dir", default=None,
+                   help="ストアに無い行を取り込む *-results.json の場所（既定: --store-dir の親、'' で無効）")
+    args = p.parse_args()
+
+    if args.cmd == "import":
+        n = import_json(args.files, args.store_dir)
+        print(f"[STORE] imported rows={n} files={len(args.files)} -> {args.store_dir}")
+        return 0
+    if args.cmd == "table":
+        json_dir = os.path.dirname(os.path.abspath(args.store_dir)) if args.json_dir is None else args.json_dir
+        print(avg_table(args.store_dir, args.prefix, json_dir=json_dir))
+        return 0
+    rows = latest(args.store_dir, label=args.label, model=args.model)
+    if args.format == "json":
+        for r in rows: r["metrics"] = json.loads(r["metrics"] or "{}")
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2); print()
+    else:
+        cols = [c for c in COLUMNS if c != "metrics"]
+        print("\t".join(cols))
+        for r in rows: print("\t".join(_fmt(r[c]) for c in cols))
+    return 0 if rows else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+# features/sampling.py
+# オンライン推論の窓間引きポリシー（pod ごとに何窓おきにスコアするか）と、そのオフライン再生。
+#   - 既定は pod ごとに k 窓おき。スコアが rise 以上になったら hold 窓ぶん hot_k 窓おき（既定 1 = 全窓）に上げる
+#   - CPU 逼迫時はトークンバケット（budget_fps 窓/秒、burst 窓）で間引く。バケットが空なら見送り、
+#     その pod の間引き倍率を 2 倍にする（スコアできるたびに半分へ戻す。ストライドの上限は max_k）。
+#     高頻度モードの pod も同じ倍率で下がるので、バケットを 1 つの pod が食い潰して他の pod が止まることはない
+#   - オンラインでは窓が届くたびに offer()、スコアしたら observe()。オフライン再生（simulate）も同じ状態遷移を使い、
+#     バケットが無ければスコアする窓だけを飛び飛びに辿る（コストはスコアした窓数に比例）
+#   - 見送った窓の判定は直前にスコアした窓の判定を引き継ぐ（sample-and-hold）
+import numpy as np
+
+
+class SamplingPolicy:
+    """
+    k: 通常時のストライド / hot_k, rise, hold: スコア上昇時のストライド・しきい値・継続窓数（rise=None で無効）
+    budget_fps: 全 pod 合計で 1 秒あたりにスコアできる窓数（0 で無制限）/ burst: バケット容量（窓）
+    """
+
+    def __init__(self, k: int = 1, hot_k: int = 1, rise=None, hold: int = 0,
+                 budget_fps: float = 0.0, burst: int = 0, max_k: int = 0):
+        self.k = max(1, int(k))
+        self.hot_k = max(1, int(hot_k))
+        self.rise = rise
+        self.hold = int(hold)
+        self.budget_fps = float(budget_fps)
+        self.burst = float(burst or max(1, int(self.budget_fps)))
+        self.max_k = int(max_k or 64 * self.k)
+        self.tokens = self.burst
+        self.last_ns = None
+        self.shed = 0
+
+    @staticmethod
+    def new_state():
+        """pod ごとの状態 [次の候補までの窓数, 高頻度モードの残り窓数, 逼迫による間引き倍率]"""
+        return [1, 0, 1]
+
+    def _admit(self, t_ns: int) -> bool:
+        if self.budget_fps <= 0:
+            return True
+        if self.last_ns is not None and t_ns > self.last_ns:
+            self.tokens = min(self.burst, self.tokens + (t_ns - self.last_ns) * 1e-9 * self.budget_fps)
+        self.last_ns = t_ns if self.last_ns is None else max(self.last_ns, t_ns)
+        if self.tokens >= 1.0:
+            self.tokens -= 1.0
+            return True
+        return False
+
+    def offer(self, st, t_ns: int = 0) -> bool:
+        """窓が 1 つ届いた。スコアするなら True（呼び出し側は推論して observe() を呼ぶ）"""
+        st[0] -= 1
+        if st[0] > 0:
+            return False
+        if self._admit(t_ns):
+            return True
+        self.shed += 1
+        st[2] = min(self.max_k, st[2] * 2)  # 逼迫中は倍々に間引く
+        st[0] = min(self.max_k, (self.hot_k if st[1] > 0 else self.k) * st[2])  # 高頻度モードなら hot_k 基準
+        return False
+
+    def observe(self, st, score: float) -> int:
+        """スコアした窓の結果を反映し、次にスコアするまでの窓数を返す"""
+        if self.rise is not None and score >= self.rise:
+            st[1] = self.hold
+        stride = self.hot_k if st[1] > 0 else self.k
+        st[1] = max(0, st[1] - stride)
+        if st[2] > 1:
+            stride = min(self.max_k, stride * st[2])
+            st[2] //= 2
+        st[0] = stride
+        return stride
+
+
+def simulate(policy: SamplingPolicy, score, starts, t_ns=None):
+    """
+    pod 順に並べた列（stream_agg.order_by_pod 済み）で、ポリシーがスコアする窓のマスクを返す。
+    budget_fps > 0 のときは全 pod を t_ns の昇順に 1 本の到着列として再生する（バケットは全 pod 共有）。
+    """
+    N = len(score)
+    scored = np.zeros(N, dtype=bool)
+    ends = np.r_[starts[1:], N]
+    s = np.asarray(score, dtype=np.float64)
+    if policy.budget_fps <= 0:
+        for a, b in zip(starts.tolist(), ends.tolist()):
+            st = policy.new_state()
+            i = a
+            while i < b:
+                scored[i] = True
+                i += policy.observe(st, s[i])
+        return scored
+    if t_ns is None:
+        raise ValueError("budget_fps を使うには t_ns が必要です")
+    seg = np.repeat(np.arange(len(starts)), ends - starts)
+    states = [policy.new_state() for _ in range(len(starts))]
+    t = np.asarray(t_ns, dtype=np.int64)
+    for i in np.argsort(t, kind="stable").tolist():
+        st = states[seg[i]]
+        if policy.offer(st, int(t[i])):
+            scored[i] = True
+            policy.observe(st, s[i])
+    return scored
+
+
+def hold_decisions(decision, scored, starts):
+    """見送った窓には直前にスコアした窓の判定を引き継ぐ（pod 先頭より前へは遡らない。未スコアは False）"""
+    N = len(decision)
+    pos = np.where(scored, np.arange(N), -1)
+    head_mark = np.zeros(N, dtype=np.int64) - 1
+    head_mark[starts] = starts - 1  # pod 先頭で前の pod の値を断ち切る
+    last = np.maximum.accumulate(np.maximum(pos, head_mark)) if N else pos
+    d = np.asarray(decision, dtype=bool)
+    out = np.zeros(N, dtype=bool)
+    ok = last >= np.repeat(starts, np.diff(np.r_[starts, N]))
+    out[ok] = d[last[ok]]
+    return out
+
+
+def parse_policies(every_spec: str, adaptive_spec: str, budget_spec: str):
+    """
+    '1,4,16' / '16:0.5:64'（k:rise:hold, 高頻度時は全窓）/ '0,2000'（窓/秒、0 = 無制限）
+    → [(name, params)]。every_1 / 無制限（全窓スコア）は基準として常に先頭
+    """
+    base = [("every_1", {"k": 1})]
+    for tok in filter(None, (t.strip() for t in every_spec.split(","))):
+        if int(tok) != 1:
+            base.append((f"every_{int(tok)}", {"k": int(tok)}))
+    for tok in filter(None, (t.strip() for t in adaptive_spec.split(","))):
+        k, rise, hold = tok.split(":")
+        base.append((f"adaptive_{tok}", {"k": int(k), "hot_k": 1, "rise": float(rise), "hold": int(hold)}))
+    out = [base[0]]
+    for b in [float(b) for b in budget_spec.split(",") if b.strip()] or [0.0]:
+        out += [(f"{name}@{b:g}fps", {**params, "budget_fps": b}) if b > 0 else (name, params)
+                for name, params in base if b > 0 or name != "every_1"]
+    return out
@@ -0,0 +1,102 @@
+# -*- coding: utf-8 -*-
+# features/score_curves.py
+# 悪性スコア（predict_proba / decision_function / softmax）からの ROC / PR 曲線と動作点。
+#   - 1 モデルにつきスコアの降順ソート 1 回 + cumsum で全しきい値の (TP, FP) を得る（sklearn の roc_curve 相当）
+#   - 目標 FPR（例: 1e-4, 1e-3, 1e-2）ごとに「FPR <= 目標」で Recall 最大の動作点を返す
+#   - 曲線は (fpr+tpr) / (recall+precision) の弧長で間引いて max_points 点以下にし、小数 6 桁で JSON に保存
+import numpy as np
+
+DEFAULT_TARGET_FPRS = (1e-4, 1e-3, 1e-2, 5e-2)
+
+
+def class_score_matrix(raw, classes, n_classes: int):
+    """
+    predict_proba / decision_function の出力を「列 = クラス id」の (N, n_classes) float32 に揃える。
+    学習時に無かったクラスの列は -inf（どのしきい値でも正例にならない）。
+    二値の decision_function（1 次元）は classes[1] が正のスコアなので [-d, d] に展開する。
+    """
+    raw = np.asarray(raw, dtype=np.float32)
+    classes = np.asarray(classes).astype(np.int64)
+    if raw.ndim == 1:
+        raw = np.stack([-raw, raw], axis=1)
+    out = np.full((raw.shape[0], n_classes), -np.inf, dtype=np.float32)
+    out[:, classes] = raw
+    return out
+
+
+def sklearn_scores(clf, X, n_classes: int):
+    """戻り値: (scores[N, n_classes], source) / スコアを出せない推定器は (None, None)"""
+    if hasattr(clf, "predict_proba"):
+        try:
+            return class_score_matrix(clf.predict_proba(X), clf.classes_, n_classes), "predict_proba"
+        except AttributeError:
+            pass  # SVC(probability=False) などは hasattr でも呼ぶと AttributeError
+    if hasattr(clf, "decision_function"):
+        return class_score_matrix(clf.decision_function(X), clf.classes_, n_classes), "decision_function"
+    return None, None
+
+
+def sweep(y_true_bin, score):
+    """
+    スコア降順の 1 パスで全しきい値の (thr, tp, fp) を返す。
+    同点スコアは 1 つのしきい値にまとめる（score >= thr を正例と判定）。
+    """
+    y = np.asarray(y_true_bin).astype(bool)
+    s = np.asarray(score, dtype=np.float64)
+    order = np.argsort(-s, kind="stable")
+    s = s[order]; y = y[order]
+    last = np.r_[np.flatnonzero(np.diff(s)), s.size - 1] if s.size else np.empty(0, dtype=np.int64)
+    tp = np.cumsum(y)[last]
+    fp = (last + 1) - tp
+    return s[last], tp, fp
+
+
+def curves(y_true_bin, score, target_fprs=DEFAULT_TARGET_FPRS):
+    """ROC / PR の全点と AUC / AP、目標 FPR ごとの動作点を dict で返す"""
+    thr, tp, fp = sweep(y_true_bin, score)
+    P = int(np.count_nonzero(y_true_bin)); N = int(np.size(y_true_bin)) - P
+    tpr = tp / P if P else np.zeros(tp.shape)
+    fpr = fp / N if N else np.zeros(fp.shape)
+    precision = np.divide(tp, tp + fp, out=np.ones(tp.shape), where=(tp + fp) > 0)
+    # 原点 (0,0) を足して台形則
+    fpr0 = np.r_[0.0, fpr]; tpr0 = np.r_[0.0, tpr]
+    roc_auc = float(np.sum(np.diff(fpr0) * (tpr0[1:] + tpr0[:-1]) / 2)) if P and N else None
+    ap = float(np.sum(np.diff(tpr0) * precision)) if P else None
+
+    points = []
+    for t in target_fprs:
+        ok = np.flatnonzero(fpr <= t)
+        if ok.size == 0:
+            points.append({"target_fpr": t, "threshold": None, "recall": 0.0, "fpr": 0.0, "precision": None,
+                           "tp": 0, "fp": 0}); continue
+        i = ok[np.argmax(tpr[ok])]  # FPR を守る範囲で Recall 最大（同値なら最も厳しいしきい値）
+        points.append({"target_fpr": t, "threshold": float(thr[i]), "recall": float(tpr[i]), "fpr": float(fpr[i]),
+                       "precision": float(precision[i]), "tp": int(tp[i]), "fp": int(fp[i])})
+    return {"thr": thr, "tpr": tpr, "fpr": fpr, "precision": precision, "roc_auc": roc_auc,
+            "average_precision": ap, "operating_points": points, "P": P, "N": N}
+
+
+def _thin(a, b, max_points: int):
+    """(a+b) の累積変化で間引いた index（両端は必ず残す）"""
+    if a.size <= max_points:
+        return np.arange(a.size)
+    arc = np.r_[0.0, np.cumsum(np.abs(np.diff(a)) + np.abs(np.diff(b)))]
+    step = arc[-1] / (max_points - 1) if arc[-1] > 0 else 1.0
+    bucket = np.floor(arc / step).astype(np.int64)
+    keep = np.r_[0, np.flatnonzero(np.diff(bucket)) + 1, a.size - 1]
+    return np.unique(keep)
+
+
+def compact(c: dict, max_points: int = 256, digits: int = 6) -> dict:
+    """curves() の結果を results.json 向けに小さくする"""
+    r = lambda v: np.round(np.asarray(v, dtype=np.float64), digits).tolist()
+    ir = _thin(c["fpr"], c["tpr"], max_points)
+    ip = _thin(c["tpr"], c["precision"], max_points)
+    thr = np.where(np.isfinite(c["thr"]), c["thr"], np.sign(c["thr"]) * 1e30)  # JSON に inf を書かない
+    return {
+        "roc_auc": c["roc_auc"], "average_precision": c["average_precision"],
+        "operating_points": c["operating_points"],
+        "roc": {"fpr": r(c["fpr"][ir]), "tpr": r(c["tpr"][ir]), "thr": r(thr[ir])},
+        "pr": {"recall": r(c["tpr"][ip]), "precision": r(c["precision"][ip]), "thr": r(thr[ip])},
+        "n_thresholds": int(c["thr"].size),
+    }
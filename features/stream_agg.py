@@ -0,0 +1,139 @@
+# -*- coding: utf-8 -*-
+# features/stream_agg.py
+# pod ごとのフレーム列（元順序 = idx0 昇順）に対する判定集約と、検知までの時間・誤警報率の算出。
+#   - 入力は全 pod を連結した 1 本の列 + pod 先頭位置。kofm / cusum は列全体を一括でベクトル計算する
+#       kofm : 直近 m フレーム中 k 以上が悪性判定なら警報（pod 先頭をまたがない cumsum 差分）
+#       ewma : スコアの指数移動平均 e_t = α s_t + (1-α) e_{t-1}（e_0 = s_0）が thr 以上で警報
+#              （再帰なので pod ごとに lfilter。ループは pod 数回で、各 pod の中は C で回る）
+#       cusum: S_t = max(0, S_{t-1} + s_t - k) が h 以上で警報（累積和 − 累積最小で再帰なしに計算。
+#              累積最小は値の順位から pod ごとのオフセットを引いて 1 回の minimum.accumulate で pod 先頭から取り直す）
+#   - 警報 = 警報状態の立ち上がり。悪性 pod は最初の警報までの時間（TTD）、良性 pod は警報数 / 観測時間
+#     （evaluate の pod ごとの集計は pod 数回のループ）
+#   - 秒単位の指標（TTD[s]・良性 pod の観測時間）は t_ns が全フレームそろっている pod だけで数える
+import numpy as np
+from raw_reader import NO_TS
+
+
+def order_by_pod(pod, idx0):
+    """pod ごと・idx0 昇順に並べる置換と、並べ替え後の pod 先頭位置（各行の所属 pod の先頭 index）"""
+    order = np.lexsort((idx0, pod))
+    p = np.asarray(pod)[order]
+    is_start = np.r_[True, p[1:] != p[:-1]] if p.size else np.zeros(0, dtype=bool)
+    starts = np.flatnonzero(is_start)
+    head = np.repeat(starts, np.diff(np.r_[starts, p.size]))
+    return order, starts, head
+
+
+def kofm(decision, head, k: int, m: int):
+    d = np.asarray(decision, dtype=np.int64)
+    c = np.r_[0, np.cumsum(d)]
+    t = np.arange(d.size)
+    lo = np.maximum(t + 1 - m, head)
+    return (c[t + 1] - c[lo]) >= k
+
+
+def _segments(starts, size):
+    ends = np.r_[starts[1:], size]
+    return zip(starts.tolist(), ends.tolist())
+
+
+def ewma(score, starts, alpha: float, thr: float):
+    from scipy.signal import lfilter
+    s = np.asarray(score, dtype=np.float64)
+    e = np.empty_like(s)
+    for a, b in _segments(starts, s.size):
+        e[a:b], _ = lfilter([alpha], [1.0, -(1.0 - alpha)], s[a:b], zi=[(1.0 - alpha) * s[a]])
+    return e >= thr
+
+
+def cusum(score, starts, head, k: float, h: float):
+    x = np.asarray(score, dtype=np.float64) - k
+    c = np.cumsum(x)
+    base = np.r_[0.0, c][head]                     # pod 先頭直前までの累積
+    cp = c - base                                  # pod 内の累積和 C_t
+    # pod 内の累積最小 min_{j<=t} C_j: C の順位 r（0..N-1）から pod 番号 × N を引くと、後の pod の値は
+    # 前の pod のどの値よりも小さくなるので、列全体の minimum.accumulate が pod 先頭で取り直しになる（整数なので丸め誤差なし）
+    srt = np.argsort(cp)
+    r = np.empty(cp.size, dtype=np.int64)
+    r[srt] = np.arange(cp.size)
+    off = (np.cumsum(head == np.arange(cp.size)) - 1) * np.int64(cp.size)
+    run_min = cp[srt[np.minimum.accumulate(r - off) + off]]
+    S = cp - np.minimum(0.0, run_min)              # S_t = C_t - min(0, min_{j<=t} C_j)
+    return S >= h
+
+
+def rising_edges(alarm, head):
+    a = np.asarray(alarm, dtype=bool)
+    prev = np.r_[False, a[:-1]]
+    prev[head == np.arange(a.size)] = False
+    return a & ~prev
+
+
+def evaluate(alarm, starts, head, malicious_pod, t_ns):
+    """
+    alarm: 並べ替え済み列の警報状態。malicious_pod: pod 先頭ごとの悪性フラグ。t_ns: 並べ替え済みのフレーム時刻
+    戻り値: dict（悪性 pod の TTD[frames / s]、良性 pod の誤警報数と時間あたり件数）
+      t_ns が欠けたフレームを含む pod は秒単位の指標から外す（pods_without_time に件数）
+    """
+    edges = rising_edges(alarm, head)
+    ts_ok = np.asarray(t_ns) != NO_TS if t_ns.size == alarm.size else np.zeros(alarm.size, dtype=bool)
+    bad = np.r_[0, np.cumsum(~ts_ok)]
+    ttd_f, ttd_s, det = [], [], 0
+    fa, frames_neg, ns_neg, fa_timed, untimed = 0, 0, 0, 0, 0
+    for (a, b), mal in zip(_segments(starts, alarm.size), malicious_pod):
+        timed = bad[b] == bad[a]
+        untimed += not timed
+        if mal:
+            hit = np.flatnonzero(alarm[a:b])
+            if hit.size:
+                det += 1
+                ttd_f.append(int(hit[0]) + 1)  # 判定に使ったフレーム数
+                if timed:
+                    ttd_s.append((int(t_ns[a + hit[0]]) - int(t_ns[a])) / 1e9)
+        else:
+            n_fa = int(edges[a:b].sum())
+            fa += n_fa
+            frames_neg += b - a
+            if timed:
+                ns_neg += int(t_ns[b - 1]) - int(t_ns[a])
+                fa_timed += n_fa
+    n_mal = int(np.count_nonzero(malicious_pod))
+    has_time = untimed < len(malicious_pod)
+    hours = ns_neg / 3.6e12
+    return {
+        "pods_malicious": n_mal, "pods_detected": det,
+        "ttd_frames": {"median": float(np.median(ttd_f)) if ttd_f else None,
+                       "max": int(max(ttd_f)) if ttd_f else None},
+        "ttd_sec": {"median": float(np.median(ttd_s)) if ttd_s else None,
+                    "max": float(max(ttd_s)) if ttd_s else None} if has_time else None,
+        "pods_benign": int(len(malicious_pod) - n_mal), "false_alerts": fa,
+        "benign_frames": int(frames_neg),
+        "benign_hours": hours if has_time else None,
+        "false_alerts_per_hour": (fa_timed / hours if hours > 0 else None) if has_time else None,
+        "pods_without_time": untimed,
+        "false_alerts_per_10k_frames": fa / frames_neg * 1e4 if frames_neg else None,
+    }
+
+
+def parse_specs(kofm_spec: str, ewma_spec: str, cusum_spec: str):
+    """'3/5,5/10' / '0.1:0.5' / '0.5:5' → [(name, kind, params)]"""
+    out = [("window", "window", {})]
+    for tok in filter(None, (t.strip() for t in kofm_spec.split(","))):
+        k, m = tok.split("/"); out.append((f"kofm_{k}/{m}", "kofm", {"k": int(k), "m": int(m)}))
+    for tok in filter(None, (t.strip() for t in ewma_spec.split(","))):
+        a, thr = tok.split(":"); out.append((f"ewma_{a}:{thr}", "ewma", {"alpha": float(a), "thr": float(thr)}))
+    for tok in filter(None, (t.strip() for t in cusum_spec.split(","))):
+        k, h = tok.split(":"); out.append((f"cusum_{k}:{h}", "cusum", {"k": float(k), "h": float(h)}))
+    return out
+
+
+def run_aggregator(kind, params, decision, score, starts, head):
+    if kind == "window":
+        return np.asarray(decision, dtype=bool)
+    if kind == "kofm":
+        return kofm(decision, head, params["k"], params["m"])
+    if kind == "ewma":
+        return ewma(score, starts, params["alpha"], params["thr"])
+    if kind == "cusum":
+        return cusum(score, starts, head, params["k"], params["h"])
+    raise ValueError(f"unknown aggregator: {kind}")
@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+# features/stream_fit.py
+# mmap した X.npy をチャンク単位で読み、partial_fit で学習するための共通部品。
+#   - エポックごとに全行の置換を 1 本引き、チャンクはその連続区間（merged の X / y はワークロードごとに連続なので、
+#     ブロック単位のシャッフルだとほぼ全チャンクが 1 クラスになる）。チャンク内の行番号はソートして mmap から読み、
+#     読んだ後でチャンク内を並べ替える
+#   - int → float64 変換はチャンクごと（全体を RAM に載せない）
+#   - 各エポック後に val で評価し、patience 回改善しなければ打ち切って最良エポックのモデルを返す
+import copy, time
+import numpy as np
+
+
+def iter_shuffled_chunks(X, y, chunk: int, rng):
+    """(xb[float64], yb) を一様シャッフル順に返す。X は mmap のままで良い"""
+    N = X.shape[0]
+    order = rng.permutation(N).astype(np.int64 if N >= 2**31 else np.int32)
+    for s in range(0, N, chunk):
+        idx = np.sort(order[s:s+chunk])
+        xb = np.asarray(X[idx], dtype=np.float64)
+        yb = np.asarray(y[idx])
+        perm = rng.permutation(xb.shape[0])
+        yield xb[perm], yb[perm]
+
+
+def predict_chunked(clf, X, chunk: int):
+    if X.shape[0] == 0:
+        return np.empty((0,), dtype=np.int64)
+    return np.concatenate([clf.predict(np.asarray(X[i:i+chunk], dtype=np.float64))
+                           for i in range(0, X.shape[0], chunk)])
+
+
+def fit_streaming(clf, Xtr, ytr, Xva, yva, classes, *, epochs: int, chunk: int,
+                  patience: int = 3, tol: float = 1e-4, seed: int = 42, transform=None):
+    """
+    partial_fit によるアウトオブコア学習。transform を与えると各チャンクに適用してから渡す。
+    戻り値: (最良エポックの clf, history[list of dict])
+    """
+    rng = np.random.default_rng(seed)
+    best, best_acc, bad = None, -np.inf, 0
+    history = []
+    for ep in range(epochs):
+        t0 = time.perf_counter()
+        for xb, yb in iter_shuffled_chunks(Xtr, ytr, chunk, rng):
+            clf.partial_fit(transform(xb) if transform is not None else xb, yb, classes=classes)
+        fit_sec = time.perf_counter() - t0
+        if Xva.shape[0]:
+            pred = predict_chunked(_ChunkTransform(clf, transform), Xva, chunk)
+            val_acc = float((pred == np.asarray(yva)).mean())
+        else:
+            val_acc = float("nan")
+        history.append({"epoch": ep + 1, "fit_sec": round(fit_sec, 3), "val_acc": val_acc})
+        print(f"[EPOCH {ep+1}/{epochs}] {fit_sec:.1f}s  val_acc={val_acc:.4f}")
+
+        if not Xva.shape[0] or val_acc > best_acc + tol:
+            best, best_acc, bad = copy.deepcopy(clf), val_acc, 0
+        else:
+            bad += 1
+            if bad >= patience:
+                print(f"[EARLY STOP] no val improvement for {patience} epochs (best={best_acc:.4f})")
+                break
+    return (best if best is not None else clf), history
+
+
+class _ChunkTransform:
+    """predict 前に transform を挟む薄いラッパ（評価用）"""
+
+    def __init__(self, clf, transform):
+        self.clf = clf; self.transform = transform
+
+    def predict(self, X):
+        return self.clf.predict(self.transform(X) if self.transform is not None else X)
@@ -0,0 +1,37 @@
+# -*- coding: utf-8 -*-
+# features/tests/test_ngram_overlap.py
+# split ごとの syscall 番号の最大値のビット長が違っても、同じ窓は split 間で一致と数えること
+import os, sys
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), ".."))
+from ngram_overlap import analyze
+
+
+def _copied_splits(n: int):
+    """train に 1 つだけ 9 ビットの番号（300）を入れ、val / test は train の窓のコピー（8 ビットに収まる）"""
+    rng = np.random.default_rng(0)
+    tr = rng.integers(0, 200, (1000, n))
+    tr[0, 0] = 300
+    X = {"train": tr, "val": tr[1:200].copy(), "test": tr[200:500].copy()}
+    y = {s: (np.arange(v.shape[0]) % 2).astype(np.int64) for s, v in X.items()}
+    y["val"] = y["train"][1:200].copy(); y["test"] = y["train"][200:500].copy()
+    return X, y
+
+
+def test_split_maxima_with_different_bit_lengths_packed():
+    X, y = _copied_splits(5)  # 5 × 9 bits = 45 ≤ 64: ビット詰め
+    out = analyze(X, y, {"a": 0, "b": 1})
+    assert out["key"] == "packed"
+    for pair in ("val~train", "test~train", "test~train+val"):
+        assert out["pairs"][pair]["in_ref"] == 1.0
+        assert out["pairs"][pair]["in_ref_same_class"] == 1.0
+
+
+def test_split_maxima_with_different_bit_lengths_hash():
+    X, y = _copied_splits(8)  # train は 8 × 9 = 72 > 64（ハッシュ）、val / test だけなら 8 × 8 = 64（ビット詰め）
+    out = analyze(X, y, {"a": 0, "b": 1})
+    assert out["key"] == "hash64"
+    for pair in ("val~train", "test~train", "test~train+val"):
+        assert out["pairs"][pair]["in_ref"] == 1.0
+        assert out["pairs"][pair]["hash_collisions"] == 0
@@ -0,0 +1,304 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+# features/train-all.py
+# (model, n) の行列を一括学習するドライバ。
+#   - merged データセット（<DATA_ROOT>/<label>-<n>gram）は n ごとに 1 回だけ検証し、
+#     各ワーカは同じ X.npy / y.npy を読み取り専用 mmap で開く（ページキャッシュを共有）
+#   - DT / KNN / MLP / SVM は並列ワーカプロセスで学習（ワーカごとに BLAS/OpenMP スレッド数を制限）
+#   - Keras（rnn）は専用ワーカ 1 プロセスで学習し、NumPy 推論用の .npz も書き出す
+#   - モデルごとに学習時間とピークメモリ（ワーカの max RSS）を記録し JSON に保存
+#   - --cv blocked:5 / rolling:5 なら features/cv_split.py の fold ごとに学習・評価する（fold ごとに 1 タスク。
+#     split ファイルの行区間を mmap から切り出すだけなので、データセットの作り直しもディスクへのコピーも無い）。
+#     CV ではモデルは保存せず、fold ごとの精度と平均・標準偏差を記録する
+#   - --bundle なら <out-dir>/<model>_<n>.bundle（features/model_bundle.py）も書く（eval 側はバンドルを優先して mmap でロード）
+# 例:
+#   python features/train-all.py --label 15m-1000hz --matrix dt:35,knn:5,mlp:10,svm:50,rnn:40 --jobs 4
+#   python features/train-all.py --label 15m-1000hz --matrix dt:35,mlp:10 --cv blocked:5
+from pathlib import Path
+import argparse, json, os, time, importlib.util
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime
+from zoneinfo import ZoneInfo
+import numpy as np
+from proc_mem import peak_rss_mb
+from cv_split import parse_cv_spec, make_folds, open_arrays, gather, fold_sizes
+
+JST = ZoneInfo("Asia/Tokyo")
+FEATURES_DIR = Path(__file__).resolve().parent
+DATA_ROOT = "dataset/npy/merged"
+DEFAULT_MATRIX = "rnn:40,dt:35,svm:50,mlp:10,knn:5"  # eval-noise.py の MODELS と同じ組
+OUT_NAMES = {
+    "dt":  "dt_{n}.joblib",
+    "knn": "knn_{n}.joblib",
+    "mlp": "mlp_{n}.joblib",
+    "svm": "svm_{n}_all.joblib",
+    "rnn": "lstm_{n}.model.keras",
+}
+
+def out_name(kind: str, n: int) -> str:
+    """保存ファイル名。eval 側の固定モデル（eval_common.MODEL_FILES）に同じ <kind>_<n> があればそのファイル名に揃える
+    （rnn:40 → lstm.model.keras。揃えないと eval が学習し直したモデルを読まない）"""
+    from eval_common import MODEL_FILES
+    for m in MODEL_FILES:
+        if m["name"] == f"{kind}_{n}":
+            return Path(m["model_path"]).name
+    return OUT_NAMES[kind].format(n=n)
+
+def now_jst_str():
+    return datetime.now(JST).strftime("%Y-%m-%d %H:%M:%S %Z")
+
+def parse_matrix(spec: str):
+    jobs = []
+    for item in spec.split(","):
+        item = item.strip()
+        if not item:
+            continue
+        kind, _, n = item.partition(":")
+        if kind not in OUT_NAMES or not n.isdigit():
+            raise ValueError(f"bad matrix entry: {item!r} (expected <{'|'.join(OUT_NAMES)}>:<n>)")
+        jobs.append((kind, int(n)))
+    return jobs
+
+def load_train_script(kind: str):
+    """features/train-<kind>.py をモジュールとして読み込む（make_model / load_split を再利用）"""
+    spec = importlib.util.spec_from_file_location(f"train_{kind}", FEATURES_DIR / f"train-{kind}.py")
+    mod = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(mod)
+    return mod
+
+def open_split(base: Path, split: str):
+    X = np.load(base/split/"X.npy", mmap_mode="r", allow_pickle=False)
+    y = np.load(base/split/"y.npy", allow_pickle=False)
+    assert X.shape[0] == y.shape[0], f"size mismatch in {split}"
+    return X, y
+
+def check_dataset(base: Path, n: int):
+    """親で 1 回だけ meta と shape を検証（ワーカはこのパスを mmap で開くだけ）"""
+    meta = json.load(open(base/"meta.json"))
+    assert int(meta["n"]) == n, f"n mismatch: meta.n={meta['n']} vs {n} ({base})"
+    shapes = {}
+    for split in ("train", "val", "test"):
+        X, y = open_split(base, split)
+        assert X.shape[1] == n, f"X width != n in {base}/{split}"
+        shapes[split] = int(X.shape[0])
+    return meta, shapes
+
+def open_fold(base: Path, fold):
+    """fold（cv_split の区間）→ {split: (X, y)}。fold=None なら split ファイルをそのまま開く"""
+    if fold is None:
+        return {s: open_split(base, s) for s in ("train", "val", "test")}
+    arrays = open_arrays(base)
+    return {s: (gather(arrays["X"], fold[s]), gather(arrays["y"], fold[s])) for s in ("train", "val", "test")}
+
+def accuracy(scorer, X, y) -> float:
+    if X.shape[0] == 0:
+        return float("nan")
+    from sklearn.metrics import accuracy_score
+    return float(accuracy_score(y, scorer.predict(X)))
+
+# ---------------------------
+# ワーカ
+# ---------------------------
+
+def train_sklearn(kind: str, n: int, base: str, out_path: str, threads: int, fold=None, bundle: bool = False):
+    from threadpoolctl import threadpool_limits
+    import joblib
+    base = Path(base); out_path = Path(out_path)
+    with threadpool_limits(limits=threads):
+        mod = load_train_script(kind)
+        data = open_fold(base, fold)
+        (Xtr, ytr), (Xva, yva), (Xte, yte) = data["train"], data["val"], data["test"]
+
+        clf = mod.make_model()
+        t0 = time.perf_counter()
+        clf.fit(Xtr, ytr)
+        fit_sec = time.perf_counter() - t0
+
+        scorer = clf
+        index = None
+        if kind == "knn":
+            from knn_index import build_index, KNNLookup
+            index = build_index(clf, Xtr)
+            if index is None:
+                print(f"[INDEX] knn_{n}: skipped（窓が 64bit キーに収まらないので素の KNN のみ）")
+            else:
+                scorer = KNNLookup(clf, index)
+        acc = {name: accuracy(scorer, X, y) for name, X, y in [("val", Xva, yva), ("test", Xte, yte)]}
+
+        if fold is None:
+            out_path.parent.mkdir(parents=True, exist_ok=True)
+            joblib.dump(clf, out_path)
+            if kind == "knn":
+                from knn_index import save_index_for
+                save_index_for(out_path, index)  # 索引はモデルの sha256 付き。作らなかったときは前回の索引を消す
+            if bundle:
+                from model_bundle import save_bundle, bundle_path_for
+                save_bundle(bundle_path_for(out_path.parent, f"{kind}_{n}"), clf, name=f"{kind}_{n}", kind="sklearn",
+                            data_path=base, index=index, source=out_path)
+    return {"fit_sec": round(fit_sec, 3), "val_acc": acc["val"], "test_acc": acc["test"],
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+def train_keras(kind: str, n: int, base: str, out_path: str, threads: int, epochs: int, fold=None,
+                bundle: bool = False):
+    import tensorflow as tf
+    tf.config.threading.set_intra_op_parallelism_threads(threads)
+    tf.config.threading.set_inter_op_parallelism_threads(max(1, threads // 2))
+    base = Path(base); out_path = Path(out_path)
+    mod = load_train_script("rnn")
+    mod.keras.utils.set_random_seed(mod.SEED)
+    meta = json.load(open(base/"meta.json"))
+    if fold is None:
+        Xtr, ytr = mod.load_split(base, "train", n)
+        Xva, yva = mod.load_split(base, "val", n)
+        Xte, yte = mod.load_split(base, "test", n)
+    else:
+        data = open_fold(base, fold)
+        (Xtr, ytr), (Xva, yva), (Xte, yte) = [(X.astype("int32"), y.astype("int32"))
+                                              for X, y in (data["train"], data["val"], data["test"])]
+    vocab = int(max(X.max() for X in (Xtr, Xva, Xte) if X.shape[0])) + 1
+
+    model = mod.make_model(n, vocab, len(meta["label_map"]))
+    t0 = time.perf_counter()
+    model.fit(Xtr, ytr, validation_data=(Xva, yva) if Xva.shape[0] else None, epochs=epochs, batch_size=1024, verbose=0)
+    fit_sec = time.perf_counter() - t0
+    val_acc = model.evaluate(Xva, yva, verbose=0)[1] if Xva.shape[0] else float("nan")
+    test_acc = model.evaluate(Xte, yte, verbose=0)[1] if Xte.shape[0] else float("nan")
+
+    if fold is None:
+        out_path.parent.mkdir(parents=True, exist_ok=True)
+        model.save(out_path)
+        from lstm_numpy import export_keras, npz_path_for, load_npz_model
+        export_keras(out_path, npz_path_for(out_path))
+        if bundle:
+            from model_bundle import save_bundle, bundle_path_for
+            save_bundle(bundle_path_for(out_path.parent, f"{kind}_{n}"), load_npz_model(npz_path_for(out_path)),
+                        name=f"{kind}_{n}", kind="keras", data_path=base, source=out_path)
+    return {"fit_sec": round(fit_sec, 3), "val_acc": float(val_acc), "test_acc": float(test_acc),
+            "peak_rss_mb": round(peak_rss_mb(), 1)}
+
+# ---------------------------
+# エントリポイント
+# ---------------------------
+
+def parse_args():
+    ap = argparse.ArgumentParser(description="Train a (model, n) matrix in parallel worker processes")
+    ap.add_argument("--label", required=True, help="dataset label (e.g., 15m-1000hz) → <data-root>/<label>-<n>gram")
+    ap.add_argument("--matrix", default=DEFAULT_MATRIX, help="カンマ区切りの <model>:<n>（model ∈ dt,knn,mlp,svm,rnn）")
+    ap.add_argument("--data-root", default=DATA_ROOT)
+    ap.add_argument("--out-dir", default="models")
+    ap.add_argument("--jobs", type=int, default=max(1, min(4, (os.cpu_count() or 1))), help="sklearn ワーカ数")
+    ap.add_argument("--threads", type=int, default=0, help="ワーカあたりのスレッド数（0: cpu_count // jobs）")
+    ap.add_argument("--rnn-epochs", type=int, default=10)
+    ap.add_argument("--bundle", action="store_true", help="モデルバンドル <out-dir>/<model>_<n>.bundle も書く")
+    ap.add_argument("--cv", default="", help="時系列 CV: blocked:<k> / rolling:<k>（モデルは保存しない）")
+    ap.add_argument("--cv-guard", type=int, default=-1, help="[--cv] fold 境界で捨てるフレーム数（既定: n）")
+    ap.add_argument("--cv-val-frac", type=float, default=0.2, help="[--cv] train から切り出す val の割合")
+    ap.add_argument("--cv-window", type=int, default=0, help="[--cv rolling] train を test 直前のこのフレーム数に限る（0: 全部）")
+    ap.add_argument("--report", default="", help="結果 JSON（未指定なら eval/train-all-<label>.json）")
+    return ap.parse_args()
+
+def main():
+    args = parse_args()
+    matrix = parse_matrix(args.matrix)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // max(1, args.jobs))
+    start_all = now_jst_str()
+    print(f"[START] {start_all}  train {len(matrix)} models  jobs={args.jobs} threads/worker={threads}")
+
+    cv = parse_cv_spec(args.cv) if args.cv else None
+
+    # n ごとに 1 回だけ検証（CV なら fold の区間もここで作る）
+    datasets, cv_folds, cv_info = {}, {}, {}
+    for n in sorted({n for _, n in matrix}):
+        base = Path(args.data_root) / f"{args.label}-{n}gram"
+        try:
+            _meta, shapes = check_dataset(base, n)
+            datasets[n] = (base, None)
+            print(f"[DATA ] n={n}  base={base}  train={shapes['train']} val={shapes['val']} test={shapes['test']}")
+            if cv:
+                cv_folds[n], cv_info[n] = make_folds(base, cv[0], cv[1], None if args.cv_guard < 0 else args.cv_guard,
+                                                     args.cv_val_frac, args.cv_window)
+                gg = cv_info[n].get("group_guard")
+                for i, fold in enumerate(cv_folds[n]):
+                    sz = fold_sizes(fold)
+                    drop = f"  group_guard_dropped={gg['dropped'][i]}" if gg else ""
+                    print(f"[FOLD ] n={n}  {cv[0]} {i + 1}/{cv[1]}  train={sz['train']} val={sz['val']} test={sz['test']}"
+                          f"  ranges={sum(len(fold[s]) for s in fold)}{drop}")
+        except Exception as e:
+            datasets[n] = (base, f"{type(e).__name__}: {e}")
+            print(f"[ERROR] n={n}: {datasets[n][1]}")
+
+    # spawn + 1 タスク 1 プロセス: ワーカの max RSS がそのままモデル単位のピークメモリになる
+    ctx = mp.get_context("spawn")
+    sk_pool = ProcessPoolExecutor(max_workers=args.jobs, mp_context=ctx, max_tasks_per_child=1)
+    tf_pool = ProcessPoolExecutor(max_workers=1, mp_context=ctx, max_tasks_per_child=1)
+    futures = {}
+    results = []
+    for kind, n in matrix:
+        base, err = datasets[n]
+        out_path = Path(args.out_dir) / out_name(kind, n)
+        row = {"name": f"{kind}_{n}", "kind": kind, "n": n, "data_path": str(base),
+               "model_path": str(out_path), "threads": threads}
+        if err:
+            results.append({**row, "error": err})
+            continue
+        for i, fold in enumerate(cv_folds[n] if cv else [None]):
+            frow = {**row, "fold": i + 1, **fold_sizes(fold)} if fold is not None else row
+            if kind == "rnn":
+                fut = tf_pool.submit(train_keras, kind, n, str(base), str(out_path), threads, args.rnn_epochs, fold,
+                                     args.bundle)
+            else:
+                fut = sk_pool.submit(train_sklearn, kind, n, str(base), str(out_path), threads, fold, args.bundle)
+            futures[fut] = (frow, time.perf_counter())
+
+    fold_rows = []
+    for fut in as_completed(futures):
+        row, t0 = futures[fut]
+        tag = f"{row['name']} fold {row['fold']}/{cv[1]}" if cv else row["name"]
+        try:
+            res = fut.result()
+            row = {**row, **res, "wall_sec": round(time.perf_counter() - t0, 3), "finished_at": now_jst_str()}
+            print(f"[DONE ] {row['finished_at']}  {tag}  fit={res['fit_sec']:.1f}s"
+                  f"  peak_rss={res['peak_rss_mb']:.0f}MB  val={res['val_acc']:.4f} test={res['test_acc']:.4f}")
+        except Exception as e:
+            row = {**row, "error": f"{type(e).__name__}: {e}", "finished_at": now_jst_str()}
+            print(f"[ERROR] {tag}: {row['error']}")
+        (fold_rows if cv else results).append(row)
+    sk_pool.shutdown(); tf_pool.shutdown()
+
+    if cv:
+        # fold の行をモデルごとにまとめる（train_*.py と同じ "val_acc" / "test_acc" の平均・標準偏差）
+        for kind, n in matrix:
+            name = f"{kind}_{n}"
+            if any(r["name"] == name for r in results):
+                continue  # データセットのエラー
+            rows = sorted((r for r in fold_rows if r["name"] == name), key=lambda r: r["fold"])
+            ok = [r for r in rows if "error" not in r]
+            summary = {"name": name, "kind": kind, "n": n, "data_path": rows[0]["data_path"], "threads": threads,
+                       "cv": cv_info[n], "folds": [{k: v for k, v in r.items()
+                                                    if k not in ("name", "kind", "n", "data_path", "model_path", "threads")}
+                                                   for r in rows]}
+            for key in ("val_acc", "test_acc", "fit_sec"):
+                v = np.array([r[key] for r in ok], dtype=np.float64)
+                v = v[~np.isnan(v)]
+                summary[key] = {"mean": float(v.mean()), "std": float(v.std())} if v.size else None
+            if len(ok) < len(rows):
+                summary["error"] = f"{len(rows) - len(ok)}/{len(rows)} folds failed"
+            results.append(summary)
+            if summary["test_acc"]:
+                print(f"[CV   ] {name}  test_acc={summary['test_acc']['mean']:.4f} ± {summary['test_acc']['std']:.4f}"
+                      f"  ({len(ok)}/{len(rows)} folds)")
+
+    order = {f"{k}_{n}": i for i, (k, n) in enumerate(matrix)}
+    results.sort(key=lambda r: order[r["name"]])
+    suffix = f"-cv-{cv[0]}{cv[1]}" if cv else ""
+    out = Path(args.report or f"eval/train-all-{args.label}{suffix}.json")
+    out.parent.mkdir(parents=True, exist_ok=True)
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump({"started_at": start_all, "finished_at": now_jst_str(), "label": args.label,
+                   "jobs": args.jobs, "threads_per_worker": threads, "cv": args.cv or None, "results": results},
+                  f, indent=2)
+    print(f"[SAVED] {out}")
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,10 @@ def load_split(base: Path, split: str):
     assert X.shape[0] == y.shape[0], f"size mismatch in {split}"
     return X, y
 
+def make_model():
+    # --- Decision Tree (論文準拠: Criterion=Gini, Splitter=Best, その他デフォルト) ---
+    return DecisionTreeClassifier(criterion="gini", splitter="best", random_state=SEED)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--merged", default="dataset/npy/merged/five-40gram",
@@ -30,8 +34,7 @@ def main():
     Xva, yva = load_split(base, "val")
     Xte, yte = load_split(base, "test")
 
-    # --- Decision Tree (論文準拠: Criterion=Gini, Splitter=Best, その他デフォルト) ---
-    dt = DecisionTreeClassifier(criterion="gini", splitter="best", random_state=SEED)
+    dt = make_model()
     dt.fit(Xtr, ytr)
 
     # 検証＆テスト
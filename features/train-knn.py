@@ -3,6 +3,7 @@ from pathlib import Path
 import argparse, json, numpy as np, joblib
 from sklearn.neighbors import KNeighborsClassifier
 from sklearn.metrics import accuracy_score, classification_report
+from knn_index import build_index, save_index_for, key_bits, KNNLookup
 
 def load_split(base: Path, split: str):
     X = np.load(base/split/"X.npy", allow_pickle=False)   # shape [N, n]
@@ -10,11 +11,17 @@ def load_split(base: Path, split: str):
     assert X.shape[0] == y.shape[0], f"size mismatch in {split}"
     return X, y
 
+def make_model():
+    # --- KNN (論文準拠): k=5, uniform, Minkowski(p=2)=Euclidean ---
+    return KNeighborsClassifier(n_neighbors=5, weights="uniform", metric="minkowski", p=2)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--merged", default="dataset/npy/merged/five-5gram",
                     help="使用する merged ディレクトリ（five-5gram など）")
     ap.add_argument("--out", default="", help="保存先（未指定なら n を読み models/knn_<n>.joblib）")
+    ap.add_argument("--no-index", action="store_true", help="完全一致ルックアップ索引（*.index.npz）を作らない")
+    ap.add_argument("--verify", action="store_true", help="索引経由の予測が素の KNN と一致するか test で確認")
     args = ap.parse_args()
 
     base = Path(args.merged)
@@ -26,20 +33,40 @@ def main():
     Xva, yva = load_split(base, "val")
     Xte, yte = load_split(base, "test")
 
-    # --- KNN (論文準拠): k=5, uniform, Minkowski(p=2)=Euclidean ---
-    knn = KNeighborsClassifier(n_neighbors=5, weights="uniform", metric="minkowski", p=2)
+    knn = make_model()
     knn.fit(Xtr, ytr)
 
+    # --- 完全一致索引: 学習窓のユニーク集合に 1 回だけ KNN を当てて票を記録 ---
+    clf = knn
+    index = None
+    if not args.no_index:
+        index = build_index(knn, Xtr)
+        if index is None:
+            print(f"[INDEX] skipped: n={n} x bits={key_bits(Xtr.max())} = {n * key_bits(Xtr.max())} > 64（キーに収まらないので素の KNN のみ）")
+        else:
+            clf = KNNLookup(knn, index)
+            print(f"[INDEX] unique_windows={index['keys'].shape[0]} / train={len(Xtr)}  bits={int(index['bits'])}")
+
+    preds = {}
     for name, X, y in [("val", Xva, yva), ("test", Xte, yte)]:
-        pred = knn.predict(X)
-        print(f"[{name.upper()}] acc={accuracy_score(y, pred):.4f}")
+        preds[name] = clf.predict(X)
+        hit = f"  index_hit={clf.last_hit_rate:.4f}" if index is not None else ""
+        print(f"[{name.upper()}] acc={accuracy_score(y, preds[name]):.4f}{hit}")
+    pred_te = preds["test"]
     print("\n[TEST] classification report:")
-    print(classification_report(yte, knn.predict(Xte), digits=4))
+    print(classification_report(yte, pred_te, digits=4))
+
+    if args.verify and index is not None:
+        same = np.array_equal(pred_te, knn.predict(Xte))
+        print(f"[VERIFY] index predictions identical to KNN: {same}")
 
     out = Path(args.out) if args.out else Path(f"models/knn_{n}.joblib")
     out.parent.mkdir(parents=True, exist_ok=True)
     joblib.dump(knn, out)
     print("Saved:", out)
+    ip = save_index_for(out, index)  # 索引を作らなかったときは前回の索引を消す
+    if ip is not None:
+        print("Saved:", ip)
 
 if __name__ == "__main__":
     main()
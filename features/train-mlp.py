@@ -2,49 +2,84 @@
 from pathlib import Path
 import argparse, json, numpy as np, joblib, random
 from sklearn.neural_network import MLPClassifier
+from sklearn.linear_model import SGDClassifier
 from sklearn.metrics import accuracy_score, classification_report
+from stream_fit import fit_streaming, predict_chunked
 
 SEED = 42
 random.seed(SEED); np.random.seed(SEED)
 
-def load_split(base: Path, split: str):
-    X = np.load(base/split/"X.npy", allow_pickle=False)    # shape [N, n]
+def load_split(base: Path, split: str, mmap: bool = False):
+    X = np.load(base/split/"X.npy", mmap_mode="r" if mmap else None, allow_pickle=False)    # shape [N, n]
     y = np.load(base/split/"y.npy", allow_pickle=False)    # labels 0..4
     assert X.shape[0] == y.shape[0], f"size mismatch in {split}"
     return X, y
 
+def make_model():
+    # --- MLP (論文準拠: hidden=(100,), relu, adam, lr=0.001、他は既定値) ---
+    return MLPClassifier(hidden_layer_sizes=(100,),
+                         activation="relu",
+                         solver="adam",
+                         learning_rate_init=0.001,
+                         random_state=SEED)
+
+def make_sgd():
+    # 線形モデル（ロジスティック回帰相当）。stream モード専用
+    return SGDClassifier(loss="log_loss", alpha=1e-5, random_state=SEED)
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--merged", default="dataset/npy/merged/five-10gram",
                     help="使用する merged ディレクトリ（five-10gram 他でもOK）")
-    ap.add_argument("--out", default="", help="保存先（未指定なら n を読み models/mlp_<n>.joblib）")
+    ap.add_argument("--out", default="", help="保存先（未指定なら n を読み models/<estimator>_<n>.joblib）")
+    ap.add_argument("--mode", choices=["full", "stream"], default="full",
+                    help="full: 全量ロードして fit / stream: mmap からシャッフル済みチャンクを partial_fit")
+    ap.add_argument("--estimator", choices=["mlp", "sgd"], default="mlp", help="[stream] 学習器")
+    ap.add_argument("--warm-start", default="", help="[stream] 既存モデル（例: models/mlp_10.joblib）から学習を継続")
+    ap.add_argument("--chunk-size", type=int, default=65536, help="[stream] チャンク行数")
+    ap.add_argument("--epochs", type=int, default=20, help="[stream] 最大エポック数")
+    ap.add_argument("--patience", type=int, default=3, help="[stream] val 精度が改善しないエポック数で打ち切り")
     args = ap.parse_args()
 
     base = Path(args.merged)
     meta = json.load(open(base/"meta.json"))
     n = int(meta["n"]); n_classes = len(meta["label_map"])
-    print(f"[INFO] base={base}  n={n}  classes={n_classes}")
+    print(f"[INFO] base={base}  n={n}  classes={n_classes}  mode={args.mode}")
 
-    Xtr, ytr = load_split(base, "train")
-    Xva, yva = load_split(base, "val")
-    Xte, yte = load_split(base, "test")
+    stream = args.mode == "stream"
+    if args.estimator != "mlp" and not stream:
+        ap.error("--estimator sgd は --mode stream でのみ使用できます")
+    Xtr, ytr = load_split(base, "train", stream)
+    Xva, yva = load_split(base, "val", stream)
+    Xte, yte = load_split(base, "test", stream)
 
-    # --- MLP (論文準拠: hidden=(100,), relu, adam, lr=0.001、他は既定値) ---
-    mlp = MLPClassifier(hidden_layer_sizes=(100,),
-                        activation="relu",
-                        solver="adam",
-                        learning_rate_init=0.001,
-                        random_state=SEED)
-    mlp.fit(Xtr, ytr)
+    if not stream:
+        mlp = make_model()
+        mlp.fit(Xtr, ytr)
+    else:
+        if args.warm_start:
+            mlp = joblib.load(args.warm_start)
+            print(f"[INFO] warm start from {args.warm_start}")
+        else:
+            mlp = make_model() if args.estimator == "mlp" else make_sgd()
+        # 既存モデルのクラス集合を維持（追加ランで一部クラスが欠けても partial_fit が通るように）
+        classes = getattr(mlp, "classes_", None)
+        if classes is None:
+            classes = np.asarray(sorted(int(v) for v in meta["label_map"].values()))
+        mlp, _hist = fit_streaming(mlp, Xtr, ytr, Xva, yva, classes, epochs=args.epochs,
+                                   chunk=args.chunk_size, patience=args.patience, seed=SEED)
 
+    preds = {}
     for name, X, y in [("val", Xva, yva), ("test", Xte, yte)]:
-        pred = mlp.predict(X)
+        pred = predict_chunked(mlp, X, args.chunk_size) if stream else mlp.predict(X)
+        preds[name] = pred
         acc = accuracy_score(y, pred)
         print(f"[{name.upper()}] acc={acc:.4f}")
     print("\n[TEST] classification report:")
-    print(classification_report(yte, mlp.predict(Xte), digits=4))
+    print(classification_report(yte, preds["test"], digits=4))
 
-    out = Path(args.out) if args.out else Path(f"models/mlp_{n}.joblib")
+    prefix = "mlp" if isinstance(mlp, MLPClassifier) else "sgd"
+    out = Path(args.out) if args.out else Path(f"models/{prefix}_{n}.joblib")
     out.parent.mkdir(parents=True, exist_ok=True)
     joblib.dump(mlp, out)
     print("Saved:", out)
@@ -1,48 +1,124 @@
 # features/train-svm.py
 from pathlib import Path
-import argparse, json, numpy as np, joblib, random
+import argparse, json, time, numpy as np, joblib, random
 from sklearn.svm import SVC
+from sklearn.kernel_approximation import Nystroem
+from sklearn.linear_model import SGDClassifier
+from sklearn.pipeline import Pipeline
 from sklearn.metrics import accuracy_score, classification_report
+from stream_fit import fit_streaming, predict_chunked
 
 SEED = 42
 random.seed(SEED); np.random.seed(SEED)
 
-def load_split(base: Path, split: str):
-    X = np.load(base/split/"X.npy", allow_pickle=False)   # shape [N, n]
+def load_split(base: Path, split: str, mmap: bool = False):
+    X = np.load(base/split/"X.npy", mmap_mode="r" if mmap else None, allow_pickle=False)   # shape [N, n]
     y = np.load(base/split/"y.npy", allow_pickle=False)   # labels 0..4
     assert X.shape[0] == y.shape[0], f"size mismatch in {split}"
     return X, y
 
+def make_model():
+    # --- SVM (論文準拠: RBF, C=1.0, gamma='scale') ---
+    # probability=False（既定）で計算軽量化。random_stateは一応固定。
+    return SVC(kernel="rbf", C=1.0, gamma="scale", random_state=SEED)
+
+def gamma_scale(X, chunk: int):
+    """SVC(gamma='scale') と同じ 1 / (n_features * X.var()) を mmap のままチャンク集計で求める"""
+    s = 0.0; ss = 0.0; cnt = 0
+    for i in range(0, X.shape[0], chunk):
+        xb = np.asarray(X[i:i+chunk], dtype=np.float64)
+        s += xb.sum(); ss += np.square(xb).sum(); cnt += xb.size
+    var = ss / cnt - (s / cnt) ** 2
+    return 1.0 / (X.shape[1] * var) if var > 0 else 1.0
+
+def train_approx(Xtr, ytr, Xva, yva, args):
+    """
+    RBF カーネル近似（Nystroem）+ 線形 SVM（SGD, hinge）を mmap 上のミニバッチで学習。
+    1 エポックあたり O(N * n_components) で、学習時間は N に線形。val で早期打ち切り。
+    """
+    rng = np.random.default_rng(SEED)
+    N = Xtr.shape[0]
+    gamma = gamma_scale(Xtr, args.batch_size)
+
+    # 基底点: train から n_components 行を無作為抽出（mmap からは昇順インデックスで読む）
+    m = min(args.n_components, N)
+    basis_idx = np.sort(rng.choice(N, size=m, replace=False))
+    feat = Nystroem(kernel="rbf", gamma=gamma, n_components=m, random_state=SEED)
+    feat.fit(np.asarray(Xtr[basis_idx], dtype=np.float64))
+
+    classes = np.unique(ytr)
+    lin = SGDClassifier(loss="hinge", alpha=args.alpha, random_state=SEED)
+    lin, _hist = fit_streaming(lin, Xtr, ytr, Xva, yva, classes, epochs=args.epochs,
+                               chunk=args.batch_size, seed=SEED, transform=feat.transform)
+
+    print(f"[INFO] approx: gamma={gamma:.3g}  n_components={m}  batch={args.batch_size}  epochs={args.epochs}")
+    return Pipeline([("nystroem", feat), ("sgd", lin)])
+
+def compare_exact(clf, Xtr, ytr, Xte, yte, args):
+    """train の部分標本で厳密 SVC を学習し、同じ test 部分標本上で近似モデルと比べる"""
+    rng = np.random.default_rng(SEED)
+    m_tr = min(args.compare_n, Xtr.shape[0]); m_te = min(args.compare_n, Xte.shape[0])
+    tr_idx = np.sort(rng.choice(Xtr.shape[0], size=m_tr, replace=False))
+    te_idx = np.sort(rng.choice(Xte.shape[0], size=m_te, replace=False))
+    t0 = time.perf_counter()
+    svc = make_model()
+    svc.fit(np.asarray(Xtr[tr_idx]), ytr[tr_idx])
+    t_fit = time.perf_counter() - t0
+    Xs = np.asarray(Xte[te_idx], dtype=np.float64); ys = yte[te_idx]
+    p_exact = svc.predict(Xs); p_apx = clf.predict(Xs)
+    print(f"[COMPARE] exact SVC on train subsample={m_tr} (fit {t_fit:.1f}s) / test subsample={m_te}")
+    print(f"[COMPARE] acc exact={accuracy_score(ys, p_exact):.4f}  approx={accuracy_score(ys, p_apx):.4f}"
+          f"  agreement={float((p_exact == p_apx).mean()):.4f}")
+
 def main():
     ap = argparse.ArgumentParser()
     ap.add_argument("--merged", default="dataset/npy/merged/five-50gram",
                     help="使用する merged ディレクトリ（five-50gram 等）")
-    ap.add_argument("--out", default="models/svm_50_all.joblib")
+    ap.add_argument("--out", default="", help="保存先（未指定なら exact: models/svm_50_all.joblib / approx: models/svm_<n>_all.joblib = eval の svm_<n>）")
+    ap.add_argument("--mode", choices=["exact", "approx"], default="exact",
+                    help="exact: SVC(rbf) / approx: Nystroem + 線形SVM をミニバッチ学習（N に線形）")
+    ap.add_argument("--n-components", type=int, default=1000, help="[approx] Nystroem の基底数")
+    ap.add_argument("--batch-size", type=int, default=8192, help="[approx] ミニバッチ行数")
+    ap.add_argument("--epochs", type=int, default=5, help="[approx] エポック数")
+    ap.add_argument("--alpha", type=float, default=1e-5, help="[approx] SGD の L2 正則化")
+    ap.add_argument("--compare-n", type=int, default=0,
+                    help="[approx] >0 なら train/test をこの行数に部分標本化し厳密 SVC と精度比較")
     args = ap.parse_args()
 
     base = Path(args.merged)
     meta = json.load(open(base/"meta.json"))
     n = meta["n"]; n_classes = len(meta["label_map"])
-    print(f"[INFO] base={base}  n={n}  classes={n_classes}")
+    print(f"[INFO] base={base}  n={n}  classes={n_classes}  mode={args.mode}")
 
-    Xtr, ytr = load_split(base, "train")
-    Xva, yva = load_split(base, "val")
-    Xte, yte = load_split(base, "test")
+    mmap = args.mode == "approx"
+    Xtr, ytr = load_split(base, "train", mmap)
+    Xva, yva = load_split(base, "val", mmap)
+    Xte, yte = load_split(base, "test", mmap)
     print(f"[INFO] train size = {len(Xtr)}  val = {len(Xva)}  test = {len(Xte)}")
 
-    # --- SVM (論文準拠: RBF, C=1.0, gamma='scale') ---
-    # probability=False（既定）で計算軽量化。random_stateは一応固定。
-    svm = SVC(kernel="rbf", C=1.0, gamma="scale", random_state=SEED)
-    svm.fit(Xtr, ytr)
+    t0 = time.perf_counter()
+    if args.mode == "exact":
+        svm = make_model()
+        svm.fit(Xtr, ytr)
+    else:
+        svm = train_approx(Xtr, ytr, Xva, yva, args)
+    print(f"[INFO] train time = {time.perf_counter()-t0:.1f}s")
 
+    preds = {}
     for name, X, y in [("val", Xva, yva), ("test", Xte, yte)]:
-        pred = svm.predict(X)
+        pred = predict_chunked(svm, X, args.batch_size) if mmap else svm.predict(X)
+        preds[name] = pred
         acc = accuracy_score(y, pred)
         print(f"[{name.upper()}] acc={acc:.4f}")
     print("\n[TEST] classification report:")
-    print(classification_report(yte, svm.predict(Xte), digits=4))
+    print(classification_report(yte, preds["test"], digits=4))
+
+    if args.mode == "approx" and args.compare_n > 0:
+        compare_exact(svm, Xtr, ytr, Xte, yte, args)
 
-    out = Path(args.out); out.parent.mkdir(parents=True, exist_ok=True)
+    # approx も eval_common.MODEL_FILES / train-all.py と同じ名前に書く（n=50 ならそのまま eval の svm_50）
+    default_out = "models/svm_50_all.joblib" if args.mode == "exact" else f"models/svm_{n}_all.joblib"
+    out = Path(args.out or default_out); out.parent.mkdir(parents=True, exist_ok=True)
     joblib.dump(svm, out)
     print("Saved:", out)
 
@@ -0,0 +1,339 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+capture_filter.py
+Tetragon export ストリーム（kubectl logs ds/tetragon -f の stdout、または FIFO / ファイル）を 1 パスで読み、
+  - namespace / pod 接頭辞 / container / tracepoint（subsys:event）で絞り込み
+  - {ts,pid,pod,container,sc,wl[,tid]} の compact JSONL（jq -c と同じ形）を最終ファイルへ直接書く
+  - [start, end] の時間カットもその場で行う（jq の 2 パス目と中間の *-all.jsonl が不要）
+start / end は引数で固定するか、--control ファイルに "start=<ISO>" / "end=<ISO>" を追記して後から与える。
+  - start 未確定の間に通ったイベントは --spool に退避し、start 確定時に ts>=start の分だけ出力へ移す
+  - end 確定後は ts>end を捨て、ts が end + --grace 秒を過ぎたイベントが来たら自分で終了（SIGTERM でも flush して終了）
+--npz を与えると ts_ns / sc / pid / tid の int64 列も保存（列指向の読み込み用。欠損は -1）
+--fill-missing は欠けた pid / pod / container / sc を 0 / "" / "" / 0 で埋める（web-serving の旧 jq と同じ raw 形式。既定は null）
+--segment-secs N を与えると --out（<dir>/<base>.jsonl）の代わりに、イベント時刻で N 秒ごとにローテートする
+gzip セグメント <dir>/<base>.<seq:05d>.jsonl.gz と索引 <dir>/<base>.<seq:05d>.idx.json を書く。
+  - セグメントは独立した gzip メンバ（ブロック、既定 4 MiB 非圧縮）の連結で、そのまま zcat / gzip.open で読める
+  - 索引: count / sc_all_int（全行が整数 sc か）/ ts_min / ts_max / 圧縮・非圧縮サイズと、ブロックごとの {offset, length, raw_offset, raw_length,
+    count, ts_min_ns, ts_max_ns}（時間窓の切り出しや部分読みで、必要なブロックだけ seek して展開できる）
+使い方:
+  kubectl -n kube-system logs ds/tetragon -c export-stdout -f \\
+  | python3 k8s/capture_filter.py --ns xmrig --pod-prefix xmrig- --event raw_syscalls:sys_exit --wl xmrig \\
+      --out dataset/raw/x.jsonl --spool dataset/tmp/x-all.jsonl --control dataset/tmp/x.ctl &
+  echo "start=2025-01-01T00:00:00Z" >> dataset/tmp/x.ctl   # 以降 ts>=start のみ出力
+  echo "end=2025-01-01T00:02:00Z"   >> dataset/tmp/x.ctl   # ts>end を捨て、grace 後に終了
+"""
+
+import argparse, gzip, json, os, signal, sys, time
+from array import array
+from datetime import datetime, timezone
+
+SC_ARG_KEYS = ("long_arg", "int64_arg", "size_arg", "int_arg")  # args[0] の型ごとのキー（jq の // と同じ順）
+POLL_SEC = 0.5
+SEGMENT_BLOCK_BYTES = 4 << 20
+FILL_DEFAULTS = {"pid": 0, "pod": "", "container": "", "sc": 0}  # --fill-missing（旧 web-serving の jq の // 既定値）
+_SEC_CACHE = {}
+_DEFER = 0; _PENDING = False
+
+class _Stop(Exception):
+    pass
+
+def _on_term(signum, frame):
+    global _PENDING
+    if _DEFER:
+        _PENDING = True; return
+    raise _Stop()
+
+class _NoStop:
+    """この区間に届いた SIGTERM は区間を抜けてから _Stop にする（ファイルへの書き込みと索引の更新の間で止めない）"""
+
+    def __enter__(self):
+        global _DEFER
+        _DEFER += 1
+
+    def __exit__(self, exc_type, exc, tb):
+        global _DEFER, _PENDING
+        _DEFER -= 1
+        if not _DEFER and _PENDING and exc_type is None:
+            _PENDING = False
+            raise _Stop()
+
+def iso_to_ns(ts):
+    """'YYYY-mm-ddTHH:MM:SS[.f{1,9}]Z' → UNIX ns（秒部分は変換結果をキャッシュ）。解釈できなければ None"""
+    if not isinstance(ts, str) or len(ts) < 19: return None
+    head = ts[:19]
+    sec = _SEC_CACHE.get(head)
+    if sec is None:
+        try: sec = int(datetime.strptime(head, "%Y-%m-%dT%H:%M:%S").replace(tzinfo=timezone.utc).timestamp())
+        except ValueError: return None
+        if len(_SEC_CACHE) > 4096: _SEC_CACHE.clear()
+        _SEC_CACHE[head] = sec
+    frac = ts[20:].rstrip("Z") if len(ts) > 20 and ts[19] == "." else ""
+    if frac and not frac.isdigit(): return None
+    return sec * 1_000_000_000 + (int(frac[:9].ljust(9, "0")) if frac else 0)
+
+def ns_to_iso(t):
+    sec, ns = divmod(int(t), 1_000_000_000)
+    return datetime.fromtimestamp(sec, timezone.utc).strftime("%Y-%m-%dT%H:%M:%S") + f".{ns:09d}Z"
+
+def _sc_of(pt):
+    args = pt.get("args")
+    if not isinstance(args, list) or not args or not isinstance(args[0], dict): return None
+    for k in SC_ARG_KEYS:
+        v = args[0].get(k)
+        if v is None: continue
+        try: return int(v)
+        except (TypeError, ValueError): return None
+    return None
+
+class EventFilter:
+    """export の 1 行（bytes）→ compact レコード（dict）または None"""
+
+    def __init__(self, ns=None, pod_prefix=None, container=None, event=None, wl="", with_tid=False, fill_missing=False):
+        self.ns = ns; self.pod_prefix = pod_prefix; self.container = container
+        self.subsys, _, self.event = (event or "").partition(":")
+        self.wl = wl; self.with_tid = with_tid; self.fill_missing = fill_missing
+        # json.loads 前の安価な除外（namespace 文字列すら含まない行は読まない）
+        self.needle = json.dumps(ns).encode() if ns else None
+
+    def __call__(self, line):
+        if b'"process_tracepoint"' not in line: return None
+        if self.needle is not None and self.needle not in line: return None
+        try: e = json.loads(line)
+        except ValueError: return None
+        pt = e.get("process_tracepoint")
+        if not isinstance(pt, dict): return None
+        if self.subsys and (pt.get("subsys") or pt.get("subsystem")) != self.subsys: return None
+        if self.event and pt.get("event") != self.event: return None
+        proc = pt.get("process") or {}; pod = proc.get("pod") or {}
+        if self.ns and pod.get("namespace") != self.ns: return None
+        name = pod.get("name")
+        if self.pod_prefix and not (isinstance(name, str) and name.startswith(self.pod_prefix)): return None
+        cont = (pod.get("container") or {}).get("name")
+        if self.container is not None and (cont or "") != self.container: return None
+        rec = {"ts": e.get("time") or pt.get("time"), "pid": proc.get("pid"), "pod": name, "container": cont,
+               "sc": _sc_of(pt), "wl": self.wl}
+        if self.fill_missing:
+            for k, v in FILL_DEFAULTS.items():
+                if rec[k] is None: rec[k] = v
+        if self.with_tid: rec["tid"] = proc.get("tid")
+        return rec
+
+class CutWindow:
+    """[start, end] の時間カット（ns）。None は未確定。--control ファイルの追記を拾って更新する"""
+
+    def __init__(self, start=None, end=None, control=None, truncate_sec=False):
+        self.start = start; self.end = end; self.control = control
+        self.truncate_sec = truncate_sec; self._mtime = None
+
+    def poll(self):
+        """control ファイルが更新されていれば読み直す。start が新たに確定したら True"""
+        if not self.control: return False
+        try: mt = os.stat(self.control).st_mtime_ns
+        except OSError: return False
+        if mt == self._mtime: return False
+        self._mtime = mt
+        had_start = self.start is not None
+        with open(self.control, "r", encoding="utf-8") as f:
+            for line in f:
+                k, _, v = line.strip().partition("=")
+                t = iso_to_ns(v.strip())
+                if t is None: continue
+                if k == "start": self.start = self._key(t)
+                elif k == "end": self.end = self._key(t)
+        return not had_start and self.start is not None
+
+    def _key(self, t):
+        return t - t % 1_000_000_000 if self.truncate_sec else t
+
+    def where(self, t):
+        """-1: start 前 / 0: 区間内 / 1: end 後（start 未確定なら None）"""
+        if self.start is None: return None
+        k = self._key(t)
+        if k < self.start: return -1
+        if self.end is not None and k > self.end: return 1
+        return 0
+
+class Sink:
+    """出力先（JSONL と任意の npz 列）"""
+
+    def __init__(self, out_path, npz_path, segment_secs=0, gzip_level=1):
+        self.seg = SegmentWriter(out_path, segment_secs, level=gzip_level) if out_path and segment_secs > 0 else None
+        self.f = open(out_path, "w", encoding="utf-8") if out_path and self.seg is None else None
+        self.npz_path = npz_path
+        self.cols = {k: array("q") for k in ("ts_ns", "sc", "pid", "tid")} if npz_path else None
+        self.n = 0
+
+    def write(self, rec, t, line=None):
+        if self.f is not None or self.seg is not None:
+            line = line if line is not None else _dumps(rec) + "\n"
+            if self.seg is not None: self.seg.write(line, t, isinstance(rec.get("sc"), int))
+            else: self.f.write(line)
+        if self.cols is not None:
+            c = self.cols; c["ts_ns"].append(t)
+            for k in ("sc", "pid", "tid"):
+                v = rec.get(k); c[k].append(v if isinstance(v, int) else -1)
+        self.n += 1
+
+    def close(self):
+        if self.f is not None: self.f.close()
+        if self.seg is not None: self.seg.close()
+        if self.cols is not None:
+            import numpy as np
+            np.savez(self.npz_path, **{k: np.frombuffer(v, dtype=np.int64) for k, v in self.cols.items()})
+
+class SegmentWriter:
+    """イベント時刻で segment_secs ごとにローテートする gzip セグメント + .idx.json 索引"""
+
+    def __init__(self, out_path, segment_secs, block_bytes=SEGMENT_BLOCK_BYTES, level=1):
+        root, _ = os.path.splitext(out_path)          # <dir>/<base>.jsonl → <dir>/<base>
+        self.root = root; self.span = int(segment_secs * 1e9)
+        self.block_bytes = block_bytes; self.level = level  # 取り込み側の CPU を優先して既定は level=1
+        self.seq = -1; self.f = None; self.seg_t0 = None
+
+    def _open(self, t):
+        self.seq += 1
+        self.seg_t0 = t - t % self.span
+        self.path = f"{self.root}.{self.seq:05d}.jsonl.gz"
+        self.f = open(self.path, "wb")
+        self.blocks = []; self.buf = []; self.buf_bytes = 0; self.raw_off = 0; self.sc_all_int = True
+        self.b_cnt = 0; self.b_min = self.b_max = None
+
+    def write(self, line, t, sc_ok=True):
+        if self.f is None or t >= self.seg_t0 + self.span:
+            self.close()
+            self._open(t)
+        self.sc_all_int = self.sc_all_int and sc_ok
+        data = line.encode("utf-8")
+        self.buf.append(data); self.buf_bytes += len(data); self.b_cnt += 1
+        if self.b_min is None or t < self.b_min: self.b_min = t
+        if self.b_max is None or t > self.b_max: self.b_max = t
+        if self.buf_bytes >= self.block_bytes: self._flush_block()
+
+    def _flush_block(self):
+        if not self.buf: return
+        raw = b"".join(self.buf)
+        comp = gzip.compress(raw, compresslevel=self.level, mtime=0)  # 1 ブロック = 独立した gzip メンバ
+        with _NoStop():  # 書いたブロックは必ず索引に載せて buf から外す（途中で止まると close() が同じブロックを二重に書く）
+            off = self.f.tell(); self.f.write(comp)
+            self.blocks.append({"offset": off, "length": len(comp), "raw_offset": self.raw_off, "raw_length": len(raw),
+                                "count": self.b_cnt, "ts_min_ns": self.b_min, "ts_max_ns": self.b_max})
+            self.raw_off += len(raw)
+            self.buf = []; self.buf_bytes = 0; self.b_cnt = 0; self.b_min = self.b_max = None
+
+    def close(self):
+        if self.f is None: return
+        self._flush_block()
+        size = self.f.tell(); self.f.close(); self.f = None
+        bl = self.blocks
+        ts_min = min((b["ts_min_ns"] for b in bl), default=None)
+        ts_max = max((b["ts_max_ns"] for b in bl), default=None)
+        idx = {"file": os.path.basename(self.path), "format": "jsonl.gz", "seq": self.seq,
+               "segment_start": ns_to_iso(self.seg_t0), "segment_secs": self.span / 1e9,
+               "count": sum(b["count"] for b in bl), "sc_all_int": self.sc_all_int,
+               "ts_min": ns_to_iso(ts_min) if ts_min is not None else None,
+               "ts_max": ns_to_iso(ts_max) if ts_max is not None else None,
+               "ts_min_ns": ts_min, "ts_max_ns": ts_max,
+               "bytes": size, "raw_bytes": self.raw_off, "blocks": bl}
+        idx_path = self.path[:-len(".jsonl.gz")] + ".idx.json"
+        with open(idx_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(idx, f, ensure_ascii=False, indent=1)
+        os.replace(idx_path + ".tmp", idx_path)
+
+def _dumps(rec):
+    return json.dumps(rec, ensure_ascii=False, separators=(",", ":"))
+
+def parse_args():
+    p = argparse.ArgumentParser(description="Single-pass Tetragon export filter with on-the-fly time cut")
+    p.add_argument("--input", default="-", help="export ストリーム（- は stdin。FIFO / ファイルも可）")
+    p.add_argument("--out", default="", help="出力 JSONL（空なら書かない）")
+    p.add_argument("--npz", default="", help="ts_ns / sc / pid / tid 列の .npz（任意）")
+    p.add_argument("--ns", help="process.pod.namespace と一致するもののみ")
+    p.add_argument("--pod-prefix", help="process.pod.name の接頭辞（例: xmrig-）")
+    p.add_argument("--container", help="process.pod.container.name と一致するもののみ")
+    p.add_argument("--event", help="subsys:event（例: raw_syscalls:sys_exit。未指定なら確認しない）")
+    p.add_argument("--wl", default="", help="出力レコードの wl")
+    p.add_argument("--tid", action="store_true", help="tid 列も出力")
+    p.add_argument("--drop-null-sc", action="store_true", help="sc を整数にできないイベントを捨てる")
+    p.add_argument("--fill-missing", action="store_true",
+                   help="欠けた pid / pod / container / sc を 0 / \"\" / \"\" / 0 で埋める（旧 web-serving の jq と同じ形式）")
+    p.add_argument("--segment-secs", type=float, default=0,
+                   help="> 0 で --out を <base>.<seq>.jsonl.gz + .idx.json のローテートセグメントに分割")
+    p.add_argument("--gzip-level", type=int, default=1, help="[segment] gzip 圧縮レベル")
+    p.add_argument("--start-ts", help="区間開始（ISO8601）")
+    p.add_argument("--end-ts", help="区間終了（ISO8601）")
+    p.add_argument("--control", help="start=/end= を追記して区間を後から与えるファイル")
+    p.add_argument("--spool", help="start 未確定中のイベント退避先（既定: <out>.pre）")
+    p.add_argument("--truncate-seconds", action="store_true", help="区間判定を秒単位で行う（ts / start / end を秒に切り捨て）")
+    p.add_argument("--grace", type=float, default=2.0,
+                   help="end 確定後、ts が end をこの秒数過ぎたイベントを読んだら終了（遅れて届く区間内イベントの猶予）")
+    args = p.parse_args()
+    if not args.out and not args.npz: p.error("--out か --npz のどちらかが必要です")
+    for k in ("start_ts", "end_ts"):
+        v = getattr(args, k)
+        if v is not None and iso_to_ns(v) is None: p.error(f"--{k.replace('_', '-')}: bad ISO8601 {v!r}")
+    return args
+
+def main():
+    args = parse_args()
+    signal.signal(signal.SIGTERM, _on_term)
+    flt = EventFilter(args.ns, args.pod_prefix, args.container, args.event, args.wl, args.tid, args.fill_missing)
+    cut = CutWindow(control=args.control, truncate_sec=args.truncate_seconds)
+    if args.start_ts: cut.start = cut._key(iso_to_ns(args.start_ts))
+    if args.end_ts: cut.end = cut._key(iso_to_ns(args.end_ts))
+    cut.poll()
+    if cut.start is None and not args.control: cut.start = -1  # 区間指定なし: 全件
+
+    sink = Sink(args.out, args.npz, args.segment_secs, args.gzip_level)
+    spool_path = args.spool or (args.out or args.npz) + ".pre"
+    spool = open(spool_path, "w+", encoding="utf-8") if cut.start is None else None
+    stats = {"read": 0, "matched": 0, "before_start": 0, "after_end": 0, "bad_ts": 0}
+
+    def emit(rec, t, line=None):
+        w = cut.where(t)
+        if w < 0: stats["before_start"] += 1
+        elif w > 0: stats["after_end"] += 1
+        else: sink.write(rec, t, line)
+
+    def drain_spool():
+        nonlocal spool
+        if spool is None: return
+        if cut.start is None: cut.start = -1  # start が最後まで来なかった: 退避分も全部出す
+        spool.flush(); spool.seek(0)
+        for line in spool:
+            rec = json.loads(line)
+            emit(rec, iso_to_ns(rec["ts"]), line)
+        spool.close(); spool = None
+
+    inp = sys.stdin.buffer if args.input == "-" else open(args.input, "rb")
+    grace_ns = int(args.grace * 1e9)
+    next_poll = time.monotonic() + POLL_SEC
+    try:
+        for line in inp:
+            stats["read"] += 1
+            if not stats["read"] & 1023 and time.monotonic() >= next_poll:
+                next_poll = time.monotonic() + POLL_SEC
+                if cut.poll(): drain_spool()
+                if spool is not None: spool.flush()
+            rec = flt(line)
+            if rec is None or (args.drop_null_sc and rec["sc"] is None): continue
+            stats["matched"] += 1
+            t = iso_to_ns(rec["ts"])
+            if t is None: stats["bad_ts"] += 1; continue
+            if spool is not None: spool.write(_dumps(rec) + "\n"); continue
+            emit(rec, t)
+            if cut.end is not None and t > cut.end + grace_ns: break
+    except (_Stop, KeyboardInterrupt):
+        pass
+    finally:
+        signal.signal(signal.SIGTERM, signal.SIG_IGN)  # 後始末中の 2 回目の TERM で出力を壊さない
+        cut.poll()
+        drain_spool()
+        sink.close()
+        print(f"[FILTER] read={stats['read']} matched={stats['matched']} written={sink.n} "
+              f"before_start={stats['before_start']} after_end={stats['after_end']} bad_ts={stats['bad_ts']}",
+              file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -12,7 +12,7 @@ PORT=${PORT:-11211}
 
 # Tetragon event side
 EVENT=${EVENT:-sys_enter}             # sys_enter (default) / sys_exit (switch if you add policy)
-# Note: subsys/event fields may not be present due to fieldFilters, so jq doesn't rely on them.
+# Note: subsys/event fields may not be present due to fieldFilters, so the capture filter doesn't rely on them.
 
 # Client bench params (defaults reflect your manual runs)
 S=${S:-6}         # shard/bucket size used to pick twitter_dataset_?x
@@ -38,9 +38,10 @@ META_DIR="dataset/metadata"
 LOG_DIR="logs"
 mkdir -p "$RAW_DIR" "$TMP_DIR" "$META_DIR" "$LOG_DIR"
 
-ALL="$TMP_DIR/${BASE}-all.jsonl"           # full span raw JSONL (deleted at end)
+ALL="$TMP_DIR/${BASE}-all.jsonl"           # events spooled before START_TS is known (deleted at end)
+CTL="$TMP_DIR/${BASE}.ctl"                 # start=/end= notifications for capture_filter (deleted at end)
 RAW="$RAW_DIR/${BASE}.jsonl"               # benchmark window cutout
-LOG="$LOG_DIR/${BASE}.log"                 # stderr of the collector (kubectl+jq)
+LOG="$LOG_DIR/${BASE}.log"                 # stderr of the collector (kubectl)
 CLIENT_LOG="$LOG_DIR/${BASE}-client.log"   # client run log
 META="$META_DIR/${BASE}.json"
 
@@ -56,27 +57,21 @@ if [ -z "${TETRA_CONT:-}" ]; then
 fi
 
 # ====== Start monitor stream (since now; avoid old logs) ======================
+# Single pass: filter + time cut straight into $RAW (START_TS/END_TS are passed later via $CTL)
 SINCE="$(date -u +"%Y-%m-%dT%H:%M:%SZ")"
+: > "$CTL"
 kubectl -n kube-system logs ds/tetragon -c "${TETRA_CONT}" -f --since-time="$SINCE" 2>"$LOG" \
-| jq -c '
-  select(.process_tracepoint?
-         and (.process_tracepoint.process.pod.container.name == "server")
-         and (.process_tracepoint.process.pod.name | startswith("server-")))
-  | {
-      ts: .time,
-      pid: .process_tracepoint.process.pid,
-      pod: .process_tracepoint.process.pod.name,
-      container: .process_tracepoint.process.pod.container.name,
-      sc: (try ((.process_tracepoint.args[0].long_arg
-                 // .process_tracepoint.args[0].int64_arg
-                 // .process_tracepoint.args[0].size_arg
-                 // .process_tracepoint.args[0].int_arg) | tonumber) catch null),
-      wl: "data-caching"
-    }' | tee "$ALL" &
+| python3 k8s/capture_filter.py --container server --pod-prefix server- --wl data-caching \
+    --out "$RAW" --spool "$ALL" --control "$CTL" &
 MON_PID=$!
 
 cleanup() { kill "$MON_PID" 2>/dev/null || true; wait "$MON_PID" 2>/dev/null || true; }
 trap cleanup EXIT
+# Give capture_filter a moment to see END_TS and exit on its own (avoids losing the tail of the window)
+stop_monitor() {
+  for _ in {1..25}; do kill -0 "$MON_PID" 2>/dev/null || break; sleep 0.2; done
+  cleanup
+}
 
 # ====== Quick liveness poke & wait until stream has content ===================
 SERVER=$(kubectl -n "$NS" get pod -l "$SERVER_LABEL" -o jsonpath='{.items[0].metadata.name}')
@@ -88,6 +83,7 @@ done
 
 # ====== Benchmark window: start ==============================================
 START_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
+echo "start=$START_TS" >> "$CTL"
 CLIENT=$(kubectl -n "$NS" get pod -l "$CLIENT_LABEL" -o jsonpath='{.items[0].metadata.name}')
 
 # Prepare docker_servers for memcached client
@@ -121,12 +117,9 @@ kubectl -n "$NS" exec -i "$CLIENT" -- \
 
 # ====== Benchmark window: end & stop monitor =================================
 END_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
-cleanup
-
-# ====== Cut out just the benchmark window ====================================
-# fromjson? drops incomplete lines safely
-jq -cR --arg s "$START_TS" --arg e "$END_TS" \
-  'fromjson? | select(.) | select(.ts >= $s and .ts <= $e)' "$ALL" > "$RAW"
+# The benchmark window is cut by capture_filter itself (incomplete lines are skipped there)
+echo "end=$END_TS" >> "$CTL"
+stop_monitor
 
 # ====== Metadata ==============================================================
 cat > "$META" <<EOF
@@ -160,4 +153,4 @@ echo "meta:   $META"
 echo "syscalls (events): $COUNT"
 
 # cleanup tmp
-rm -f "$ALL"
+rm -f "$ALL" "$CTL"
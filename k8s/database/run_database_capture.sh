@@ -22,32 +22,28 @@ META_DIR="dataset/metadata"
 LOG_DIR="logs"
 mkdir -p "$RAW_DIR" "$TMP_DIR" "$META_DIR" "$LOG_DIR"
 
-ALL="$TMP_DIR/${BASE}-all.jsonl"   # 監視全体（後で削除）
+ALL="$TMP_DIR/${BASE}-all.jsonl"   # START_TS 確定前のイベント退避（後で削除）
+CTL="$TMP_DIR/${BASE}.ctl"         # capture_filter への start=/end= 通知（後で削除）
 RAW="$RAW_DIR/${BASE}.jsonl"       # ベンチ区間のみ（最終成果物）
 LOG="$LOG_DIR/${BASE}.log"
 META="$META_DIR/${BASE}.json"
 
 # ===== Tetragon 監視開始 =====
+# 1 パスで絞り込み＋時間カットして $RAW に直接書く（START_TS/END_TS は $CTL で後から渡す）
 SINCE="$(date -u +"%Y-%m-%dT%H:%M:%SZ")"
+: > "$CTL"
 kubectl -n kube-system logs ds/tetragon -c export-stdout -f --since-time="$SINCE" 2>"$LOG" \
-| jq -c '
-  select(.process_tracepoint?
-         and .process_tracepoint.subsys=="raw_syscalls"
-         and .process_tracepoint.event=="sys_exit"
-         and .process_tracepoint.process.pod.namespace=="'"$NS"'"
-         and (.process_tracepoint.process.pod.name|startswith("mariadb-"))) |
-  {
-    ts: .time,
-    pid: .process_tracepoint.process.pid,
-    pod: .process_tracepoint.process.pod.name,
-    container: .process_tracepoint.process.pod.container.name,
-    sc: ((.process_tracepoint.args[0].long_arg)|tonumber),
-    wl: "database"
-  }' | tee "$ALL" &
+| python3 k8s/capture_filter.py --ns "$NS" --pod-prefix mariadb- --event raw_syscalls:sys_exit --wl database \
+    --out "$RAW" --spool "$ALL" --control "$CTL" &
 MON_PID=$!
 
 cleanup() { kill "$MON_PID" 2>/dev/null || true; wait "$MON_PID" 2>/dev/null || true; }
 trap cleanup EXIT
+# capture_filter が end を受け取り自分で閉じるのを少し待ってから止める（区間末尾の取りこぼし防止）
+stop_monitor() {
+  for _ in {1..25}; do kill -0 "$MON_PID" 2>/dev/null || break; sleep 0.2; done
+  cleanup
+}
 
 # ===== 対象Podの準備待ち =====
 SB="$(kubectl -n "$NS" get pod -l app=sysbench -o jsonpath='{.items[0].metadata.name}')"
@@ -80,6 +76,7 @@ fi
 
 # ===== ベンチ本番 =====
 START_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
+echo "start=$START_TS" >> "$CTL"
 kubectl -n "$NS" exec -it "$SB" -- \
   sysbench oltp_read_write --db-driver=mysql \
     --mysql-host=mariadb --mysql-db=bench \
@@ -88,11 +85,9 @@ kubectl -n "$NS" exec -it "$SB" -- \
     --threads="$THREADS" --time="$TIME" --report-interval=5 run
 END_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
 
-# ===== 監視停止 & 切り出し =====
-cleanup
-
-jq -c --arg s "$START_TS" --arg e "$END_TS" \
-  'select(.ts >= $s and .ts <= $e)' "$ALL" > "$RAW"
+# ===== 監視停止（切り出しは capture_filter が済ませている）=====
+echo "end=$END_TS" >> "$CTL"
+stop_monitor
 
 cat > "$META" <<EOF
 {
@@ -123,4 +118,4 @@ echo "log:  $LOG"
 echo "meta: $META"
 echo "syscalls (events): $COUNT"
 
-rm -f "$ALL"
+rm -f "$ALL" "$CTL"
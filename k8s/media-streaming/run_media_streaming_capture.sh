@@ -19,7 +19,8 @@ META_DIR="dataset/metadata"
 LOG_DIR="logs"
 mkdir -p "$RAW_DIR" "$TMP_DIR" "$META_DIR" "$LOG_DIR"
 
-ALL="$TMP_DIR/${BASE}-all.jsonl"     # 全期間の生JSONL（後で削除）
+ALL="$TMP_DIR/${BASE}-all.jsonl"     # START_TS 確定前のイベント退避（後で削除）
+CTL="$TMP_DIR/${BASE}.ctl"           # capture_filter への start=/end= 通知（後で削除）
 RAW="$RAW_DIR/${BASE}.jsonl"         # ベンチ期間のみを抽出した成果物
 LOG="$LOG_DIR/${BASE}.log"           # Tetragon 収集側のstderr
 CLIENT_LOG="$LOG_DIR/${BASE}-client.log"   # client 実行ログ
@@ -36,26 +37,21 @@ if [ -z "${TETRA_CONT:-}" ]; then
   exit 1
 fi
 
+# 1 パスで絞り込み＋時間カットして $RAW に直接書く（START_TS/END_TS は $CTL で後から渡す）
 SINCE="$(date -u +"%Y-%m-%dT%H:%M:%SZ")"
+: > "$CTL"
 kubectl -n kube-system logs ds/tetragon -c "${TETRA_CONT}" -f --since-time="$SINCE" 2>"$LOG" \
-| jq -c '
-  select(.process_tracepoint?
-         and .process_tracepoint.subsys=="raw_syscalls"
-         and .process_tracepoint.event=="sys_exit"
-         and .process_tracepoint.process.pod.namespace=="'"$NS"'"
-         and (.process_tracepoint.process.pod.name|startswith("server-"))) |
-  {
-    ts: .time,
-    pid: .process_tracepoint.process.pid,
-    pod: .process_tracepoint.process.pod.name,
-    container: .process_tracepoint.process.pod.container.name,
-    sc: ((.process_tracepoint.args[0].long_arg)|tonumber),
-    wl: "media-streaming"
-  }' | tee "$ALL" &
+| python3 k8s/capture_filter.py --ns "$NS" --pod-prefix server- --event raw_syscalls:sys_exit --wl media-streaming \
+    --out "$RAW" --spool "$ALL" --control "$CTL" &
 MON_PID=$!
 
 cleanup() { kill "$MON_PID" 2>/dev/null || true; wait "$MON_PID" 2>/dev/null || true; }
 trap cleanup EXIT
+# capture_filter が end を受け取り自分で閉じるのを少し待ってから止める（区間末尾の取りこぼし防止）
+stop_monitor() {
+  for _ in {1..25}; do kill -0 "$MON_PID" 2>/dev/null || break; sleep 0.2; done
+  cleanup
+}
 
 # 監視ストリームが流れ始めたことを軽く確認
 SERVER=$(kubectl -n "$NS" get pod -l "$SERVER_LABEL" -o jsonpath='{.items[0].metadata.name}')
@@ -66,6 +62,7 @@ for i in {1..25}; do
 done
 
 START_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
+echo "start=$START_TS" >> "$CTL"
 CLIENT=$(kubectl -n "$NS" get pod -l "$CLIENT_LABEL" -o jsonpath='{.items[0].metadata.name}')
 
 # TTYなし(-iのみ)で client を実行し、混線を避けて専用ログへ出す
@@ -74,11 +71,9 @@ kubectl -n "$NS" exec -i "$CLIENT" -- \
   >>"$CLIENT_LOG" 2>&1 || true
 
 END_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
-cleanup
-
-# fromjson? で未完行を無視して、期間で切り出し
-jq -cR --arg s "$START_TS" --arg e "$END_TS" \
-  'fromjson? | select(.) | select(.ts >= $s and .ts <= $e)' "$ALL" > "$RAW"
+# 期間の切り出しは capture_filter が済ませている（未完行も読み飛ばし済み）
+echo "end=$END_TS" >> "$CTL"
+stop_monitor
 
 cat > "$META" <<EOF
 {
@@ -109,4 +104,4 @@ echo "client: $CLIENT_LOG"
 echo "meta:   $META"
 echo "syscalls (events): $COUNT"
 
-rm -f "$ALL"
+rm -f "$ALL" "$CTL"
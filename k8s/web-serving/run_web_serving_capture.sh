@@ -20,12 +20,13 @@ META_DIR="dataset/metadata"
 LOG_DIR="logs"
 mkdir -p "$RAW_DIR" "$TMP_DIR" "$META_DIR" "$LOG_DIR"
 
-ALL="$TMP_DIR/${BASE}-all.jsonl"
+ALL="$TMP_DIR/${BASE}-all.jsonl"   # START_TS 確定前のイベント退避
+CTL="$TMP_DIR/${BASE}.ctl"         # capture_filter への start=/end= 通知
 RAW="$RAW_DIR/${BASE}.jsonl"
 LOGF="$LOG_DIR/${BASE}.log"
 METAF="$META_DIR/${BASE}.json"
 
-: > "$ALL"
+: > "$ALL"; : > "$CTL"
 
 log(){ echo "[log $(date -u +%Y-%m-%dT%H:%M:%SZ)] $*"; }
 
@@ -33,30 +34,12 @@ log(){ echo "[log $(date -u +%Y-%m-%dT%H:%M:%SZ)] $*"; }
 SINCE="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 log "start tetragon stream since=$SINCE (ns=$NS, container=$CONTAINER)"
 
+# 1 パスで絞り込み＋秒単位の時間カットをして $RAW に直接書く（START_TS/END_TS は $CTL で後から渡す）
+# --fill-missing: 欠けた pid/pod/container/sc は旧 jq と同じく 0/""/""/0（null にしない）
 setsid bash -c '
   kubectl -n kube-system logs ds/tetragon -c export-stdout -f --since-time="'"$SINCE"'" 2>"'"$LOGF"'" \
-  | jq -rc --arg wl "'"$WL"'" --arg ns "'"$NS"'" --arg cn "'"$CONTAINER"'" "
-      . as \$e
-      | select(
-          \$e.process_tracepoint
-          and ((\$e.process_tracepoint.subsys // \$e.process_tracepoint.subsystem) == \"raw_syscalls\")
-          and (\$e.process_tracepoint.event == \"sys_exit\")
-          and (\$e.process_tracepoint.process.pod.namespace == \$ns)
-          and ((\$e.process_tracepoint.process.pod.container.name // \"\") == \$cn)
-        )
-      | {
-          ts: (\$e.time),
-          pid: (\$e.process_tracepoint.process.pid // 0),
-          pod: (\$e.process_tracepoint.process.pod.name // \"\"),
-          container: (\$e.process_tracepoint.process.pod.container.name // \"\"),
-          sc: (
-            ( \$e.process_tracepoint.args
-              | if type==\"array\" and length>0 then .[0].long_arg else \"0\" end
-            ) | tonumber
-          ),
-          wl: \$wl
-        }" \
-  | tee -a "'"$ALL"'"
+  | python3 k8s/capture_filter.py --ns "'"$NS"'" --container "'"$CONTAINER"'" --event raw_syscalls:sys_exit \
+      --wl "'"$WL"'" --out "'"$RAW"'" --spool "'"$ALL"'" --control "'"$CTL"'" --truncate-seconds --fill-missing
 ' &
 MON_GRP=$!
 
@@ -71,6 +54,7 @@ trap cleanup EXIT
 # ===== フェーズ2: faban 実行 =====
 sleep 1
 START_TS="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
+echo "start=$START_TS" >> "$CTL"
 log "benchmark START_TS=$START_TS"
 
 FABAN="$(kubectl -n "$NS" get pods -l app=faban-client -o jsonpath='{.items[0].metadata.name}' 2>/dev/null || true)"
@@ -90,34 +74,27 @@ log "faban exec returned code=$RET (expect 0)"
 
 END_TS="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 log "benchmark END_TS=$END_TS"
+echo "end=$END_TS" >> "$CTL"
 
+# capture_filter が end を受け取り自分で閉じるのを少し待ってから止める（区間末尾の取りこぼし防止）
+for _ in {1..25}; do kill -0 "$MON_GRP" 2>/dev/null || break; sleep 0.2; done
 cleanup
 
-# ===== フェーズ3: 切り出しと保存 =====
+# ===== フェーズ3: 保存（切り出しは capture_filter が済ませている）=====
 ALL_LINES=$(wc -l < "$ALL" 2>/dev/null || echo 0)
-FIRST_TS=$(head -n1 "$ALL" 2>/dev/null | jq -r '.ts' || true)
-LAST_TS=$( tail -n1 "$ALL" 2>/dev/null | jq -r '.ts' || true)
-log "ALL summary: lines=$ALL_LINES first_ts=${FIRST_TS:-NA} last_ts=${LAST_TS:-NA}"
+RAW_LINES=$(wc -l < "$RAW" 2>/dev/null || echo 0)
+FIRST_TS=$(head -n1 "$RAW" 2>/dev/null | jq -r '.ts' || true)
+LAST_TS=$( tail -n1 "$RAW" 2>/dev/null | jq -r '.ts' || true)
+log "RAW summary: lines=$RAW_LINES first_ts=${FIRST_TS:-NA} last_ts=${LAST_TS:-NA} (spooled before start: $ALL_LINES)"
 
-if [ "$ALL_LINES" -eq 0 ]; then
-  log "DONE (NO EVENTS): ALL is empty."
+if [ "$RAW_LINES" -eq 0 ] && [ "$ALL_LINES" -eq 0 ]; then
+  log "DONE (NO EVENTS): RAW and ALL are empty."
   echo "ALL lines: $ALL_LINES ($ALL)"
-  echo "RAW lines: 0 (not created)"
+  echo "RAW lines: 0"
   echo "log:       $LOGF"
   exit 0
 fi
 
-jq -Rrc --arg s "$START_TS" --arg e "$END_TS" '
-  def toepoch($x):
-    ($x | sub("\\.[0-9]+Z$"; "Z") | strptime("%Y-%m-%dT%H:%M:%SZ") | mktime);
-  def safe_row:
-    (fromjson? // empty) as $j
-    | ($j.ts | sub("\\.[0-9]+Z$"; "Z") | strptime("%Y-%m-%dT%H:%M:%SZ") | mktime) as $t
-    | select($t >= toepoch($s) and $t <= toepoch($e))
-    | $j;
-  safe_row
-' "$ALL" > "$RAW"
-
 cat > "$METAF" <<EOF
 {
   "schema_version": 1,
@@ -134,15 +111,13 @@ cat > "$METAF" <<EOF
 }
 EOF
 
-RAW_LINES=$(wc -l < "$RAW" 2>/dev/null || echo 0)
-
 echo "ALL lines: $ALL_LINES ($ALL)"
 echo "RAW lines: $RAW_LINES ($RAW)"
 echo "log:       $LOGF"
 echo "meta:      $METAF"
 
 if [ "$RAW_LINES" -gt 0 ]; then
-  rm -f "$ALL"
+  rm -f "$ALL" "$CTL"
   log "DONE (RAW saved, ALL removed)"
 else
   log "DONE (RAW empty, ALL kept for debug)"
@@ -3,17 +3,34 @@
 """
 analyze_run.py
 runs/<basename>/ の {summary.json, *.jsonl} を読み、run.json を出力（窓別ハッシュレートも出力）
+  - raw は features/raw_reader.py 経由で読む（.jsonl / .jsonl.gz / ブロック索引付きセグメントを並列展開）
+  - 集計は列指向: JSONL をブロック単位で正規表現により (sc, tid) 列へ抽出し、
+    intern した tid×syscall の件数行列を 2 次元 bincount で 1 回で作る（--engine json で従来の逐次 json.loads）
+  - ts も同時に抜き、1/10/60 s（--timeline）バケットごとの syscall 数・クラス別件数（noise/worker/other）・
+    noise 比率を timeline.npz に保存（イベント→tid 行→クラスの対応を引いて bincount 1 回／幅）
+  - --runs-dir を与えると配下の全 run ディレクトリを並列に解析（既存 run.json の run_info は引き継ぐ）
 """
 
-import argparse, json, os
+import argparse, json, os, re, sys
 from glob import glob
 from collections import defaultdict, Counter
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "..", "..", "features"))
+from raw_reader import discover as discover_raw, iter_blocks as iter_raw_blocks, iter_lines as iter_raw_lines, NO_TS, ts_to_ns
 
 NAMESPACE = "xmrig-noise"
 
 def parse_args():
     p = argparse.ArgumentParser(description="Summarize a mining run into run.json")
-    p.add_argument("--run-dir", required=True)
+    g = p.add_mutually_exclusive_group(required=True)
+    g.add_argument("--run-dir")
+    g.add_argument("--runs-dir", help="配下の runs/<basename>/ をすべて並列解析")
+    p.add_argument("--jobs", type=int, default=os.cpu_count() or 1, help="--runs-dir 時の並列数")
+    p.add_argument("--engine", choices=["columnar","json"], default="columnar")
+    p.add_argument("--timeline", default="1,10,60",
+                   help="タイムラインのバケット幅[s]（カンマ区切り、空文字で無効。columnar のみ）→ timeline.npz")
     p.add_argument("--label")
     p.add_argument("--noise-enable", type=int, choices=[0,1], dest="noise_enable")
     p.add_argument("--noise-rate", type=int, dest="noise_rate")
@@ -40,10 +57,11 @@ def pick(d, dotted_paths):
     return None
 
 def find_files(run_dir):
+    """summary.json と最大の raw ソース（.jsonl / .jsonl.gz / セグメント列。features/raw_reader.RawSource）"""
     summary_path = os.path.join(run_dir, "summary.json")
-    candidates = glob(os.path.join(run_dir, "*.jsonl"))
-    raw_path = max(candidates, key=lambda p: os.path.getsize(p), default=None)
-    return summary_path, raw_path
+    candidates = discover_raw(os.path.join(run_dir, "*.jsonl"))
+    raw = max(candidates, key=lambda s: s.size(), default=None)
+    return summary_path, raw
 
 def summarize_summary(summary_path, run_dir):
     d = read_json(summary_path)
@@ -89,49 +107,196 @@ def summarize_summary(summary_path, run_dir):
         "source": os.path.relpath(summary_path, run_dir) if summary_path else None
     }
 
-def stream_counts(raw_path):
+class TidMatrix:
+    """tid × syscall の件数行列。tids は初出順、scs は昇順"""
+    def __init__(self, tids, scs, M):
+        self.tids = tids; self.scs = scs; self.M = M
+        self.totals = M.sum(axis=1) if M.size else np.zeros(len(tids), dtype=np.int64)
+        self.top3 = [[] for _ in tids]
+        self.ev_row = None  # イベントごとの tids 行番号（columnar のみ。タイムライン用）
+
+    def col(self, sc):
+        i = np.searchsorted(self.scs, sc)
+        if i < len(self.scs) and self.scs[i] == sc: return self.M[:, i]
+        return np.zeros(len(self.tids), dtype=np.int64)
+
+# jq 出力は {"ts":..,"pid":..,"pod":..,"container":..,"sc":..,"wl":..,"tid":..} の 1 行 1 レコードで、
+# ts / sc / tid は全行に 1 回ずつ現れる（tid は null あり）。高速経路は findall で列を別々に抜き、
+# 件数が揃わないブロック（キーの欠けた行が混ざる等）だけ行ごとの json.loads で取り直す。
+RE_SC = re.compile(rb'"sc":\s*"?(-?\d+)')
+RE_TID = re.compile(rb'"tid":\s*"?(\d+|null)')
+RE_TS = re.compile(rb'"ts":\s*"?([^",}\s]*)')
+
+def _parse_lines(buf, want_ts):
+    """行ごとの json.loads（フォールバック）"""
+    sc_l=[]; tid_l=[]; ts_l=[]
+    for line in buf.splitlines():
+        line = line.strip()
+        if not line: continue
+        try: rec = json.loads(line)
+        except: continue
+        tid = rec.get("tid"); sc = rec.get("sc")
+        if tid is None or sc is None: continue
+        try: sc = int(sc); tid = int(tid)
+        except: continue
+        sc_l.append(sc); tid_l.append(tid)
+        if want_ts: ts_l.append(str(rec.get("ts", "")).encode())
+    ts = ts_to_ns(ts_l) if want_ts else None
+    return np.array(sc_l, np.int64), np.array(tid_l, np.int64), ts
+
+def _parse_block(buf, want_ts=False):
+    sc_m = RE_SC.findall(buf); tid_m = RE_TID.findall(buf)
+    ts_m = RE_TS.findall(buf) if want_ts else None
+    ok = len(sc_m) == len(tid_m) == buf.count(b'"sc":') == buf.count(b'"tid":')
+    if want_ts: ok = ok and len(ts_m) == len(sc_m) == buf.count(b'"ts":')
+    if not ok: return _parse_lines(buf, want_ts)
+    if not sc_m: return np.empty(0, np.int64), np.empty(0, np.int64), (np.empty(0, np.int64) if want_ts else None)
+    tid_b = np.array(tid_m, dtype="S20"); keep = tid_b != b"null"
+    ts = ts_to_ns(np.array(ts_m, dtype="S40")[keep]) if want_ts else None
+    return np.array(sc_m, dtype="S20")[keep].astype(np.int64), tid_b[keep].astype(np.int64), ts
+
+def columnar_parse(raw, want_ts=False):
+    """raw ソースから (sc[int64], tid[int64], ts_ns[int64] or None) をファイル順で返す（sc/tid の欠けた行は除外）"""
+    empty = np.empty(0, np.int64)
+    if raw is None:
+        return empty, empty, (empty if want_ts else None)
+    parts = [_parse_block(buf, want_ts) for buf in iter_raw_blocks(raw)]
+    if not parts: return empty, empty, (empty if want_ts else None)
+    cat = lambda k: np.concatenate([p[k] for p in parts])
+    return cat(0), cat(1), (cat(2) if want_ts else None)
+
+def tid_matrix(sc, tid):
+    """intern した tid / syscall ID で 2 次元 bincount → TidMatrix（top3 も同時に計算）"""
+    if sc.size == 0: return TidMatrix([], np.empty(0, np.int64), np.zeros((0,0), np.int64))
+    utid, tfirst, tinv = np.unique(tid, return_index=True, return_inverse=True)
+    scs, sinv = np.unique(sc, return_inverse=True)
+    # tid は初出順に並べ替え（従来の dict 挿入順と一致させる）
+    rank = np.empty(len(utid), np.int64); rank[np.argsort(tfirst, kind="stable")] = np.arange(len(utid))
+    t = rank[tinv]; S = len(scs)
+    key = t * S + sinv
+    M = np.bincount(key, minlength=len(utid)*S).reshape(len(utid), S)
+    tm = TidMatrix([str(v) for v in utid[np.argsort(tfirst, kind="stable")]], scs, M)
+    tm.ev_row = t
+
+    # top3: Counter.most_common と同じく件数降順・同数は tid 内の初出順
+    ukey, kfirst = np.unique(key, return_index=True)
+    kt, ks = ukey // S, ukey % S; kn = M.ravel()[ukey]
+    order = np.lexsort((kfirst, -kn, kt))
+    kt, ks, kn = kt[order], ks[order], kn[order]
+    grp_start = np.searchsorted(kt, kt, side="left")
+    keep = (np.arange(len(kt)) - grp_start) < 3
+    for ti, si, ni in zip(kt[keep], ks[keep], kn[keep]):
+        tot = tm.totals[ti]
+        tm.top3[ti].append({"sc": int(scs[si]), "n": int(ni), "pct": round((ni/tot*100.0) if tot else 0.0, 1)})
+    return tm
+
+def counts_to_matrix(counts):
+    """従来の dict[tid]->Counter を TidMatrix に変換（--engine json 用）"""
+    tids = list(counts.keys())
+    scs = np.array(sorted({sc for c in counts.values() for sc in c}), dtype=np.int64)
+    M = np.zeros((len(tids), len(scs)), np.int64)
+    for i, t in enumerate(tids):
+        for sc, n in counts[t].items(): M[i, np.searchsorted(scs, sc)] = n
+    tm = TidMatrix(tids, scs, M)
+    for i, t in enumerate(tids):
+        tot = int(tm.totals[i])
+        tm.top3[i] = [{"sc": sc, "n": n, "pct": round((n/tot*100.0) if tot else 0.0, 1)} for sc, n in counts[t].most_common(3)]
+    return tm
+
+def stream_counts(raw):
     counts = defaultdict(Counter); events_total = 0
-    if not raw_path or not os.path.exists(raw_path): return counts, events_total
-    with open(raw_path, "r", encoding="utf-8") as f:
-        for line in f:
-            line = line.strip()
-            if not line: continue
-            try: rec = json.loads(line)
-            except: continue
-            tid = rec.get("tid"); sc = rec.get("sc")
-            if tid is None or sc is None: continue
-            tid = str(tid)
-            try: sc = int(sc)
-            except: continue
-            counts[tid][sc] += 1; events_total += 1
+    if raw is None: return counts, events_total
+    for line in iter_raw_lines([raw]):
+        try: rec = json.loads(line)
+        except: continue
+        tid = rec.get("tid"); sc = rec.get("sc")
+        if tid is None or sc is None: continue
+        tid = str(tid)
+        try: sc = int(sc)
+        except: continue
+        counts[tid][sc] += 1; events_total += 1
     return counts, events_total
 
-def build_tid_summary(counts):
-    items = []
-    for tid, ctr in counts.items():
-        total = sum(ctr.values())
-        top3 = [{"sc": sc, "n": n, "pct": round((n/total*100.0) if total else 0.0, 1)}
-                for sc, n in ctr.most_common(3)]
-        items.append((tid, total, top3))
+def build_tid_summary(tm):
+    items = [(tid, int(tm.totals[i]), tm.top3[i]) for i, tid in enumerate(tm.tids)]
     items.sort(key=lambda x:(-x[1], x[0]))
     return [{"tid": tid, "total": total, "top3": top3} for tid, total, top3 in items]
 
-def label_tids(counts, noise_thresh=0.95, balance_low=0.4, balance_high=0.6, worker_thresh=0.95):
-    noise_tids=[]; worker_tids=[]; other_tids=[]
-    for tid, ctr in counts.items():
-        total = sum(ctr.values())
-        if total==0: other_tids.append(tid); continue
-        n115, n172, n124 = ctr.get(115,0), ctr.get(172,0), ctr.get(124,0)
-        s = n115 + n172
-        noise_major = (s/total)>=noise_thresh
-        balance_ok = (s>0 and balance_low <= (n115/s) <= balance_high)
-        is_noise = noise_major and balance_ok
+def classify_tids(tm, noise_thresh=0.95, balance_low=0.4, balance_high=0.6, worker_thresh=0.95):
+    """全 tid を一括で判定: 0=other, 1=noise, 2=worker"""
+    total = tm.totals.astype(np.float64)
+    n115, n172, n124 = tm.col(115), tm.col(172), tm.col(124)
+    s = (n115 + n172).astype(np.float64)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        noise_major = (s/total) >= noise_thresh
+        bal = np.where(s > 0, n115/s, -1.0)
         is_worker = (n124/total) >= worker_thresh
-        (noise_tids if is_noise else worker_tids if is_worker else other_tids).append(tid)
-    noise_calls = sum(sum(counts[t].values()) for t in noise_tids)
-    worker_calls = sum(sum(counts[t].values()) for t in worker_tids)
-    return {"noise_tids":noise_tids, "worker_tids":worker_tids, "other_tids":other_tids,
-            "noise_calls":noise_calls, "worker_calls":worker_calls}
+    is_noise = noise_major & (s > 0) & (bal >= balance_low) & (bal <= balance_high)
+    cls = np.where(is_noise, 1, np.where(is_worker, 2, 0))
+    cls[total == 0] = 0
+    return cls
+
+def label_tids(tm, noise_thresh=0.95, balance_low=0.4, balance_high=0.6, worker_thresh=0.95):
+    cls = classify_tids(tm, noise_thresh, balance_low, balance_high, worker_thresh)
+    tids = np.array(tm.tids, dtype=object)
+    return {"noise_tids":tids[cls==1].tolist(), "worker_tids":tids[cls==2].tolist(), "other_tids":tids[cls==0].tolist(),
+            "noise_calls":int(tm.totals[cls==1].sum()), "worker_calls":int(tm.totals[cls==2].sum())}
+
+CLASS_NAMES = ("other", "noise", "worker")  # classify_tids の 0/1/2
+TIMELINE_MAX_SPAN_S = 86400  # ts の中央値からこれより離れたイベントは外れ値（数値 0 の ts 等）としてバケットに入れない
+
+def build_timeline(ts, ev_cls, widths):
+    """
+    イベント時刻 ts[ns] とクラス ev_cls(0/1/2) を幅 widths[s] のバケットに集計。
+    戻り値: timeline.npz に書く dict（t0_ns, widths, ts_outliers と w{w}_{total,noise,worker,other}[int32], w{w}_ratio[float32]）
+      ratio = noise / (noise + worker)（分母 0 のバケットは NaN）、rate は total / w で求まるので保存しない
+      中央値 ± TIMELINE_MAX_SPAN_S の外の ts は捨てる（1 件の外れ値で bincount が巨大にならないよう、バケット数の上限も兼ねる）
+    """
+    ok = ts != NO_TS
+    ts, ev_cls = ts[ok], ev_cls[ok]
+    outliers = 0
+    if ts.size:
+        med = int(np.median(ts)); span = TIMELINE_MAX_SPAN_S * 1_000_000_000
+        keep = (ts >= med - span) & (ts <= med + span)
+        outliers = int(ts.size - keep.sum())
+        ts, ev_cls = ts[keep], ev_cls[keep]
+    out = {"widths": np.asarray(widths, dtype=np.int32), "ts_outliers": np.int64(outliers)}
+    t0 = int(ts.min()) if ts.size else 0
+    out["t0_ns"] = np.int64(t0)
+    rel = ts - t0
+    for w in widths:
+        b = rel // (int(w) * 1_000_000_000)
+        nb = int(b.max()) + 1 if b.size else 0
+        per = np.bincount(b * 3 + ev_cls, minlength=nb * 3).reshape(nb, 3)
+        noise, worker = per[:, 1], per[:, 2]
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(noise + worker > 0, noise / (noise + worker), np.nan)
+        out[f"w{w}_total"] = per.sum(axis=1).astype(np.int32)
+        for k, name in enumerate(CLASS_NAMES): out[f"w{w}_{name}"] = per[:, k].astype(np.int32)
+        out[f"w{w}_ratio"] = ratio.astype(np.float32)
+    return out
+
+def timeline_summary(tl, dropped):
+    """run.json に載せる要約（バケット数とレートの分位点）"""
+    res = {"file": "timeline.npz", "t0_ns": int(tl["t0_ns"]), "events_without_ts": int(dropped),
+           "events_ts_outlier": int(tl["ts_outliers"]), "widths": {}}
+    for w in tl["widths"].tolist():
+        tot = tl[f"w{w}_total"]; ratio = tl[f"w{w}_ratio"]
+        rate = tot / float(w)
+        valid = ratio[~np.isnan(ratio)]
+        res["widths"][str(w)] = {
+            "buckets": int(tot.size),
+            "rate_hz_p50": round(float(np.percentile(rate, 50)), 1) if tot.size else None,
+            "rate_hz_max": round(float(rate.max()), 1) if tot.size else None,
+            "ratio_min": round(float(valid.min()), 4) if valid.size else None,
+            "ratio_max": round(float(valid.max()), 4) if valid.size else None,
+        }
+    return res
+
+def parse_widths(spec):
+    ws = sorted({int(x) for x in spec.split(",") if x.strip()}) if spec else []
+    if any(w <= 0 for w in ws): raise ValueError(f"--timeline widths must be > 0: {spec!r}")
+    return ws
 
 def derive_label_from_basename(basename):
     parts = basename.split("-")
@@ -141,34 +306,52 @@ def derive_label_from_basename(basename):
         return parts[2]
     return None
 
-def main():
-    args = parse_args()
-    run_dir = args.run_dir.rstrip("/")
-    summary_path, raw_path = find_files(run_dir)
+def analyze(run_dir, args, prev_info=None):
+    """1 run を解析して run.json を書く。prev_info（既存 run.json の run_info）があれば CLI 未指定項目に使う"""
+    prev_info = prev_info or {}
+    summary_path, raw = find_files(run_dir)
     basename = os.path.basename(run_dir)
 
     summary = summarize_summary(summary_path, run_dir)
-    counts, events_total = stream_counts(raw_path)
-    tid_summary = build_tid_summary(counts)
+    widths = parse_widths(args.timeline) if args.engine == "columnar" else []
+    ts = None
+    if args.engine == "json":
+        counts, events_total = stream_counts(raw)
+        tm = counts_to_matrix(counts)
+    else:
+        sc, tid, ts = columnar_parse(raw, want_ts=bool(widths))
+        tm = tid_matrix(sc, tid); events_total = int(sc.size)
+    tid_summary = build_tid_summary(tm)
 
-    lab = label_tids(counts, args.noise_thresh, args.noise_balance_low, args.noise_balance_high, args.worker_thresh)
+    lab = label_tids(tm, args.noise_thresh, args.noise_balance_low, args.noise_balance_high, args.worker_thresh)
+    timeline = None
+    if widths and ts is not None:
+        cls = classify_tids(tm, args.noise_thresh, args.noise_balance_low, args.noise_balance_high, args.worker_thresh)
+        ev_cls = cls[tm.ev_row] if tm.ev_row is not None else np.empty(0, np.int64)
+        tl = build_timeline(ts, ev_cls, widths)
+        np.savez(os.path.join(run_dir, "timeline.npz"), **tl)
+        timeline = timeline_summary(tl, int((ts == NO_TS).sum()))
     denom = (lab["noise_calls"] + lab["worker_calls"])
     noise_ratio_pct = (lab["noise_calls"]/denom*100.0) if denom>0 else 0.0
     noise_ratio_overall_pct = (lab["noise_calls"]/events_total*100.0) if events_total>0 else 0.0
 
-    label = args.label or derive_label_from_basename(basename)
+    label = args.label or prev_info.get("label") or derive_label_from_basename(basename)
+    prev_noise = prev_info.get("noise") or {}
+    first = lambda a, b: a if a is not None else b
 
     run_info = {
         "basename": basename,
         "namespace": NAMESPACE,
         "label": label,
-        "start_utc": args.start_utc,
-        "end_utc": args.end_utc,
-        "duration_sec": None,
-        "image": None,
-        "resources": None,
-        "noise": {"enable": args.noise_enable, "rate_hz": args.noise_rate, "ld_preload": args.ld_preload},
-        "http_summary_time_utc": None
+        "start_utc": first(args.start_utc, prev_info.get("start_utc")),
+        "end_utc": first(args.end_utc, prev_info.get("end_utc")),
+        "duration_sec": prev_info.get("duration_sec"),
+        "image": prev_info.get("image"),
+        "resources": prev_info.get("resources"),
+        "noise": {"enable": first(args.noise_enable, prev_noise.get("enable")),
+                  "rate_hz": first(args.noise_rate, prev_noise.get("rate_hz")),
+                  "ld_preload": first(args.ld_preload, prev_noise.get("ld_preload"))},
+        "http_summary_time_utc": prev_info.get("http_summary_time_utc")
     }
 
     run_json = {
@@ -185,18 +368,49 @@ def main():
         },
         "events_total": events_total,
         "files": {
-            "raw_jsonl": os.path.relpath(raw_path, run_dir) if raw_path else None,
+            "raw_jsonl": os.path.relpath(raw.key, run_dir) if raw else None,
             "summary_json": os.path.relpath(summary_path, run_dir) if summary_path else None,
             "run_json": "run.json"
         }
     }
+    if raw is not None and (raw.compressed or len(raw.parts) > 1):
+        run_json["files"]["raw_parts"] = [os.path.relpath(p, run_dir) for p, _idx in raw.parts]
+    if timeline is not None:
+        run_json["files"]["timeline_npz"] = timeline["file"]
+        run_json["timeline"] = timeline
 
     out_path = os.path.join(run_dir, "run.json")
     with open(out_path, "w", encoding="utf-8") as f:
         json.dump(run_json, f, ensure_ascii=False, indent=2)
+    return out_path, run_json
 
+def _print_result(out_path, run_json):
+    summary = run_json["summary"]
     print(f"[OK] wrote {out_path}")
-    print(f"  events_total={events_total} avg_Hs={summary['avg_Hs']}({summary['avg_Hs_basis']}) noise_ratio={run_json['noise_ratio']['ratio_pct']}% (overall {run_json['noise_ratio']['overall_pct']}%)")
+    print(f"  events_total={run_json['events_total']} avg_Hs={summary['avg_Hs']}({summary['avg_Hs_basis']}) noise_ratio={run_json['noise_ratio']['ratio_pct']}% (overall {run_json['noise_ratio']['overall_pct']}%)")
+
+def _analyze_existing(run_dir, args):
+    prev = read_json(os.path.join(run_dir, "run.json")).get("run_info") or {}
+    return analyze(run_dir, args, prev)
+
+def main():
+    args = parse_args()
+    if args.run_dir:
+        _print_result(*analyze(args.run_dir.rstrip("/"), args))
+        return
+
+    # --runs-dir: raw（*.jsonl / *.jsonl.gz / セグメント）を持つ run ディレクトリを並列解析
+    # （ラベル等は既存 run.json → basename の順で補完）
+    run_dirs = sorted(d for d in glob(os.path.join(args.runs_dir, "*"))
+                      if os.path.isdir(d) and discover_raw(os.path.join(d, "*.jsonl")))
+    if not run_dirs:
+        print(f"[WARN] no run dirs with raw *.jsonl[.gz] under {args.runs_dir}"); return
+    print(f"[RUN] {len(run_dirs)} runs  jobs={args.jobs}  engine={args.engine}")
+    with ProcessPoolExecutor(max_workers=max(1, args.jobs)) as ex:
+        futs = {d: ex.submit(_analyze_existing, d, args) for d in run_dirs}
+        for d, fut in futs.items():
+            try: _print_result(*fut.result())
+            except Exception as e: print(f"[ERR] {d}: {type(e).__name__}: {e}")
 
 if __name__ == "__main__":
     main()
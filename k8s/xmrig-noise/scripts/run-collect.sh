@@ -1,5 +1,6 @@
 #!/usr/bin/env bash
-# run_all_raw.sh — マニフェスト適用 + Job 実行 + Tetragon→jq 収集（raw.jsonl）を一括で実行
+# run_all_raw.sh — マニフェスト適用 + Job 実行 + Tetragon→capture_filter 収集（raw.jsonl）を一括で実行
+#   SEGMENT_SECS（--segment_secs）> 0 なら raw.jsonl の代わりに N 秒ごとの gzip セグメント + 索引で保存
 
 set -euo pipefail
 
@@ -16,6 +17,7 @@ NOISE_ENABLE="${NOISE_ENABLE:-1}"
 NOISE_RATE_HZ="${NOISE_RATE_HZ:-1000}"
 LDPRELOAD_FLAG="${LDPRELOAD_FLAG:-1}"
 IMAGE="${IMAGE:-xmrig-noise:latest}"
+SEGMENT_SECS="${SEGMENT_SECS:-0}"          # 0: 単一 JSONL / >0: <basename>.<seq>.jsonl.gz + .idx.json
 
 # 引数パース
 while [[ $# -gt 0 ]]; do
@@ -26,9 +28,10 @@ while [[ $# -gt 0 ]]; do
     --noise_rate=*)   NOISE_RATE_HZ="${1#*=}";;
     --ldpreload=*)    LDPRELOAD_FLAG="${1#*=}";;
     --image=*)        IMAGE="${1#*=}";;
+    --segment_secs=*) SEGMENT_SECS="${1#*=}";;
     -h|--help)
       cat <<USAGE
-Usage: $0 --duration=SEC [--label=STR] [--noise_enable=0|1] [--noise_rate=INT] [--ldpreload=0|1] [--image=NAME:TAG]
+Usage: $0 --duration=SEC [--label=STR] [--noise_enable=0|1] [--noise_rate=INT] [--ldpreload=0|1] [--image=NAME:TAG] [--segment_secs=SEC]
 USAGE
       exit 0;;
     *) echo "Unknown arg: $1" >&2; exit 1;;
@@ -53,7 +56,11 @@ START_ISO="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 echo "[RUN] start_utc=${START_ISO}"
 echo "[RUN] ns=${NS} image=${IMAGE} duration=${DURATION}s label=${LABEL}"
 echo "[RUN] NOISE_ENABLE=${NOISE_ENABLE} NOISE_RATE_HZ=${NOISE_RATE_HZ} LDPRELOAD_FLAG=${LDPRELOAD_FLAG}"
-echo "[RUN] output: ${OUTFILE}"
+if [[ "${SEGMENT_SECS}" != "0" ]]; then
+  echo "[RUN] output: ${OUTDIR}/${BASENAME}.<seq>.jsonl.gz (+ .idx.json, ${SEGMENT_SECS}s/segment)"
+else
+  echo "[RUN] output: ${OUTFILE}"
+fi
 
 # LD_PRELOAD の差し込み
 if [[ "${LDPRELOAD_FLAG}" == "1" ]]; then
@@ -182,38 +189,28 @@ until kubectl -n "${NS}" logs "${POD}" >/dev/null 2>&1; do
 done
 echo "[RUN] pod=${POD} logs=ready"
 
-# 3) jq フィルタ（旧式と完全一致・改行崩れ修正済み）
-TMP_JQ="$(mktemp)"
-cat > "$TMP_JQ" <<'JQ'
-select(.process_tracepoint? and .process_tracepoint.process.pod.namespace=="__NS__") |
-{
-  ts: (.time // .process_tracepoint.time // .ts),
-  pid: (.process_tracepoint.process.pid // .process.pid),
-  pod: (.process_tracepoint.process.pod.name // .pod // ""),
-  container: (.process_tracepoint.process.container.name // .container // ""),
-  sc: ((.process_tracepoint.args[0].long_arg // .process_tracepoint.args[0].int_arg // .sc // .nr // .syscall // .id) | tonumber?),
-  wl: "__NS__",
-  tid: (.process_tracepoint.process.tid // .process.tid)
-}
-| select(.sc != null)
-JQ
-sed -i "s/__NS__/${NS}/g" "$TMP_JQ"
+# 3) 収集フィルタ（NS で絞り込み、tid 付き、sc を整数化できない行は捨てる）
+FILTER_ARGS=(--ns "${NS}" --wl "${NS}" --tid --drop-null-sc --out "${OUTFILE}")
+if [[ "${SEGMENT_SECS}" != "0" ]]; then
+  FILTER_ARGS+=(--segment-secs "${SEGMENT_SECS}")
+else
+  touch "${OUTFILE}"
+fi
 
 # 4) 収集開始（独立PG）
-touch "${OUTFILE}"
 echo "[RAW] start: ${OUTFILE}"
 setsid bash -lc "
   stdbuf -oL -eL kubectl -n ${TETRA_NS} logs ds/tetragon -c ${TETRA_CONTAINER} -f \
-  | jq -c -f '${TMP_JQ}' > '${OUTFILE}'
+  | python3 k8s/capture_filter.py ${FILTER_ARGS[*]@Q}
 " &
 MON_LEADER=$!
 MON_PGID="$(ps -o pgid= "${MON_LEADER}" | tr -d ' ')"
 
 cleanup() {
+  # TERM で capture_filter は書きかけのブロックと最後のセグメント索引を書き出して終了する
   kill -TERM "-${MON_PGID}" 2>/dev/null || true
   sleep 1
   kill -KILL "-${MON_PGID}" 2>/dev/null || true
-  rm -f "$TMP_JQ" 2>/dev/null || true
 }
 trap cleanup EXIT
 
@@ -248,6 +245,9 @@ done
 END_ISO="$(date -u +%Y-%m-%dT%H:%M:%SZ)"
 echo "[RUN] end_utc=${END_ISO}"
 
+# 7) 監視停止（最後のセグメントを確定させてから解析する。trap でも止まるが明示的に）
+cleanup
+
 # python script
 if ! python3 k8s/xmrig-noise/scripts/analyze_run.py \
       --run-dir "${OUTDIR}" \
@@ -260,13 +260,21 @@ if ! python3 k8s/xmrig-noise/scripts/analyze_run.py \
   echo "[WARN] analyze_run.py failed; run.json not created"
 fi
 
-# 7) 監視停止（trap でも止まるが明示的に）
-cleanup
-
 # 8) 最少サマリ（標準出力）＋ メトリクス出力
-LINES=$(wc -l < "${OUTFILE}" | tr -d ' ')
-BYTES=$(stat -c %s "${OUTFILE}" 2>/dev/null || echo 0)
-echo "[RAW] done: lines=${LINES} bytes=${BYTES} file=${OUTFILE}"
+if [[ "${SEGMENT_SECS}" != "0" ]]; then
+  SEG_IDX=( "${OUTDIR}/${BASENAME}".*.idx.json )
+  if [[ -e "${SEG_IDX[0]}" ]]; then
+    LINES=$(jq -s 'map(.count) | add' "${SEG_IDX[@]}")
+    BYTES=$(jq -s 'map(.bytes) | add' "${SEG_IDX[@]}")
+  else
+    SEG_IDX=(); LINES=0; BYTES=0
+  fi
+  echo "[RAW] done: lines=${LINES} bytes=${BYTES} segments=${#SEG_IDX[@]} dir=${OUTDIR}"
+else
+  LINES=$(wc -l < "${OUTFILE}" | tr -d ' ')
+  BYTES=$(stat -c %s "${OUTFILE}" 2>/dev/null || echo 0)
+  echo "[RAW] done: lines=${LINES} bytes=${BYTES} file=${OUTFILE}"
+fi
 
 if [[ -f "${OUTDIR}/run.json" ]]; then
   AVG=$(jq -r '.summary.avg_Hs' "${OUTDIR}/run.json")
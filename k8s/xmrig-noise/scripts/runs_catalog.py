@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+runs_catalog.py
+runs/**/run.json を SQLite（既定: <RUNS_DIR>/.catalog.sqlite）に索引化し、glob / label で引けるようにする。
+  - update: run.json と run ディレクトリの mtime/size が変わったものだけ読み直す（消えた run は削除）
+  - query : basename の glob（--like）や label で絞り込み、tsv / json で出力
+  - files テーブルに run ディレクトリ内の全ファイル（*.jsonl 等）の size / mtime 指紋を保持
+  - キーは RUNS_DIR からの相対パス（rel_dir）。basename が同じ run が別のサブディレクトリにあっても上書きしない
+使い方:
+  python3 runs_catalog.py [--runs-dir runs] update
+  python3 runs_catalog.py [--runs-dir runs] query [--like 'xmrig-noise-15m-*pct*'] [--label 15m-30pct] [--format summary|tsv|json]
+Python から:
+  from runs_catalog import open_catalog, update, query
+"""
+
+import argparse, json, os, sqlite3, sys
+from glob import glob
+
+DB_NAME = ".catalog.sqlite"
+SCHEMA_VERSION = 2  # 1: basename がキー（同名 run が衝突）/ 2: rel_dir がキー
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+  rel_dir       TEXT PRIMARY KEY,
+  basename      TEXT NOT NULL,
+  run_dir       TEXT NOT NULL,
+  label         TEXT,
+  noise_enable  INTEGER,
+  rate_hz       INTEGER,
+  ld_preload    INTEGER,
+  start_utc     TEXT,
+  end_utc       TEXT,
+  s10           REAL,
+  s60           REAL,
+  s15m          REAL,
+  highest       REAL,
+  avg_hs        REAL,
+  avg_hs_basis  TEXT,
+  noise_calls   INTEGER,
+  worker_calls  INTEGER,
+  ratio_pct     REAL,
+  overall_pct   REAL,
+  events_total  INTEGER,
+  raw_jsonl     TEXT,
+  run_json_mtime_ns INTEGER,
+  run_json_size     INTEGER,
+  dir_mtime_ns      INTEGER,
+  run_json      TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_basename ON runs(basename);
+CREATE INDEX IF NOT EXISTS runs_label ON runs(label);
+CREATE INDEX IF NOT EXISTS runs_rate ON runs(rate_hz);
+CREATE TABLE IF NOT EXISTS files (
+  rel_dir   TEXT NOT NULL,
+  name      TEXT NOT NULL,
+  size      INTEGER,
+  mtime_ns  INTEGER,
+  PRIMARY KEY (rel_dir, name)
+);
+"""
+
+COLUMNS = ["rel_dir", "basename", "run_dir", "label", "noise_enable", "rate_hz", "ld_preload", "start_utc", "end_utc",
+           "s10", "s60", "s15m", "highest", "avg_hs", "avg_hs_basis", "noise_calls", "worker_calls",
+           "ratio_pct", "overall_pct", "events_total", "raw_jsonl",
+           "run_json_mtime_ns", "run_json_size", "dir_mtime_ns", "run_json"]
+
+def open_catalog(runs_dir="runs", db_path=None):
+    conn = sqlite3.connect(db_path or os.path.join(runs_dir, DB_NAME))
+    conn.row_factory = sqlite3.Row
+    if conn.execute("PRAGMA user_version").fetchone()[0] != SCHEMA_VERSION:
+        # 索引はキャッシュなので、形式が変わったら作り直す（次の update で全 run を読み直す）
+        conn.executescript("DROP TABLE IF EXISTS runs; DROP TABLE IF EXISTS files;")
+        conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+    conn.executescript(SCHEMA)
+    return conn
+
+def _num(v):
+    return v if isinstance(v, (int, float)) and not isinstance(v, bool) else None
+
+def _row_from_run_json(d, rel_dir, run_dir, st, dst):
+    ri = d.get("run_info") or {}; sm = d.get("summary") or {}; hr = sm.get("hashrate") or {}
+    nz = ri.get("noise") or {}; nr = d.get("noise_ratio") or {}; files = d.get("files") or {}
+    return {
+        "rel_dir": rel_dir, "basename": ri.get("basename") or os.path.basename(run_dir), "run_dir": run_dir,
+        "label": ri.get("label"), "noise_enable": _num(nz.get("enable")), "rate_hz": _num(nz.get("rate_hz")),
+        "ld_preload": _num(nz.get("ld_preload")), "start_utc": ri.get("start_utc"), "end_utc": ri.get("end_utc"),
+        "s10": _num(hr.get("s10")), "s60": _num(hr.get("s60")), "s15m": _num(hr.get("s15m")),
+        "highest": _num(hr.get("highest")), "avg_hs": _num(sm.get("avg_Hs")), "avg_hs_basis": sm.get("avg_Hs_basis"),
+        "noise_calls": _num(nr.get("noise_calls")), "worker_calls": _num(nr.get("worker_calls")),
+        "ratio_pct": _num(nr.get("ratio_pct")), "overall_pct": _num(nr.get("overall_pct")),
+        "events_total": _num(d.get("events_total")), "raw_jsonl": files.get("raw_jsonl"),
+        "run_json_mtime_ns": st.st_mtime_ns, "run_json_size": st.st_size, "dir_mtime_ns": dst.st_mtime_ns,
+        "run_json": json.dumps(d, ensure_ascii=False),
+    }
+
+def update(conn, runs_dir="runs"):
+    """変更のあった run だけ取り込む。戻り値: (added_or_updated, unchanged, removed)"""
+    known = {r["rel_dir"]: (r["run_json_mtime_ns"], r["run_json_size"], r["dir_mtime_ns"])
+             for r in conn.execute("SELECT rel_dir, run_json_mtime_ns, run_json_size, dir_mtime_ns FROM runs")}
+    seen = set(); changed = 0; same = 0
+    for path in sorted(glob(os.path.join(runs_dir, "**", "run.json"), recursive=True)):
+        run_dir = os.path.dirname(path)
+        try: st = os.stat(path); dst = os.stat(run_dir)
+        except OSError: continue
+        rel_dir = os.path.relpath(run_dir, runs_dir)
+        seen.add(rel_dir)
+        prev = known.get(rel_dir)
+        if prev == (st.st_mtime_ns, st.st_size, dst.st_mtime_ns):
+            same += 1; continue
+        try:
+            with open(path, "r", encoding="utf-8") as f: d = json.load(f)
+        except Exception as e:
+            print(f"[WARN] skip {path}: {type(e).__name__}: {e}", file=sys.stderr); continue
+        row = _row_from_run_json(d, rel_dir, run_dir, st, dst)
+        conn.execute(f"INSERT OR REPLACE INTO runs ({','.join(COLUMNS)}) VALUES ({','.join('?'*len(COLUMNS))})",
+                     [row[c] for c in COLUMNS])
+        conn.execute("DELETE FROM files WHERE rel_dir=?", (rel_dir,))
+        with os.scandir(run_dir) as it:
+            conn.executemany("INSERT OR REPLACE INTO files (rel_dir, name, size, mtime_ns) VALUES (?,?,?,?)",
+                             [(rel_dir, e.name, e.stat().st_size, e.stat().st_mtime_ns)
+                              for e in it if e.is_file()])
+        changed += 1
+    removed = [d for d in known if d not in seen]
+    for d in removed:
+        conn.execute("DELETE FROM runs WHERE rel_dir=?", (d,))
+        conn.execute("DELETE FROM files WHERE rel_dir=?", (d,))
+    conn.commit()
+    return changed, same, len(removed)
+
+def query(conn, like=None, label=None):
+    """basename の glob（SQLite GLOB = シェルのグロブと同等）/ label で絞り込んだ行を dict で返す"""
+    sql = "SELECT * FROM runs WHERE 1=1"; params = []
+    if like: sql += " AND basename GLOB ?"; params.append(like)
+    if label: sql += " AND label = ?"; params.append(label)
+    sql += " ORDER BY rel_dir"
+    return [dict(r) for r in conn.execute(sql, params)]
+
+def files_of(conn, rel_dir):
+    return [dict(r) for r in conn.execute("SELECT name, size, mtime_ns FROM files WHERE rel_dir=? ORDER BY name", (rel_dir,))]
+
+def _fmt(v):
+    if v is None: return ""
+    if isinstance(v, float) and v.is_integer(): return str(int(v))
+    return str(v)
+
+def main():
+    p = argparse.ArgumentParser(description="Indexed catalog of runs/**/run.json")
+    p.add_argument("--runs-dir", default="runs")
+    p.add_argument("--db", help=f"SQLite パス（既定: <runs-dir>/{DB_NAME}）")
+    sub = p.add_subparsers(dest="cmd", required=True)
+    sub.add_parser("update")
+    q = sub.add_parser("query")
+    q.add_argument("--like", help="basename に対するグロブ（例: 'xmrig-noise-15m-*pct*'）")
+    q.add_argument("--label")
+    q.add_argument("--format", choices=["tsv", "json", "summary"], default="summary",
+                   help="summary: runs-summary.sh 互換の 4 列 / tsv: 全列 / json: run 行 + files")
+    q.add_argument("--no-update", action="store_true", help="問い合わせ前の差分取り込みを省略")
+    args = p.parse_args()
+
+    if not os.path.isdir(args.runs_dir):
+        print(f"[ERR] runs dir not found: {args.runs_dir}", file=sys.stderr); return 1
+    conn = open_catalog(args.runs_dir, args.db)
+    if args.cmd == "update":
+        changed, same, removed = update(conn, args.runs_dir)
+        print(f"[CATALOG] updated={changed} unchanged={same} removed={removed}")
+        return 0
+
+    if not args.no_update: update(conn, args.runs_dir)
+    rows = query(conn, args.like, args.label)
+    if args.format == "json":
+        for r in rows: r["files"] = files_of(conn, r["rel_dir"]); r.pop("run_json", None)
+        json.dump(rows, sys.stdout, ensure_ascii=False, indent=2); print()
+    elif args.format == "tsv":
+        cols = [c for c in COLUMNS if c != "run_json"]
+        print("\t".join(cols))
+        for r in rows: print("\t".join(_fmt(r[c]) for c in cols))
+    else:
+        print("BASENAME\tRATE_HZ\tS15M_HS\tRATIO_%")
+        for r in rows:
+            s15m = next((v for v in (r["s15m"], r["s60"], r["avg_hs"]) if v is not None), "")
+            print("\t".join([_fmt(r["basename"]), _fmt(r["rate_hz"]), _fmt(s15m), _fmt(r["ratio_pct"])]))
+    # 1 を返すのは run.json が 1 つも無いときだけ（--like / --label に合う run が無いだけならヘッダのみで 0。旧 runs-summary.sh と同じ）
+    return 0 if rows or conn.execute("SELECT 1 FROM runs LIMIT 1").fetchone() else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -20,7 +20,8 @@ META_DIR="dataset/metadata"
 LOG_DIR="logs"
 mkdir -p "$RAW_DIR" "$TMP_DIR" "$META_DIR" "$LOG_DIR"
 
-ALL="$TMP_DIR/${BASE}-all.jsonl"     # 監視全体（後で削除）
+ALL="$TMP_DIR/${BASE}-all.jsonl"     # START_TS 確定前のイベント退避（後で削除）
+CTL="$TMP_DIR/${BASE}.ctl"           # capture_filter への start=/end= 通知（後で削除）
 RAW="$RAW_DIR/${BASE}.jsonl"         # 切り出し後（成果物）
 LOG="$LOG_DIR/${BASE}.log"           # Tetragon 側ログ（stderr）
 APPLOG="$LOG_DIR/${BASE}-xmrig.log"  # XMRig のアプリログ
@@ -32,22 +33,12 @@ kubectl get ns "$NS" >/dev/null 2>&1 || kubectl create ns "$NS" >/dev/null
 kubectl -n "$NS" get configmap xmrig-config >/dev/null
 
 # ===== Tetragon 監視開始 =====
+# 1 パスで絞り込み＋時間カットして $RAW に直接書く（START_TS/END_TS は $CTL で後から渡す）
 SINCE="$(date -u +"%Y-%m-%dT%H:%M:%SZ")"
+: > "$CTL"
 kubectl -n kube-system logs ds/tetragon -c export-stdout -f --since-time="$SINCE" 2>"$LOG" \
-| jq -c '
-  select(.process_tracepoint?
-         and .process_tracepoint.subsys=="raw_syscalls"
-         and .process_tracepoint.event=="sys_exit"
-         and .process_tracepoint.process.pod.namespace=="'"$NS"'"
-         and (.process_tracepoint.process.pod.name|startswith("xmrig-"))) |
-  {
-    ts: .time,
-    pid: .process_tracepoint.process.pid,
-    pod: .process_tracepoint.process.pod.name,
-    container: .process_tracepoint.process.pod.container.name,
-    sc: ((.process_tracepoint.args[0].long_arg)|tonumber),
-    wl: "xmrig"
-  }' | tee "$ALL" &
+| python3 k8s/capture_filter.py --ns "$NS" --pod-prefix xmrig- --event raw_syscalls:sys_exit --wl xmrig \
+    --out "$RAW" --spool "$ALL" --control "$CTL" &
 MON_PID=$!
 
 cleanup() {
@@ -55,6 +46,11 @@ cleanup() {
   kill "$APP_PID" 2>/dev/null || true; wait "$APP_PID" 2>/dev/null || true
 }
 trap cleanup EXIT
+# capture_filter が end を受け取り自分で閉じるのを少し待ってから止める（区間末尾の取りこぼし防止）
+stop_monitor() {
+  for _ in {1..25}; do kill -0 "$MON_PID" 2>/dev/null || break; sleep 0.2; done
+  cleanup
+}
 
 # ===== XMRig を起動（デプロイ適用 or リスタート）=====
 if kubectl -n "$NS" get deploy/xmrig >/dev/null 2>&1; then
@@ -88,18 +84,17 @@ if [ -z "${START_TS:-}" ]; then
     START_TS="$SINCE"
   fi
 fi
+echo "start=$START_TS" >> "$CTL"
 
 # ===== 観測時間だけ待つ =====
 sleep "$CAPTURE_SECS"
 END_TS="$(date -u +%Y-%m-%dT%H:%M:%S.%NZ)"
 
-# ===== 停止＆切り出し =====
-cleanup
+# ===== 停止（切り出しは capture_filter が済ませている）=====
+echo "end=$END_TS" >> "$CTL"
+stop_monitor
 trap - EXIT
 
-jq -c --arg s "$START_TS" --arg e "$END_TS" \
-  'select(.ts >= $s and .ts <= $e)' "$ALL" > "$RAW"
-
 cat > "$META" <<EOF
 {
   "schema_version": 1,
@@ -126,4 +121,4 @@ echo "applog: $APPLOG"
 echo "meta:   $META"
 echo "syscalls (events): $COUNT"
 
-rm -f "$ALL"
+rm -f "$ALL" "$CTL"